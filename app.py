@@ -7,6 +7,8 @@ from routes.event_routes import event_bp
 from routes.actuator_routes import actuator_bp
 from routes.app_state_routes import app_state_bp
 from routes.statistics_routes import statistics_bp
+from routes.metrics_routes import metrics_bp
+from routes.stream_routes import stream_bp
 # La siguiente línea causa error porque ya no existe routes.msad_routes
 # from routes.msad_routes import msad_bp
 from mqtt_client import connect_mqtt, cleanup as mqtt_cleanup
@@ -18,7 +20,8 @@ from database import create_tables
 # Integración con MSAD
 from msad import (
     init_msad, shutdown_msad, 
-    create_system_blueprint, create_backup_blueprint, create_report_blueprint
+    create_system_blueprint, create_backup_blueprint, create_report_blueprint,
+    create_retention_blueprint
 )
 
 # Configuracion de la carpeta donde esta la app Angular
@@ -49,16 +52,20 @@ app.register_blueprint(event_bp, url_prefix='/api')
 app.register_blueprint(actuator_bp, url_prefix='/api')
 app.register_blueprint(app_state_bp, url_prefix='/api')
 app.register_blueprint(statistics_bp, url_prefix='/api')
+app.register_blueprint(metrics_bp, url_prefix='/api')
+app.register_blueprint(stream_bp, url_prefix='/api')
 # app.register_blueprint(msad_bp, url_prefix='/api')  # Comentamos esta línea porque ya no existe msad_bp
 
 # Registramos los blueprints de MSAD de forma modular
 system_bp = create_system_blueprint()
 backup_bp = create_backup_blueprint()
 report_bp = create_report_blueprint()
+retention_bp = create_retention_blueprint()
 
 app.register_blueprint(system_bp, url_prefix='/api')
 app.register_blueprint(backup_bp, url_prefix='/api')
 app.register_blueprint(report_bp, url_prefix='/api')
+app.register_blueprint(retention_bp, url_prefix='/api')
 
 # Inicializar MSAD (Microservicio de Almacenamiento Distribuido)
 msad_status = init_msad(auto_backup=True, backup_interval_hours=24)
@@ -0,0 +1,109 @@
+"""
+Benchmark de get_sht3x_statistics sobre una ventana de lecturas SHT3x.
+
+Compara la ruta anterior (filas aiosqlite.Row completas, lista de tuplas, np.array y moda
+con collections.Counter) con la ruta actual: agregados SQL con columnas cargadas con
+np.fromiter en un unico buffer, o acumuladores en streaming con mediana y moda de los
+histogramas diarios (ventanas del dashboard).
+
+Uso (desde la raiz del proyecto):
+    python benchmarks/bench_statistics.py [filas] [dias]
+"""
+import os
+import sys
+import time
+import asyncio
+import sqlite3
+import tempfile
+import random
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import database
+from models import db_pool
+from models.partitions import insert_readings_sync, get_partitions, build_union_query
+from models.rollups import apply_rollups_sync
+from models.sketches import apply_sketches_sync
+from models.statistics import get_sht3x_statistics
+from models.stream_stats import streaming_stats
+from models.timestamps import now_ms
+
+CLIENT_ID = 'bench'
+INSERT_CHUNK = 100000
+
+def populate(db_path, rows, days):
+    conn = sqlite3.connect(db_path)
+    end = now_ms()
+    span = days * 24 * 60 * 60 * 1000
+    step = span / rows
+    for offset in range(0, rows, INSERT_CHUNK):
+        chunk = [
+            (CLIENT_ID, int(end - span + (offset + i) * step), round(random.gauss(24, 3), 2), round(random.gauss(75, 8), 2))
+            for i in range(min(INSERT_CHUNK, rows - offset))
+        ]
+        insert_readings_sync(conn, chunk)
+        apply_rollups_sync(conn, chunk)
+        apply_sketches_sync(conn, chunk)
+        conn.commit()
+    conn.close()
+
+# Ruta anterior, reproducida tal cual para la comparacion
+async def legacy_statistics(client_id, days):
+    end_ms = now_ms()
+    start_ms = end_ms - days * 24 * 60 * 60 * 1000
+    async with db_pool.db_connection() as conn:
+        partitions = await get_partitions(conn, start_ms, end_ms)
+        query, params = build_union_query(
+            partitions, "temperature, humidity",
+            "client_id = ? AND timestamp BETWEEN ? AND ?",
+            (client_id, start_ms, end_ms)
+        )
+        async with conn.execute(query, params) as cursor:
+            result = await cursor.fetchall()
+    data = np.array([(row['temperature'], row['humidity']) for row in result])
+    def calculate_stats(values):
+        return {
+            "count": len(values),
+            "mean": float(np.mean(values)),
+            "median": float(np.median(values)),
+            "mode": float(Counter(values).most_common(1)[0][0]),
+            "min": float(np.min(values)),
+            "max": float(np.max(values)),
+            "std_dev": float(np.std(values))
+        }
+    return {"temperature": calculate_stats(data[:, 0]), "humidity": calculate_stats(data[:, 1])}
+
+async def timed(label, coro_factory, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await coro_factory()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<45} {best * 1000:10.1f} ms  (count={result['temperature']['count']})")
+    return best
+
+async def run(days):
+    legacy = await timed("Anterior (Row + lista + Counter)", lambda: legacy_statistics(CLIENT_ID, days))
+    rollups = await timed("Actual, agregados SQL + np.fromiter", lambda: get_sht3x_statistics(CLIENT_ID, days))
+    await streaming_stats.warm_start()
+    streamed = await timed("Actual, acumuladores + histogramas diarios", lambda: get_sht3x_statistics(CLIENT_ID, days))
+    print(f"\nMejora: x{legacy / rollups:.1f} con agregados, x{legacy / streamed:.1f} con acumuladores")
+    await db_pool.close_pool()
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        database.DB_PATH = db_path
+        database.create_tables()
+        print(f"Insertando {rows} lecturas en {days} dias...")
+        populate(db_path, rows, days)
+        db_pool.configure_pool(db_path=db_path)
+        asyncio.run(run(days))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+import re
+import threading
+import time
+import uuid
+from mqtt_outbox import mqtt_outbox
+from models.actuator_controller import as_bool
+
+# Confirmacion de comandos de actuadores (opcional por nodo).
+# Un nodo anuncia que confirma comandos al registrarse ("nombre,descripcion,ack" en
+# clients/{id}/register); el anuncio se guarda en clients.ack_support. A esos nodos cada comando a clients/{id}/<actuador> les llega con
+# un identificador de correlacion ("true,<id>") y responden en clients/{id}/ack/<actuador>
+# con "<id>" (opcionalmente seguido de ",<estado aplicado>"). Si la confirmacion no llega en
+# ACK_TIMEOUT segundos el comando se reenvia con el mismo identificador hasta
+# ACK_MAX_RETRIES veces. La latencia comando -> confirmacion se acumula en un histograma por
+# cliente. El resto de nodos recibe solo el estado ("true"), sin seguimiento ni reenvios.
+# Si el nodo aplica otro estado o el comando se da por fallido se avisa a los listeners
+# (add_failure_listener) para corregir el estado guardado, que se escribe de forma optimista.
+ACK_ENABLED = True  # False = no usar confirmaciones aunque el nodo las anuncie
+ACK_TIMEOUT = 10.0  # Segundos esperando la confirmacion antes de reenviar
+ACK_MAX_RETRIES = 3  # Reenvios antes de dar el comando por fallido
+SWEEP_INTERVAL = 1.0  # Segundos entre revisiones de comandos vencidos
+
+ACTUATOR_TOPICS = ('light', 'fan', 'humidifier', 'motor')
+_command_topic_pattern = re.compile(r'clients/([^/]+)/(' + '|'.join(ACTUATOR_TOPICS) + r')$')
+# Limites superiores (ms) de las clases del histograma de latencia; la ultima recoge el resto
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class _Command:
+    __slots__ = ('correlation_id', 'topic', 'state', 'previous', 'sent_at', 'last_sent_at', 'attempts')
+
+    def __init__(self, correlation_id, topic, state, previous=None):
+        self.correlation_id = correlation_id
+        self.topic = topic
+        self.state = state
+        self.previous = previous  # Estado antes del comando ('true'/'false'), None si se desconoce
+        self.sent_at = time.monotonic()
+        self.last_sent_at = self.sent_at
+        self.attempts = 1
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, latency_ms):
+        index = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if latency_ms <= bound), len(LATENCY_BUCKETS_MS))
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ms += latency_ms
+        self.max_ms = max(self.max_ms, latency_ms)
+
+    def to_dict(self):
+        return {
+            "buckets_ms": list(LATENCY_BUCKETS_MS) + ["inf"],
+            "counts": list(self.counts),
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 1) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 1)
+        }
+
+class CommandTracker:
+    def __init__(self):
+        self._pending = {}  # (client_id, actuador) -> _Command
+        self._histograms = {}
+        self._ack_clients = set()  # Clientes que anunciaron soporte de confirmacion
+        self._failure_listeners = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {'sent': 0, 'tracked': 0, 'acked': 0, 'mismatched': 0, 'retried': 0, 'failed': 0,
+                       'superseded': 0, 'stale_acks': 0}
+
+    # Arrancar el hilo de revision. Los comandos con identificador que la bandeja de salida
+    # recupero del reinicio anterior se vuelven a seguir (sin estado previo conocido).
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._adopt_outbox()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='command-acks', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def _adopt_outbox(self):
+        with self._lock:
+            for topic, payload in mqtt_outbox.pending_messages():
+                match = _command_topic_pattern.match(topic)
+                if not match or ',' not in payload or match.groups() in self._pending:
+                    continue
+                state, correlation_id = payload.split(',', 1)
+                self._pending[match.groups()] = _Command(correlation_id, topic, state)
+
+    # Cargar los clientes que confirman comandos (guardados en clients.ack_support)
+    def load_ack_clients(self, client_ids):
+        with self._lock:
+            self._ack_clients.update(client_ids)
+
+    # Registrar si un nodo confirma comandos (lo anuncia en cada registro)
+    def set_ack_support(self, client_id, enabled):
+        with self._lock:
+            if enabled:
+                self._ack_clients.add(client_id)
+            else:
+                self._ack_clients.discard(client_id)
+                for key in [key for key in self._pending if key[0] == client_id]:
+                    del self._pending[key]
+
+    def supports_ack(self, client_id):
+        with self._lock:
+            return ACK_ENABLED and client_id in self._ack_clients
+
+    # callback(client_id, actuador, estado enviado, estado aplicado o None si no hubo
+    # confirmacion, estado previo o None si se desconoce). Se llama desde el hilo de MQTT o
+    # el de revision, fuera del lock.
+    def add_failure_listener(self, callback):
+        if callback not in self._failure_listeners:
+            self._failure_listeners.append(callback)
+
+    def _notify_failure(self, client_id, actuator, command, applied):
+        for callback in self._failure_listeners:
+            try:
+                callback(client_id, actuator, command.state, applied, command.previous)
+            except Exception as e:
+                print(f"Error en listener de comandos fallidos: {e}")
+
+    @staticmethod
+    def _payload(command):
+        return f'{command.state},{command.correlation_id}'
+
+    # Enviar un comando de actuador a traves de la bandeja de salida. previous es el estado
+    # guardado antes del comando, que se restaura si el nodo no lo confirma. Devuelve el
+    # identificador de correlacion, o None si el nodo no confirma comandos. Un comando
+    # nuevo para el mismo actuador sustituye al que esperaba confirmacion.
+    def send(self, client_id, actuator, state, previous=None):
+        topic = f'clients/{client_id}/{actuator}'
+        state = str(state).lower()
+        with self._lock:
+            self._stats['sent'] += 1
+            tracked = ACK_ENABLED and client_id in self._ack_clients
+            if tracked:
+                command = _Command(uuid.uuid4().hex[:12], topic, state, previous)
+                if (client_id, actuator) in self._pending:
+                    self._stats['superseded'] += 1
+                self._pending[(client_id, actuator)] = command
+                self._stats['tracked'] += 1
+            else:
+                self._pending.pop((client_id, actuator), None)
+        if not tracked:
+            mqtt_outbox.enqueue(topic, state)
+            return None
+        mqtt_outbox.enqueue(topic, self._payload(command))
+        return command.correlation_id
+
+    # Procesar un mensaje de clients/{id}/ack/<actuador>
+    def on_ack(self, client_id, actuator, payload):
+        fields = payload.split(',')
+        correlation_id = fields[0].strip()
+        applied = ('true' if as_bool(fields[1]) else 'false') if len(fields) > 1 and fields[1].strip() else None
+        with self._lock:
+            command = self._pending.get((client_id, actuator))
+            if command is None or command.correlation_id != correlation_id:
+                self._stats['stale_acks'] += 1
+                return False
+            del self._pending[(client_id, actuator)]
+            latency_ms = (time.monotonic() - command.sent_at) * 1000
+            histogram = self._histograms.get(client_id)
+            if histogram is None:
+                histogram = self._histograms[client_id] = _Histogram()
+            histogram.add(latency_ms)
+            self._stats['acked'] += 1
+            mismatch = applied is not None and applied != command.state
+            if mismatch:
+                self._stats['mismatched'] += 1
+        if mismatch:
+            print(f"El nodo aplico '{applied}' en lugar de '{command.state}' - Topico: {command.topic}")
+            self._notify_failure(client_id, actuator, command, applied)
+        return True
+
+    # Reenviar los comandos sin confirmar y descartar los que agotaron los reintentos
+    def _run(self):
+        while not self._stop.wait(SWEEP_INTERVAL):
+            if not mqtt_outbox.connected:
+                continue  # Sin broker los comandos esperan en la bandeja de salida
+            now = time.monotonic()
+            resend = []
+            failed = []
+            with self._lock:
+                for key, command in list(self._pending.items()):
+                    if now - command.last_sent_at < ACK_TIMEOUT:
+                        continue
+                    if command.attempts > ACK_MAX_RETRIES:
+                        del self._pending[key]
+                        self._stats['failed'] += 1
+                        failed.append((key, command))
+                        continue
+                    command.attempts += 1
+                    command.last_sent_at = now
+                    self._stats['retried'] += 1
+                    resend.append(command)
+            for command in resend:
+                mqtt_outbox.enqueue(command.topic, self._payload(command))
+            for (client_id, actuator), command in failed:
+                print(f"Comando sin confirmar tras {ACK_MAX_RETRIES} reintentos - Topico: {command.topic}")
+                self._notify_failure(client_id, actuator, command, None)
+
+    def forget(self, client_id):
+        with self._lock:
+            for key in [key for key in self._pending if key[0] == client_id]:
+                del self._pending[key]
+            self._histograms.pop(client_id, None)
+            self._ack_clients.discard(client_id)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return dict(
+                self._stats,
+                enabled=ACK_ENABLED,
+                ack_clients=sorted(self._ack_clients),
+                pending=[
+                    {
+                        "client_id": client_id,
+                        "actuator": actuator,
+                        "correlation_id": command.correlation_id,
+                        "state": command.state,
+                        "attempts": command.attempts,
+                        "age_seconds": round(now - command.sent_at, 3)
+                    }
+                    for (client_id, actuator), command in self._pending.items()
+                ],
+                latency={client_id: histogram.to_dict() for client_id, histogram in self._histograms.items()}
+            )
+
+# Instancia global usada por el cliente MQTT
+command_tracker = CommandTracker()
+
+def get_command_stats():
+    return command_tracker.stats()
@@ -1,46 +1,107 @@
 # -*- coding: utf-8 -*-
 import sqlite3
+from db_config import DB_PATH, apply_storage_profile, get_database_pragmas
+from models.timestamps import to_epoch_ms, now_ms
+from models.partitions import (
+    CREATE_REGISTRY_SQL, COMPAT_VIEW, ensure_partition_sync, insert_readings_sync
+)
+from models.rollups import ROLLUP_TABLES, create_rollup_tables_sync, rebuild_rollups_sync
+from models.sketches import SKETCH_TABLE, create_sketch_table_sync, rebuild_sketches_sync
+from models.anomalies import CREATE_ANOMALIES_SQL, ANOMALIES_INDEX_SQL
+from models.compliance import COMPLIANCE_TABLE, create_compliance_table_sync, rebuild_compliance_sync
+from mqtt_outbox import CREATE_OUTBOX_SQL
 
-# Funcion para crear las tablas en la base de datos
-def create_tables():
-    conn = sqlite3.connect('/home/stevpi/Desktop/raspServer/sensor_data.db')
-    c = conn.cursor()
+# Tabla temporal con las lecturas anteriores al particionado mensual
+LEGACY_SENSOR_TABLE = 'legacy_sht3x_data'
 
-    # Crear tabla para datos de sensore SHT3x
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS sht3x_data (
+# Filas copiadas por transaccion durante las migraciones
+MIGRATION_CHUNK_SIZE = 5000
+
+# Tablas cuyas marcas de tiempo se guardan como INTEGER (milisegundos desde epoch)
+EPOCH_MS_TABLES = {
+    'sht3x_data': '''
+        CREATE TABLE IF NOT EXISTS {name} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             client_id TEXT NOT NULL,
-            timestamp TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
             temperature REAL NOT NULL,
             humidity REAL NOT NULL
         )
-    ''')
-    print("Tabla sht3x_data creada o ya existe.")
-
-    # Crear tabla para eventos
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS events (
+    ''',
+    'events': '''
+        CREATE TABLE IF NOT EXISTS {name} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             client_id TEXT NOT NULL,
             message TEXT NOT NULL,
-            timestamp TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
             topic TEXT NOT NULL
         )
-    ''')
-    print("Tabla events creada o ya existe.")
-
-    # Crear tabla para actuadores
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS actuators (
+    ''',
+    'actuators': '''
+        CREATE TABLE IF NOT EXISTS {name} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             client_id TEXT NOT NULL,
             name TEXT NOT NULL,
             state BOOLEAN NOT NULL,
-            timestamp TEXT NOT NULL
+            timestamp INTEGER NOT NULL
         )
-    ''')
-    print("Tabla actuators creada o ya existe.")
+    '''
+}
+
+# Funcion para crear las tablas en la base de datos
+def create_tables():
+    conn = sqlite3.connect(DB_PATH)
+    
+    # Aplicar el perfil de almacenamiento (WAL y PRAGMAs de conexion)
+    for statement in get_database_pragmas():
+        mode = conn.execute(statement).fetchone()
+        print(f"{statement} -> {mode[0] if mode else ''}")
+    apply_storage_profile(conn)
+
+    # En una base existente auto_vacuum solo cambia tras un VACUUM completo, que puede tardar
+    # mucho en la tarjeta SD: no se hace al arrancar, solo se avisa
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        print("Aviso: auto_vacuum no es INCREMENTAL; la retencion no devolvera espacio al sistema. "
+              "Ejecute POST /api/msad/retention/enable-incremental-vacuum en una ventana de mantenimiento.")
+    
+    c = conn.cursor()
+
+    # Migrar marcas de tiempo TEXT a INTEGER (milisegundos) en bases existentes
+    migrate_timestamps_to_epoch_ms(conn)
+
+    # Crear tablas para eventos y actuadores
+    for table in ('events', 'actuators'):
+        c.execute(EPOCH_MS_TABLES[table].format(name=table))
+        print(f"Tabla {table} creada o ya existe.")
+
+    # Datos de sensores SHT3x: particiones mensuales + vista sht3x_data
+    c.execute(CREATE_REGISTRY_SQL)
+    migrate_sensor_data_to_partitions(conn)
+    ensure_partition_sync(conn, now_ms())
+    conn.commit()
+    print("Particiones de sht3x_data creadas o ya existen.")
+
+    # Agregados de 1 minuto y 1 hora; si no existian se calculan desde el historico
+    rollup_names = [name for name, _ in ROLLUP_TABLES.values()]
+    existing = c.execute(
+        f"SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ({', '.join('?' * len(rollup_names))})",
+        rollup_names
+    ).fetchone()[0]
+    create_rollup_tables_sync(conn)
+    conn.commit()
+    if existing < len(rollup_names):
+        rebuild_rollups_sync(conn)
+    print("Tablas de agregados sht3x_rollup_1m y sht3x_rollup_1h creadas o ya existen.")
+
+    # Histogramas diarios para percentiles; si no existian se calculan desde el historico
+    sketches_exist = c.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = ?", (SKETCH_TABLE,)
+    ).fetchone()[0]
+    create_sketch_table_sync(conn)
+    conn.commit()
+    if not sketches_exist:
+        rebuild_sketches_sync(conn)
+    print(f"Tabla de histogramas {SKETCH_TABLE} creada o ya existe.")
 
     # Crear tabla para parametros ideales
     c.execute('''
@@ -87,6 +148,10 @@ def create_tables():
     if 'manually_disabled' not in columns:
         c.execute("ALTER TABLE clients ADD COLUMN manually_disabled INTEGER DEFAULT 0")
         print("Columna manually_disabled anadida a la tabla clients")
+    # Nodos que confirman los comandos de actuadores (lo anuncian al registrarse, ver command_acks.py)
+    if 'ack_support' not in columns:
+        c.execute("ALTER TABLE clients ADD COLUMN ack_support INTEGER DEFAULT 0")
+        print("Columna ack_support anadida a la tabla clients")
 
     # Verificaciones e inserciones en una sola transaccion
     # Insertar cliente predeterminado si no existe
@@ -120,32 +185,32 @@ def create_tables():
     if c.fetchone()[0] == 0:
         c.execute('''
             INSERT INTO actuators (client_id, name, state, timestamp)
-            VALUES ('mushroom1', 'Iluminacion', 0, datetime('now'))
-        ''')
+            VALUES ('mushroom1', 'Iluminacion', 0, ?)
+        ''', (now_ms(),))
         print("Actuador 'Iluminacion' insertado.")
 
     c.execute('SELECT COUNT(*) FROM actuators WHERE name = "Ventilacion" AND client_id = "mushroom1"')
     if c.fetchone()[0] == 0:
         c.execute('''
             INSERT INTO actuators (client_id, name, state, timestamp)
-            VALUES ('mushroom1', 'Ventilacion', 0, datetime('now'))
-        ''')
+            VALUES ('mushroom1', 'Ventilacion', 0, ?)
+        ''', (now_ms(),))
         print("Actuador 'Ventilacion' insertado.")
 
     c.execute('SELECT COUNT(*) FROM actuators WHERE name = "Humidificador" AND client_id = "mushroom1"')
     if c.fetchone()[0] == 0:
         c.execute('''
             INSERT INTO actuators (client_id, name, state, timestamp)
-            VALUES ('mushroom1', 'Humidificador', 0, datetime('now'))
-        ''')
+            VALUES ('mushroom1', 'Humidificador', 0, ?)
+        ''', (now_ms(),))
         print("Actuador 'Humidificador' insertado.")
 
     c.execute('SELECT COUNT(*) FROM actuators WHERE name = "Motor" AND client_id = "mushroom1"')
     if c.fetchone()[0] == 0:
         c.execute('''
             INSERT INTO actuators (client_id, name, state, timestamp)
-            VALUES ('mushroom1', 'Motor', 0, datetime('now'))
-        ''')
+            VALUES ('mushroom1', 'Motor', 0, ?)
+        ''', (now_ms(),))
         print("Actuador 'Motor' insertado.")
 
     # Insertar estado inicial de la aplicacion si no existe para el cliente mushroom1
@@ -157,9 +222,40 @@ def create_tables():
         ''')
         print("Estado inicial de la aplicacion insertado.")
 
+    # Politicas de retencion por cliente y tabla (las aplica MSAD, ver msad/core/retention.py)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS retention_policies (
+            client_id TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            retention_days INTEGER,
+            PRIMARY KEY (client_id, table_name)
+        )
+    ''')
+    print("Tabla retention_policies creada o ya existe.")
+
+    # Lecturas marcadas como anomalas por el detector de picos (ver models/anomalies.py)
+    c.execute(CREATE_ANOMALIES_SQL)
+    c.execute(ANOMALIES_INDEX_SQL)
+    print("Tabla sensor_anomalies creada o ya existe.")
+
+    # Bandeja de salida de comandos MQTT pendientes de entrega (ver mqtt_outbox.py)
+    c.execute(CREATE_OUTBOX_SQL)
+    print("Tabla mqtt_outbox creada o ya existe.")
+
+    # Contadores horarios de cumplimiento; si no existian se calculan desde el historico
+    # con los parametros ideales actuales
+    compliance_exists = c.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = ?", (COMPLIANCE_TABLE,)
+    ).fetchone()[0]
+    create_compliance_table_sync(conn)
+    conn.commit()
+    if not compliance_exists:
+        rebuild_compliance_sync(conn)
+    print(f"Tabla de cumplimiento {COMPLIANCE_TABLE} creada o ya existe.")
+
     # Crear indices para mejorar el rendimiento de consultas frecuentes
-    c.execute('CREATE INDEX IF NOT EXISTS idx_sht3x_client_timestamp ON sht3x_data(client_id, timestamp)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_events_client_timestamp ON events(client_id, timestamp)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_events_client_topic_timestamp ON events(client_id, topic, timestamp)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_actuators_client_name ON actuators(client_id, name)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_ideal_params_client_type ON ideal_params(client_id, param_type)')
     
@@ -170,6 +266,91 @@ def create_tables():
     conn.close()
     print("Base de datos creada, tablas inicializadas y optimizadas.")
 
+# Migrar las columnas timestamp TEXT (ISO con 'T' o con espacio) a INTEGER en milisegundos.
+# Cada tabla se copia por bloques de MIGRATION_CHUNK_SIZE filas a una tabla nueva y luego
+# se intercambia; si la migracion se interrumpe, continua desde el ultimo id copiado.
+def migrate_timestamps_to_epoch_ms(conn):
+    for table, schema in EPOCH_MS_TABLES.items():
+        columns = {column[1]: column[2].upper() for column in conn.execute(f"PRAGMA table_info({table})")}
+        if columns.get('timestamp') != 'TEXT':
+            continue
+
+        new_table = f"{table}_epoch_ms"
+        names = list(columns.keys())
+        column_list = ', '.join(names)
+        placeholders = ', '.join('?' for _ in names)
+        ts_index = names.index('timestamp')
+
+        conn.execute(schema.format(name=new_table))
+        last_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {new_table}").fetchone()[0]
+        total = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE id > ?", (last_id,)).fetchone()[0]
+        print(f"Migrando {total} filas de {table} a marcas de tiempo en milisegundos...")
+
+        copied = 0
+        while True:
+            rows = conn.execute(
+                f"SELECT {column_list} FROM {table} WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, MIGRATION_CHUNK_SIZE)
+            ).fetchall()
+            if not rows:
+                break
+            converted = []
+            for row in rows:
+                row = list(row)
+                try:
+                    row[ts_index] = to_epoch_ms(row[ts_index])
+                except ValueError:
+                    print(f"Marca de tiempo invalida en {table} id={row[0]}: {row[ts_index]!r}, se usa 0")
+                    row[ts_index] = 0
+                converted.append(row)
+            conn.executemany(f"INSERT INTO {new_table} ({column_list}) VALUES ({placeholders})", converted)
+            conn.commit()
+            last_id = rows[-1][0]
+            copied += len(rows)
+            print(f"  {table}: {copied}/{total} filas migradas")
+
+        # Intercambiar tablas en una sola transaccion (los indices se recrean despues)
+        conn.execute("BEGIN")
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+        conn.commit()
+        print(f"Tabla {table} migrada a marcas de tiempo INTEGER.")
+
+# Mover las lecturas de la tabla unica sht3x_data a particiones mensuales.
+# La tabla se renombra a legacy_sht3x_data y cada bloque se inserta en su particion y se
+# borra del origen en la misma transaccion, por lo que una migracion interrumpida
+# continua donde quedo. Al terminar, sht3x_data pasa a ser la vista de compatibilidad.
+def migrate_sensor_data_to_partitions(conn):
+    kind = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (COMPAT_VIEW,)).fetchone()
+    if kind and kind[0] == 'table':
+        conn.execute(f"ALTER TABLE {COMPAT_VIEW} RENAME TO {LEGACY_SENSOR_TABLE}")
+        conn.commit()
+
+    legacy = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                          (LEGACY_SENSOR_TABLE,)).fetchone()
+    if not legacy:
+        return
+
+    total = conn.execute(f"SELECT COUNT(*) FROM {LEGACY_SENSOR_TABLE}").fetchone()[0]
+    print(f"Moviendo {total} lecturas de {COMPAT_VIEW} a particiones mensuales...")
+    moved = 0
+    while True:
+        rows = conn.execute(
+            f"SELECT id, client_id, timestamp, temperature, humidity FROM {LEGACY_SENSOR_TABLE} ORDER BY id LIMIT ?",
+            (MIGRATION_CHUNK_SIZE,)
+        ).fetchall()
+        if not rows:
+            break
+        insert_readings_sync(conn, [row[1:] for row in rows])
+        conn.execute(f"DELETE FROM {LEGACY_SENSOR_TABLE} WHERE id <= ?", (rows[-1][0],))
+        conn.commit()
+        moved += len(rows)
+        print(f"  {COMPAT_VIEW}: {moved}/{total} lecturas movidas")
+
+    conn.execute(f"DROP TABLE {LEGACY_SENSOR_TABLE}")
+    conn.commit()
+    print(f"Tabla {COMPAT_VIEW} sustituida por particiones mensuales.")
+
 # Ejecutar la funcion para crear las tablas si el archivo se ejecuta directamente
 if __name__ == '__main__':
     create_tables()
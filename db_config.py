@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Configuracion compartida de almacenamiento SQLite.
+# La usan el pool aiosqlite (models/db_pool.py), la creacion de tablas (database.py)
+# y las consultas sincronas de MSAD (msad/core/system.py).
+
+# Ruta de la base de datos principal
+DB_PATH = '/home/stevpi/Desktop/raspServer/sensor_data.db'
+
+# Perfil de almacenamiento aplicado al iniciar y en cada conexion.
+# Con WAL los lectores (reportes, backups, API) no bloquean al escritor de la ingesta
+# y synchronous=NORMAL evita un fsync por commit, que es seguro en modo WAL.
+STORAGE_PROFILE = {
+    'journal_mode': 'WAL',
+    'auto_vacuum': 'INCREMENTAL',  # Permite devolver espacio libre con PRAGMA incremental_vacuum
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # Milisegundos esperando un bloqueo antes de fallar
+    'mmap_size': 64 * 1024 * 1024,  # Bytes mapeados en memoria para lecturas
+    'cache_size': -8000,  # Negativo = KiB de cache de paginas por conexion
+    'temp_store': 'MEMORY',
+    'wal_autocheckpoint': 1000  # Paginas del WAL antes de un checkpoint automatico
+}
+
+# Checkpoint periodico del WAL (programado por MSAD)
+CHECKPOINT_INTERVAL_MINUTES = 15
+CHECKPOINT_MODE = 'PASSIVE'  # PASSIVE no bloquea a lectores ni escritores; TRUNCATE reduce el archivo -wal
+
+# journal_mode y auto_vacuum son persistentes en el archivo; el resto se aplica en cada conexion
+_DATABASE_PRAGMAS = ('journal_mode', 'auto_vacuum')
+
+# Obtener las sentencias PRAGMA a ejecutar en cada conexion nueva
+def get_connection_pragmas(profile=None):
+    profile = profile or STORAGE_PROFILE
+    return [f"PRAGMA {name} = {value}" for name, value in profile.items()
+            if name not in _DATABASE_PRAGMAS]
+
+# Obtener las sentencias PRAGMA que se aplican una vez sobre el archivo
+def get_database_pragmas(profile=None):
+    profile = profile or STORAGE_PROFILE
+    return [f"PRAGMA {name} = {profile[name]}" for name in _DATABASE_PRAGMAS if name in profile]
+
+# Aplicar el perfil a una conexion sqlite3 sincrona
+def apply_storage_profile(conn, profile=None):
+    for statement in get_connection_pragmas(profile):
+        conn.execute(statement)
+    return conn
@@ -0,0 +1,251 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+from models.sensor_data import batch_insert_sht3x_data
+from models.timestamps import now_ms
+
+# Configuracion de la ingesta de lecturas SHT3x
+QUEUE_MAX_SIZE = 1000  # Lecturas maximas en espera de escritura
+BATCH_SIZE = 50  # Commit agrupado al alcanzar este numero de lecturas...
+FLUSH_INTERVAL = 1.0  # ...o cuando la lectura mas antigua lleva este tiempo (segundos) en espera
+WRITE_RETRIES = 3  # Reintentos de escritura de un lote antes de descartarlo
+WRITE_RETRY_DELAY = 0.5  # Segundos entre reintentos
+
+# Politicas cuando la cola esta llena:
+#   drop_oldest: descartar la lectura mas antigua en cola (por defecto)
+#   drop_newest: descartar la lectura entrante
+#   block: bloquear al productor (hilo MQTT) hasta BLOCK_TIMEOUT segundos
+DROP_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+DROP_POLICY = 'drop_oldest'
+BLOCK_TIMEOUT = 5
+
+_STOP = object()
+
+# Ingesta de lecturas con una unica tarea escritora.
+# on_message (hilo de paho) encola lecturas en una asyncio.Queue acotada que vive en el
+# bucle de eventos del cliente MQTT; una sola tarea la vacia con commits agrupados por
+# tamano y por tiempo, por lo que ninguna lectura queda esperando a que llegue otra.
+class SensorIngestor:
+    def __init__(self, max_size=QUEUE_MAX_SIZE, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, policy=DROP_POLICY):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Politica de descarte no valida: {policy}")
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self._loop = None
+        self._queue = None
+        self._task = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._stats = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'failed': 0,
+            'batches': 0,
+            'last_batch_size': 0,
+            'last_flush_latency': 0.0,
+            'max_flush_latency': 0.0,
+            'avg_flush_latency': 0.0,
+            'last_commit_duration': 0.0,
+            'last_flush_at': None
+        }
+
+    # Iniciar la tarea escritora en el bucle indicado (idempotente)
+    def start(self, loop):
+        with self._lock:
+            if self._task is not None and not self._task.done():
+                return
+            self._loop = loop
+        ready = threading.Event()
+
+        def _create():
+            self._queue = asyncio.Queue(maxsize=self.max_size)
+            self._task = loop.create_task(self._run())
+            ready.set()
+
+        if self._in_loop_thread():
+            _create()
+        else:
+            loop.call_soon_threadsafe(_create)
+            ready.wait(timeout=5)
+        print(f"Ingesta SHT3x iniciada (cola={self.max_size}, lote={self.batch_size}, "
+              f"intervalo={self.flush_interval}s, politica={self.policy})")
+
+    def _in_loop_thread(self):
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    # Registrar una funcion callback(rows) que se llama tras cada commit con las filas
+    # (client_id, timestamp, temperature, humidity) escritas. Se ejecuta en el bucle de la
+    # ingesta, asi que debe ser rapida y no bloquear.
+    def add_commit_listener(self, callback):
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def is_running(self):
+        return self._task is not None and not self._task.done()
+
+    # Incrementar un contador con el lock: submit corre en el hilo de paho y _enqueue,
+    # _put_blocking y _flush en el del bucle
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    # Encolar una lectura desde cualquier hilo. Devuelve False si la lectura se descarto de inmediato.
+    def submit(self, client_id, temperature, humidity, timestamp=None):
+        if not self.is_running() or not self._loop.is_running():
+            self._count('dropped')
+            print("Ingesta SHT3x detenida, lectura descartada")
+            return False
+
+        item = (client_id, timestamp or now_ms(), temperature, humidity, time.monotonic())
+
+        if self._in_loop_thread():
+            return self._enqueue(item)
+
+        if self.policy == 'block':
+            future = asyncio.run_coroutine_threadsafe(self._put_blocking(item), self._loop)
+            try:
+                return future.result(timeout=BLOCK_TIMEOUT)
+            except Exception:
+                future.cancel()
+                self._count('dropped')
+                print("Cola de ingesta llena, lectura descartada tras esperar")
+                return False
+
+        self._loop.call_soon_threadsafe(self._enqueue, item)
+        return True
+
+    async def _put_blocking(self, item):
+        await self._queue.put(item)
+        self._count('enqueued')
+        return True
+
+    # Se ejecuta siempre en el hilo del bucle
+    def _enqueue(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self._count('dropped')
+            if self.policy == 'drop_newest':
+                return False
+            # drop_oldest (y block cuando el productor esta en el propio bucle)
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+            except asyncio.QueueEmpty:
+                pass
+            self._queue.put_nowait(item)
+        self._count('enqueued')
+        return True
+
+    # Tarea escritora: agrupa lecturas por tamano o tiempo y las escribe en un solo commit
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = item[4] + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+            # Ceder el bucle al resto de corrutinas entre lotes
+            await asyncio.sleep(0)
+
+    async def _flush(self, batch):
+        rows = [item[:4] for item in batch]
+        for attempt in range(WRITE_RETRIES):
+            started = time.monotonic()
+            try:
+                await batch_insert_sht3x_data(rows)
+                break
+            except Exception as e:
+                if attempt < WRITE_RETRIES - 1:
+                    print(f"Error escribiendo lote de {len(rows)} lecturas, reintentando: {e}")
+                    await asyncio.sleep(WRITE_RETRY_DELAY)
+                else:
+                    self._count('failed', len(rows))
+                    print(f"Lote de {len(rows)} lecturas descartado tras {WRITE_RETRIES} intentos: {e}")
+                    return
+
+        finished = time.monotonic()
+        latency = finished - batch[0][4]  # Desde que se encolo la lectura mas antigua
+        with self._lock:
+            self._record_flush(len(rows), finished - started, latency)
+
+        for listener in self._listeners:
+            try:
+                listener(rows)
+            except Exception as e:
+                print(f"Error en listener de la ingesta {getattr(listener, '__qualname__', listener)}: {e}")
+
+    # Se llama con self._lock tomado
+    def _record_flush(self, size, commit_duration, latency):
+        stats = self._stats
+        stats['written'] += size
+        stats['batches'] += 1
+        stats['last_batch_size'] = size
+        stats['last_commit_duration'] = commit_duration
+        stats['last_flush_latency'] = latency
+        stats['max_flush_latency'] = max(stats['max_flush_latency'], latency)
+        # Media movil exponencial para suavizar picos
+        stats['avg_flush_latency'] = latency if stats['batches'] == 1 else 0.9 * stats['avg_flush_latency'] + 0.1 * latency
+        stats['last_flush_at'] = datetime.now().isoformat()
+
+    # Detener la tarea escritora escribiendo todo lo pendiente
+    async def stop(self, timeout=10):
+        if not self.is_running():
+            return
+        await self._queue.put(_STOP)
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            print("Tiempo agotado esperando a la ingesta SHT3x, cancelando")
+            self._task.cancel()
+
+    # Detener desde otro hilo (por ejemplo, al salir de la aplicacion)
+    def stop_threadsafe(self, timeout=10):
+        if not self.is_running() or not self._loop.is_running():
+            return
+        future = asyncio.run_coroutine_threadsafe(self.stop(timeout), self._loop)
+        try:
+            future.result(timeout=timeout + 1)
+        except Exception as e:
+            print(f"Error deteniendo la ingesta SHT3x: {e}")
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot.update({
+            'running': self.is_running(),
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'queue_max_size': self.max_size,
+            'batch_size': self.batch_size,
+            'flush_interval': self.flush_interval,
+            'policy': self.policy
+        })
+        return snapshot
+
+# Instancia global usada por el cliente MQTT
+sensor_ingestor = SensorIngestor()
+
+def get_ingest_stats():
+    return sensor_ingestor.stats()
@@ -1,43 +1,72 @@
 import aiosqlite
-from datetime import datetime
-from .sensor_data import get_db_connection
+from .timestamps import now_ms
+from .db_pool import db_connection
+from .live_stream import live_broker
+from .actuator_controller import actuator_controller
+from .event import insert_event, publish_event
 
 # Guardar estado de actuadores en la base de datos
 async def save_actuator_state(client_id, name, state):
-    conn = await get_db_connection()
-    await conn.execute('INSERT INTO actuators (client_id, name, state, timestamp) VALUES (?, ?, ?, ?)',
-                       (client_id, name, state, datetime.now().isoformat()))
-    await conn.commit()
-    await conn.close()
+    async with db_connection() as conn:
+        await conn.execute('INSERT INTO actuators (client_id, name, state, timestamp) VALUES (?, ?, ?, ?)',
+                           (client_id, name, state, now_ms()))
+        await conn.commit()
 
 # Editar estado de actuadores en la base de datos
 async def update_actuator_state(client_id, id, state):
-    conn = await get_db_connection()
-    await conn.execute('UPDATE actuators SET state = ?, timestamp = ? WHERE id = ? AND client_id = ?',
-                       (state, datetime.now().isoformat(), id, client_id))
-    await conn.commit()
-    await conn.close()
+    timestamp = now_ms()
+    async with db_connection() as conn:
+        await conn.execute('UPDATE actuators SET state = ?, timestamp = ? WHERE id = ? AND client_id = ?',
+                           (state, timestamp, id, client_id))
+        await conn.commit()
+    # Mantener al dia el controlador automatico si el cambio viene de la API manual
+    actuator_controller.observe(client_id, id, state)
+    # Notificar el cambio (automatico desde el controlador o manual desde la API)
+    live_broker.publish(client_id, 'actuator', {'id': id, 'client_id': client_id, 'state': state, 'timestamp': timestamp})
+
+# Aplicar las transiciones del controlador para una lectura (estados y eventos) en una
+# sola transaccion. Las notificaciones al stream se envian despues del commit; si la
+# transaccion falla se descarta el estado en memoria del cliente para recargarlo de la base.
+async def apply_actuator_transitions(client_id, transitions):
+    timestamp = now_ms()
+    try:
+        async with db_connection() as conn:
+            try:
+                event_ids = []
+                for transition in transitions:
+                    await conn.execute('UPDATE actuators SET state = ?, timestamp = ? WHERE id = ? AND client_id = ?',
+                                       (transition['state'], timestamp, transition['id'], client_id))
+                    event_ids.append(await insert_event(conn, client_id, transition['message'], "actuador", timestamp))
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+    except Exception:
+        actuator_controller.forget(client_id)
+        raise
+    for transition, event_id in zip(transitions, event_ids):
+        live_broker.publish(client_id, 'actuator', {
+            'id': transition['id'], 'client_id': client_id, 'state': transition['state'], 'timestamp': timestamp
+        })
+        publish_event(event_id, client_id, transition['message'], "actuador", timestamp)
 
 # Obtener todos los actuadores desde la base de datos para un cliente
 async def get_all_actuators(client_id):
-    conn = await get_db_connection()
-    async with conn.execute('SELECT * FROM actuators WHERE client_id = ?', (client_id,)) as cursor:
-        data = await cursor.fetchall()
-    await conn.close()
+    async with db_connection() as conn:
+        async with conn.execute('SELECT * FROM actuators WHERE client_id = ?', (client_id,)) as cursor:
+            data = await cursor.fetchall()
     return data
 
 # Obtener el estado de un actuador específico desde la base de datos
 async def get_actuator_state(client_id, id):
-    conn = await get_db_connection()
-    async with conn.execute('SELECT state FROM actuators WHERE id = ? AND client_id = ?', (id, client_id)) as cursor:
-        state = await cursor.fetchone()
-    await conn.close()
+    async with db_connection() as conn:
+        async with conn.execute('SELECT state FROM actuators WHERE id = ? AND client_id = ?', (id, client_id)) as cursor:
+            state = await cursor.fetchone()
     return state['state'] if state else None
 
 # Obtener un actuador por nombre para un cliente específico
 async def get_actuator_by_name(client_id, name):
-    conn = await get_db_connection()
-    async with conn.execute('SELECT * FROM actuators WHERE client_id = ? AND name = ?', (client_id, name)) as cursor:
-        actuator = await cursor.fetchone()
-    await conn.close()
+    async with db_connection() as conn:
+        async with conn.execute('SELECT * FROM actuators WHERE client_id = ? AND name = ?', (client_id, name)) as cursor:
+            actuator = await cursor.fetchone()
     return actuator
@@ -0,0 +1,130 @@
+import time
+import threading
+
+# Controlador automatico de actuadores en memoria, por cliente.
+# Es la fuente de verdad del estado de cada actuador mientras el servidor esta en marcha:
+# cada lectura se evalua contra los parametros ideales con una banda de histeresis y un
+# tiempo minimo de permanencia en cada estado, y solo las transiciones reales se guardan en
+# la base de datos, se publican por MQTT y generan un evento. Asi una lectura que oscila
+# alrededor de un limite no hace conmutar el rele en cada mensaje.
+
+# Actuador -> (parametro ideal, lado del rango que lo activa, topico MQTT, mensaje al encender, mensaje al apagar)
+ACTUATOR_RULES = {
+    "Iluminacion": ("temperatura", "low", "light",
+                    "Temperatura baja, encendiendo luz", "Temperatura normal, luz apagada"),
+    "Ventilacion": ("temperatura", "high", "fan",
+                    "Temperatura alta, encendiendo ventilador", "Temperatura normal, ventilador apagado"),
+    "Humidificador": ("humedad", "low", "humidifier",
+                      "Humedad baja, encendiendo humidificador", "Humedad normal, humidificador apagado"),
+    "Motor": ("humedad", "high", "motor",
+              "Humedad alta, encendiendo motor", "Humedad normal, motor apagado")
+}
+
+# Histeresis: un actuador encendido por salir del rango se apaga cuando el valor vuelve
+# a entrar esta distancia dentro del rango (como mucho hasta la mitad del rango)
+HYSTERESIS = {"temperatura": 0.5, "humedad": 2.0}
+MIN_ON_SECONDS = 60   # Tiempo minimo encendido antes de poder apagar
+MIN_OFF_SECONDS = 60  # Tiempo minimo apagado antes de poder encender
+
+# Interpretar el estado guardado o recibido ('true'/'false', 1/0, bool)
+def as_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', '1', 'on')
+    return bool(value)
+
+class _ActuatorState:
+    __slots__ = ('id', 'name', 'on', 'changed_at')
+
+    def __init__(self, actuator_id, name, on, changed_at):
+        self.id = actuator_id
+        self.name = name
+        self.on = on
+        self.changed_at = changed_at
+
+class ActuatorController:
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._stats = {'evaluations': 0, 'transitions': 0, 'held_by_dwell': 0}
+
+    def is_loaded(self, client_id):
+        with self._lock:
+            return client_id in self._clients
+
+    # Cargar el estado inicial desde las filas de la tabla actuators (id, name, state, timestamp en ms)
+    def load(self, client_id, actuators):
+        with self._lock:
+            if client_id in self._clients:
+                return
+            self._clients[client_id] = {
+                row['name']: _ActuatorState(row['id'], row['name'], as_bool(row['state']),
+                                            (row['timestamp'] or 0) / 1000)
+                for row in actuators if row['name'] in ACTUATOR_RULES
+            }
+
+    # Evaluar una lectura. limits: {'temperatura': (min, max), 'humedad': (min, max)}.
+    # Aplica en memoria y devuelve las transiciones [{id, name, state, topic, message}].
+    def evaluate(self, client_id, temperature, humidity, limits, now=None):
+        now = time.time() if now is None else now
+        values = {"temperatura": temperature, "humedad": humidity}
+        transitions = []
+        with self._lock:
+            actuators = self._clients.get(client_id)
+            if not actuators:
+                return transitions
+            self._stats['evaluations'] += 1
+            for name, actuator in actuators.items():
+                param, side, topic, on_message, off_message = ACTUATOR_RULES[name]
+                low, high = limits[param]
+                value = values[param]
+                band = min(HYSTERESIS[param], (high - low) / 2)
+                if side == "low":
+                    wanted = value < low if not actuator.on else value < low + band
+                else:
+                    wanted = value > high if not actuator.on else value > high - band
+                if wanted == actuator.on:
+                    continue
+                dwell = MIN_ON_SECONDS if actuator.on else MIN_OFF_SECONDS
+                if now - actuator.changed_at < dwell:
+                    self._stats['held_by_dwell'] += 1
+                    continue
+                actuator.on = wanted
+                actuator.changed_at = now
+                self._stats['transitions'] += 1
+                transitions.append({
+                    "id": actuator.id,
+                    "name": name,
+                    "state": 'true' if wanted else 'false',
+                    "topic": f'clients/{client_id}/{topic}',
+                    "message": on_message if wanted else off_message
+                })
+        return transitions
+
+    # Registrar un cambio hecho fuera del controlador (API manual)
+    def observe(self, client_id, actuator_id, state):
+        with self._lock:
+            for actuator in self._clients.get(client_id, {}).values():
+                if actuator.id == actuator_id and actuator.on != as_bool(state):
+                    actuator.on = as_bool(state)
+                    actuator.changed_at = time.time()
+
+    def forget(self, client_id):
+        with self._lock:
+            self._clients.pop(client_id, None)
+
+    def snapshot(self, client_id):
+        with self._lock:
+            return {
+                name: {"id": actuator.id, "state": actuator.on, "changed_at": int(actuator.changed_at * 1000)}
+                for name, actuator in self._clients.get(client_id, {}).items()
+            }
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, clients=len(self._clients))
+
+# Instancia global usada por el cliente MQTT
+actuator_controller = ActuatorController()
+
+def get_controller_stats():
+    return actuator_controller.stats()
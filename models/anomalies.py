@@ -0,0 +1,154 @@
+import threading
+import numpy as np
+from .db_pool import db_connection
+from .timestamps import now_ms
+from .cursors import decode_cursor, next_cursor
+
+# Deteccion de lecturas anomalas (picos del sensor) por cliente.
+# Cada cliente mantiene una ventana circular de las ultimas lecturas aceptadas; una lectura
+# nueva se compara con la mediana de la ventana usando el z-score robusto
+# 0.6745 * (x - mediana) / MAD (Iglewicz y Hoaglin). Las anomalias no entran en la ventana,
+# asi que un pico no contamina la referencia. Si las anomalias se repiten en la misma
+# direccion ANOMALY_CONFIRM veces seguidas se consideran un cambio real de nivel: la
+# ventana se reinicia con esas lecturas y se dejan de marcar.
+ANOMALY_WINDOW = 60          # Lecturas aceptadas en la ventana de referencia
+ANOMALY_MIN_SAMPLES = 20     # Lecturas necesarias antes de empezar a evaluar
+ANOMALY_THRESHOLD = 6.0      # |z robusto| a partir del cual la lectura es anomala (solo picos claros)
+ANOMALY_CONFIRM = 5          # Anomalias seguidas que confirman un cambio de nivel
+# MAD minima por variable: evita marcar variaciones pequenas cuando la senal es casi plana
+ANOMALY_MIN_MAD = {"temperature": 0.1, "humidity": 0.5}
+
+METRICS = ("temperature", "humidity")
+
+CREATE_ANOMALIES_SQL = '''
+    CREATE TABLE IF NOT EXISTS sensor_anomalies (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        client_id TEXT NOT NULL,
+        timestamp INTEGER NOT NULL,
+        metric TEXT NOT NULL,
+        value REAL NOT NULL,
+        baseline REAL NOT NULL,
+        score REAL NOT NULL
+    )
+'''
+ANOMALIES_INDEX_SQL = 'CREATE INDEX IF NOT EXISTS idx_sensor_anomalies_client_timestamp ON sensor_anomalies(client_id, timestamp)'
+
+class _ClientWindow:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.values = np.zeros((capacity, 2))  # temperatura, humedad
+        self.next = 0
+        self.count = 0
+        self.pending = []  # Lecturas anomalas seguidas (para confirmar un cambio de nivel)
+        self.direction = None
+
+    def push(self, values):
+        self.values[self.next] = values
+        self.next = (self.next + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def reset(self, rows):
+        self.next = 0
+        self.count = 0
+        for values in rows[-self.capacity:]:
+            self.push(values)
+
+class AnomalyDetector:
+    def __init__(self, window=ANOMALY_WINDOW):
+        self.window = window
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._stats = {'evaluated': 0, 'anomalies': 0, 'level_shifts': 0}
+        self._min_mad = np.array([ANOMALY_MIN_MAD[metric] for metric in METRICS])
+
+    # Evaluar una lectura. Devuelve una lista de anomalias
+    # [{metric, value, baseline, score}, ...] (vacia si la lectura es normal)
+    def check(self, client_id, temperature, humidity):
+        x = np.array([temperature, humidity])
+        with self._lock:
+            state = self._clients.get(client_id)
+            if state is None:
+                state = self._clients[client_id] = _ClientWindow(self.window)
+            if state.count < ANOMALY_MIN_SAMPLES:
+                state.push(x)
+                return []
+
+            self._stats['evaluated'] += 1
+            window = state.values[:state.count]
+            median = np.median(window, axis=0)
+            mad = np.maximum(np.median(np.abs(window - median), axis=0), self._min_mad)
+            scores = 0.6745 * (x - median) / mad
+            flagged = np.abs(scores) > ANOMALY_THRESHOLD
+            if not flagged.any():
+                state.pending.clear()
+                state.direction = None
+                state.push(x)
+                return []
+
+            direction = tuple(np.sign(scores) * flagged)
+            if direction != state.direction:
+                state.pending.clear()
+                state.direction = direction
+            state.pending.append(x)
+            if len(state.pending) >= ANOMALY_CONFIRM:
+                # El valor se mantiene: es un cambio real, no un fallo del sensor
+                state.reset(state.pending)
+                state.pending = []
+                state.direction = None
+                self._stats['level_shifts'] += 1
+                return []
+
+            self._stats['anomalies'] += 1
+            return [
+                {
+                    "metric": metric,
+                    "value": float(x[i]),
+                    "baseline": round(float(median[i]), 3),
+                    "score": round(float(scores[i]), 2)
+                }
+                for i, metric in enumerate(METRICS) if flagged[i]
+            ]
+
+    def forget(self, client_id):
+        with self._lock:
+            self._clients.pop(client_id, None)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, clients=len(self._clients))
+
+# Instancia global usada por el cliente MQTT
+anomaly_detector = AnomalyDetector()
+
+def get_anomaly_stats():
+    return anomaly_detector.stats()
+
+# Guardar las anomalias de una lectura
+async def save_anomalies(client_id, timestamp, anomalies):
+    async with db_connection() as conn:
+        await conn.executemany(
+            'INSERT INTO sensor_anomalies (client_id, timestamp, metric, value, baseline, score) VALUES (?, ?, ?, ?, ?, ?)',
+            [(client_id, timestamp or now_ms(), a['metric'], a['value'], a['baseline'], a['score']) for a in anomalies]
+        )
+        await conn.commit()
+
+# Obtener una pagina de anomalias por cursor (timestamp, id), opcionalmente de una variable.
+# Devuelve (filas, cursor siguiente).
+async def get_anomalies_page(client_id, page_size, cursor_token=None, metric=None):
+    conditions = ['client_id = ?']
+    params = [client_id]
+    if metric is not None:
+        conditions.append('metric = ?')
+        params.append(metric)
+    if cursor_token:
+        conditions.append('(timestamp, id) < (?, ?)')
+        params.extend(decode_cursor(cursor_token))
+    query = f'SELECT * FROM sensor_anomalies WHERE {" AND ".join(conditions)} ORDER BY timestamp DESC, id DESC LIMIT ?'
+    params.append(page_size)
+    async with db_connection() as conn:
+        async with conn.execute(query, params) as cursor:
+            data = await cursor.fetchall()
+    return data, next_cursor(data, page_size)
+
+async def delete_client_anomalies(conn, client_id):
+    await conn.execute('DELETE FROM sensor_anomalies WHERE client_id = ?', (client_id,))
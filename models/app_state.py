@@ -1,17 +1,18 @@
 import aiosqlite
 from datetime import datetime
-from .sensor_data import get_db_connection
+from .db_pool import db_connection
+from .node_config import publish_node_config
 
 async def get_app_state(client_id):
-    conn = await get_db_connection()
-    async with conn.execute('SELECT mode FROM app_state WHERE client_id = ? ORDER BY timestamp DESC LIMIT 1', (client_id,)) as cursor:
-        state = await cursor.fetchone()
-    await conn.close()
+    async with db_connection() as conn:
+        async with conn.execute('SELECT mode FROM app_state WHERE client_id = ? ORDER BY timestamp DESC LIMIT 1', (client_id,)) as cursor:
+            state = await cursor.fetchone()
     return state['mode'] if state else None
 
 async def update_app_state(client_id, mode):
-    conn = await get_db_connection()
-    await conn.execute('INSERT INTO app_state (client_id, mode, timestamp) VALUES (?, ?, ?)', 
-                       (client_id, mode, datetime.now().isoformat()))
-    await conn.commit()
-    await conn.close()
+    async with db_connection() as conn:
+        await conn.execute('INSERT INTO app_state (client_id, mode, timestamp) VALUES (?, ?, ?)', 
+                           (client_id, mode, datetime.now().isoformat()))
+        await conn.commit()
+    # El nodo recibe el modo nuevo (control local en modo supervisado)
+    await publish_node_config(client_id)
@@ -1,5 +1,13 @@
 from datetime import datetime
-from .sensor_data import get_db_connection, execute_query_with_retry, execute_write_query_with_retry
+from .sensor_data import execute_query_with_retry, execute_write_query_with_retry
+from .db_pool import db_connection
+from .timestamps import now_ms
+from .partitions import get_partitions
+from .rollups import delete_client_rollups
+from .sketches import delete_client_sketches
+from .anomalies import delete_client_anomalies
+from .compliance import delete_client_compliance
+from .node_config import publish_node_config
 
 # Verificar si un cliente esta manualmente desactivado
 async def is_manually_disabled(client_id):
@@ -8,51 +16,63 @@ async def is_manually_disabled(client_id):
     result = await execute_query_with_retry(query, params)
     return result[0]['manually_disabled'] == 1 if result else False
 
-# Registrar un nuevo cliente
-async def register_client(client_id, name, description=""):
-    # Verificar si el cliente ya existe
-    conn = await get_db_connection()
-    async with conn.execute('SELECT * FROM clients WHERE client_id = ?', (client_id,)) as cursor:
-        existing = await cursor.fetchone()
-    
-    if existing:
-        # Verificar si el cliente esta marcado como desactivado manualmente
-        is_disabled = await is_manually_disabled(client_id)
+# Registrar un nuevo cliente. ack_support (True/False) guarda si el nodo confirma los
+# comandos de actuadores; None lo deja como estaba.
+async def register_client(client_id, name, description="", ack_support=None):
+    async with db_connection() as conn:
+        # Verificar si el cliente ya existe
+        async with conn.execute('SELECT * FROM clients WHERE client_id = ?', (client_id,)) as cursor:
+            existing = await cursor.fetchone()
         
-        if is_disabled:
-            # Solo actualizar last_seen y name/description, pero mantener status=offline
-            query = '''
-                UPDATE clients 
-                SET name = ?, description = ?, last_seen = ?
-                WHERE client_id = ?
-            '''
-            params = (name, description, datetime.now().isoformat(), client_id)
+        if existing:
+            # Verificar si el cliente esta marcado como desactivado manualmente
+            # (con la misma conexion, para no ocupar otra del pool)
+            is_disabled = existing['manually_disabled'] == 1
+            
+            if is_disabled:
+                # Solo actualizar last_seen y name/description, pero mantener status=offline
+                query = '''
+                    UPDATE clients 
+                    SET name = ?, description = ?, last_seen = ?
+                    WHERE client_id = ?
+                '''
+                params = (name, description, datetime.now().isoformat(), client_id)
+            else:
+                # Actualizar todos los campos incluyendo estado=online
+                query = '''
+                    UPDATE clients 
+                    SET name = ?, description = ?, last_seen = ?, status = 'online'
+                    WHERE client_id = ?
+                '''
+                params = (name, description, datetime.now().isoformat(), client_id)
+            
+            await conn.execute(query, params)
         else:
-            # Actualizar todos los campos incluyendo estado=online
+            # Crear un nuevo cliente
             query = '''
-                UPDATE clients 
-                SET name = ?, description = ?, last_seen = ?, status = 'online'
-                WHERE client_id = ?
+                INSERT INTO clients (client_id, name, description, last_seen, status, created_at, manually_disabled)
+                VALUES (?, ?, ?, ?, 'online', ?, 0)
             '''
-            params = (name, description, datetime.now().isoformat(), client_id)
-            
-        await conn.execute(query, params)
-    else:
-        # Crear un nuevo cliente
-        query = '''
-            INSERT INTO clients (client_id, name, description, last_seen, status, created_at, manually_disabled)
-            VALUES (?, ?, ?, ?, 'online', ?, 0)
-        '''
-        params = (client_id, name, description, datetime.now().isoformat(), datetime.now().isoformat())
-        await conn.execute(query, params)
+            params = (client_id, name, description, datetime.now().isoformat(), datetime.now().isoformat())
+            await conn.execute(query, params)
         
-        # Crear configuracion inicial para el nuevo cliente
-        await initialize_client_config(conn, client_id)
+            # Crear configuracion inicial para el nuevo cliente
+            await initialize_client_config(conn, client_id)
+        
+        if ack_support is not None:
+            await conn.execute('UPDATE clients SET ack_support = ? WHERE client_id = ?', (int(ack_support), client_id))
     
-    await conn.commit()
-    await conn.close()
+        await conn.commit()
+    # Enviar al nodo su configuracion (retenida) en cada registro
+    await publish_node_config(client_id)
     return True
 
+# Clientes que anunciaron soporte de confirmacion de comandos
+async def get_ack_clients():
+    async with db_connection() as conn:
+        async with conn.execute('SELECT client_id FROM clients WHERE ack_support = 1') as cursor:
+            return [row['client_id'] for row in await cursor.fetchall()]
+
 # Inicializar configuracion para un nuevo cliente
 async def initialize_client_config(conn, client_id):
     # Crear parametros ideales para el cliente
@@ -78,7 +98,7 @@ async def initialize_client_config(conn, client_id):
         await conn.execute('''
             INSERT INTO actuators (client_id, name, state, timestamp)
             VALUES (?, ?, ?, ?)
-        ''', (client_id, nombre, estado, datetime.now().isoformat()))
+        ''', (client_id, nombre, estado, now_ms()))
     
     # Crear estado inicial de la aplicacion
     await conn.execute('''
@@ -164,36 +184,43 @@ async def update_client_info(client_id, name, description=""):
 
 # Eliminar un cliente y todos sus datos relacionados
 async def delete_client(client_id):
-    conn = await get_db_connection()
-    try:
-        # Iniciar transaccion
-        await conn.execute('BEGIN TRANSACTION')
+    async with db_connection() as conn:
+        try:
+            # Iniciar transaccion
+            await conn.execute('BEGIN TRANSACTION')
+        
+            # Eliminar datos de sensores SHT3x (cada particion tiene su propio indice)
+            for name in await get_partitions(conn):
+                await conn.execute(f'DELETE FROM {name} WHERE client_id = ?', (client_id,))
+            await delete_client_rollups(conn, client_id)
+            await delete_client_sketches(conn, client_id)
+        
+            await delete_client_anomalies(conn, client_id)
+            await delete_client_compliance(conn, client_id)
         
-        # Eliminar datos de sensores SHT3x
-        await conn.execute('DELETE FROM sht3x_data WHERE client_id = ?', (client_id,))
+            # Eliminar eventos
+            await conn.execute('DELETE FROM events WHERE client_id = ?', (client_id,))
         
-        # Eliminar eventos
-        await conn.execute('DELETE FROM events WHERE client_id = ?', (client_id,))
+            # Eliminar actuadores
+            await conn.execute('DELETE FROM actuators WHERE client_id = ?', (client_id,))
         
-        # Eliminar actuadores
-        await conn.execute('DELETE FROM actuators WHERE client_id = ?', (client_id,))
+            # Eliminar parametros ideales
+            await conn.execute('DELETE FROM ideal_params WHERE client_id = ?', (client_id,))
         
-        # Eliminar parametros ideales
-        await conn.execute('DELETE FROM ideal_params WHERE client_id = ?', (client_id,))
+            # Eliminar estados de la aplicacion
+            await conn.execute('DELETE FROM app_state WHERE client_id = ?', (client_id,))
         
-        # Eliminar estados de la aplicacion
-        await conn.execute('DELETE FROM app_state WHERE client_id = ?', (client_id,))
+            # Eliminar politicas de retencion
+            await conn.execute('DELETE FROM retention_policies WHERE client_id = ?', (client_id,))
         
-        # Finalmente, eliminar el cliente
-        await conn.execute('DELETE FROM clients WHERE client_id = ?', (client_id,))
+            # Finalmente, eliminar el cliente
+            await conn.execute('DELETE FROM clients WHERE client_id = ?', (client_id,))
         
-        # Confirmar transaccion
-        await conn.execute('COMMIT')
-        return True
-    except Exception as e:
-        # Revertir cambios en caso de error
-        await conn.execute('ROLLBACK')
-        print(f"Error al eliminar cliente: {e}")
-        raise e
-    finally:
-        await conn.close()
+            # Confirmar transaccion
+            await conn.execute('COMMIT')
+            return True
+        except Exception as e:
+            # Revertir cambios en caso de error
+            await conn.execute('ROLLBACK')
+            print(f"Error al eliminar cliente: {e}")
+            raise e
@@ -0,0 +1,129 @@
+from .partitions import get_partitions_sync
+from .rollups import HOUR_MS, floor_to
+
+# Contadores horarios de cumplimiento por cliente: cuantas lecturas de cada hora estaban
+# dentro de los parametros ideales de temperatura, de humedad y de ambos a la vez.
+# Se actualizan en la transaccion de la ingesta con los parametros ideales vigentes en ese
+# momento (cacheados), asi que un cambio de parametros no reescribe el historico.
+# El porcentaje de lecturas equivale al porcentaje de tiempo con un muestreo regular.
+
+COMPLIANCE_TABLE = 'sht3x_compliance_1h'
+
+COMPLIANCE_SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS {COMPLIANCE_TABLE} (
+        client_id TEXT NOT NULL,
+        bucket_ms INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        temp_ok INTEGER NOT NULL,
+        hum_ok INTEGER NOT NULL,
+        both_ok INTEGER NOT NULL,
+        PRIMARY KEY (client_id, bucket_ms)
+    ) WITHOUT ROWID
+'''
+
+UPSERT_SQL = f'''
+    INSERT INTO {COMPLIANCE_TABLE} (client_id, bucket_ms, count, temp_ok, hum_ok, both_ok)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(client_id, bucket_ms) DO UPDATE SET
+        count = count + excluded.count,
+        temp_ok = temp_ok + excluded.temp_ok,
+        hum_ok = hum_ok + excluded.hum_ok,
+        both_ok = both_ok + excluded.both_ok
+'''
+
+# Limites actuales por cliente: (temp_min, temp_max, hum_min, hum_max)
+LIMITS_SQL = '''
+    SELECT client_id,
+           MAX(CASE WHEN param_type = 'temperatura' THEN min_value END),
+           MAX(CASE WHEN param_type = 'temperatura' THEN max_value END),
+           MAX(CASE WHEN param_type = 'humedad' THEN min_value END),
+           MAX(CASE WHEN param_type = 'humedad' THEN max_value END)
+    FROM ideal_params
+    GROUP BY client_id
+'''
+
+# Contar lecturas (client_id, timestamp, temperature, humidity) dentro de rango por hora.
+# limits: {client_id: (temp_min, temp_max, hum_min, hum_max)}; se omiten clientes sin limites.
+def count_compliance(rows, limits):
+    buckets = {}
+    for client_id, ts_ms, temperature, humidity in rows:
+        bounds = limits.get(client_id)
+        if bounds is None:
+            continue
+        temp_ok = bounds[0] <= temperature <= bounds[1]
+        hum_ok = bounds[2] <= humidity <= bounds[3]
+        key = (client_id, floor_to(ts_ms, HOUR_MS))
+        counts = buckets.get(key)
+        if counts is None:
+            counts = buckets[key] = [0, 0, 0, 0]
+        counts[0] += 1
+        counts[1] += temp_ok
+        counts[2] += hum_ok
+        counts[3] += temp_ok and hum_ok
+    return [(client_id, bucket, *counts) for (client_id, bucket), counts in buckets.items()]
+
+# Porcentajes de cumplimiento a partir de los contadores sumados
+def summarize_compliance(count, temp_ok, hum_ok, both_ok):
+    def pct(value):
+        return round(100.0 * value / count, 2) if count else 0
+    return {
+        "count": count,
+        "temperature_pct": pct(temp_ok),
+        "humidity_pct": pct(hum_ok),
+        "both_pct": pct(both_ok)
+    }
+
+# --- Acceso asincrono (conexiones aiosqlite del pool) ---
+
+# Actualizar los contadores con un lote de lecturas (no hace commit, va en la transaccion de la ingesta)
+async def apply_compliance(conn, rows, limits):
+    values = count_compliance(rows, limits)
+    if values:
+        await conn.executemany(UPSERT_SQL, values)
+
+# Cumplimiento de un cliente en las horas que empiezan en [start_ms, end_ms]
+async def get_compliance(conn, client_id, start_ms, end_ms):
+    async with conn.execute(f'''
+        SELECT COUNT(*), COALESCE(SUM(count), 0), COALESCE(SUM(temp_ok), 0),
+               COALESCE(SUM(hum_ok), 0), COALESCE(SUM(both_ok), 0)
+        FROM {COMPLIANCE_TABLE}
+        WHERE client_id = ? AND bucket_ms >= ? AND bucket_ms <= ?
+    ''', (client_id, floor_to(start_ms, HOUR_MS), end_ms)) as cursor:
+        hours, *counts = await cursor.fetchone()
+    return dict(summarize_compliance(*counts), hours=hours)
+
+async def delete_client_compliance(conn, client_id):
+    await conn.execute(f'DELETE FROM {COMPLIANCE_TABLE} WHERE client_id = ?', (client_id,))
+
+# --- Acceso sincrono (sqlite3: database.py y MSAD) ---
+
+def create_compliance_table_sync(conn):
+    conn.execute(COMPLIANCE_SCHEMA)
+
+def load_limits_sync(conn):
+    return {
+        row[0]: tuple(row[1:]) for row in conn.execute(LIMITS_SQL)
+        if all(value is not None for value in row[1:])
+    }
+
+def apply_compliance_sync(conn, rows, limits=None):
+    values = count_compliance(rows, load_limits_sync(conn) if limits is None else limits)
+    if values:
+        conn.executemany(UPSERT_SQL, values)
+
+# Reconstruir todos los contadores desde las lecturas crudas con los limites actuales
+# en una transaccion IMMEDIATE
+def rebuild_compliance_sync(conn):
+    create_compliance_table_sync(conn)
+    limits = load_limits_sync(conn)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(f'DELETE FROM {COMPLIANCE_TABLE}')
+        for partition in get_partitions_sync(conn):
+            rows = conn.execute(f'SELECT client_id, timestamp, temperature, humidity FROM {partition}').fetchall()
+            apply_compliance_sync(conn, rows, limits)
+            print(f"Contadores de cumplimiento de {partition} reconstruidos")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
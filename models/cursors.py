@@ -0,0 +1,26 @@
+import base64
+
+# Cursores opacos para la paginacion por clave (keyset).
+# Un cursor codifica la posicion (timestamp, id) de la ultima fila entregada; la pagina
+# siguiente empieza justo despues de ella usando el indice (client_id, timestamp), por lo
+# que cualquier pagina cuesta lo mismo que la primera.
+
+def encode_cursor(timestamp, row_id):
+    raw = f"{int(timestamp)}:{int(row_id)}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+# Devuelve (timestamp, id); lanza ValueError si el cursor no es valido
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        timestamp, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split(':')
+        return int(timestamp), int(row_id)
+    except Exception:
+        raise ValueError(f"Cursor no valido: {token}")
+
+# Cursor de la pagina siguiente, o None si la pagina no se lleno (no hay mas filas)
+def next_cursor(rows, page_size):
+    if len(rows) < page_size or not rows:
+        return None
+    last = rows[-1]
+    return encode_cursor(last['timestamp'], last['id'])
@@ -0,0 +1,221 @@
+import aiosqlite
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager
+from db_config import DB_PATH, get_connection_pragmas
+
+# Configuracion del pool
+POOL_SIZE = 4  # Numero maximo de conexiones abiertas
+ACQUIRE_TIMEOUT = 10  # Segundos maximos esperando una conexion libre
+HEALTH_CHECK_INTERVAL = 30  # Segundos de inactividad antes de verificar una conexion
+ACQUIRE_POLL_INTERVAL = 0.01  # Segundos entre intentos cuando el pool esta agotado
+
+# Pool de conexiones aiosqlite de larga duracion.
+# Las rutas Flask async se ejecutan en un bucle de eventos distinto por peticion y el
+# cliente MQTT en su propio bucle, por lo que el pool se protege con un threading.Lock
+# y nunca usa primitivas de asyncio ligadas a un bucle concreto.
+class ConnectionPool:
+    def __init__(self, db_path=DB_PATH, size=POOL_SIZE, acquire_timeout=ACQUIRE_TIMEOUT,
+                 health_check_interval=HEALTH_CHECK_INTERVAL):
+        self.db_path = db_path
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        self._lock = threading.Lock()
+        self._idle = []  # Lista de (conexion, momento en que se devolvio)
+        self._open = 0  # Conexiones abiertas (libres + en uso)
+        self._closed = False
+        self._stats = {
+            'created': 0,
+            'acquired': 0,
+            'waits': 0,
+            'health_checks': 0,
+            'discarded': 0
+        }
+
+    # Abrir una nueva conexion configurada
+    async def _open_connection(self):
+        conn = aiosqlite.connect(self.db_path)
+        # aiosqlite usa un hilo no daemon por conexion; al ser de larga duracion
+        # se marca como daemon para no bloquear la salida del proceso
+        worker = getattr(conn, '_thread', conn)
+        worker.daemon = True
+        conn = await conn
+        conn.row_factory = aiosqlite.Row
+        # Aplicar el perfil de almacenamiento (busy_timeout, cache, mmap...)
+        for statement in get_connection_pragmas():
+            await conn.execute(statement)
+        self._stats['created'] += 1
+        return conn
+
+    # Verificar que una conexion inactiva sigue siendo utilizable
+    async def _is_healthy(self, conn):
+        self._stats['health_checks'] += 1
+        try:
+            async with conn.execute('SELECT 1') as cursor:
+                await cursor.fetchone()
+            return True
+        except Exception as e:
+            print(f"Conexion del pool descartada tras verificacion fallida: {e}")
+            return False
+
+    async def _discard(self, conn):
+        with self._lock:
+            self._open -= 1
+            self._stats['discarded'] += 1
+        try:
+            await conn.close()
+        except Exception:
+            pass
+
+    # Obtener una conexion del pool (esperando si todas estan en uso)
+    async def acquire(self):
+        deadline = time.monotonic() + self.acquire_timeout
+        waited = False
+        while True:
+            conn = None
+            idle_since = None
+            create = False
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("El pool de conexiones esta cerrado")
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                elif self._open < self.size:
+                    self._open += 1
+                    create = True
+
+            if conn is not None:
+                if time.monotonic() - idle_since > self.health_check_interval:
+                    if not await self._is_healthy(conn):
+                        await self._discard(conn)
+                        continue
+                self._stats['acquired'] += 1
+                return conn
+
+            if create:
+                try:
+                    conn = await self._open_connection()
+                except Exception:
+                    with self._lock:
+                        self._open -= 1
+                    raise
+                self._stats['acquired'] += 1
+                return conn
+
+            if not waited:
+                self._stats['waits'] += 1
+                waited = True
+            if time.monotonic() > deadline:
+                raise TimeoutError("Tiempo de espera agotado obteniendo conexion del pool")
+            await asyncio.sleep(ACQUIRE_POLL_INTERVAL)
+
+    # Devolver una conexion al pool
+    async def release(self, conn):
+        try:
+            # No devolver conexiones con transacciones a medias
+            if conn.in_transaction:
+                await conn.rollback()
+        except Exception:
+            await self._discard(conn)
+            return
+
+        with self._lock:
+            if not self._closed:
+                self._idle.append((conn, time.monotonic()))
+                return
+            self._open -= 1
+        await conn.close()
+
+    # Context manager para usar una conexion del pool
+    @asynccontextmanager
+    async def connection(self):
+        conn = await self.acquire()
+        try:
+            yield conn
+        except Exception:
+            # Una conexion que fallo a mitad de consulta se verifica antes de reutilizarse
+            try:
+                healthy = await self._is_healthy(conn)
+            except Exception:
+                healthy = False
+            if not healthy:
+                await self._discard(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                await self.release(conn)
+
+    # Cerrar todas las conexiones libres e impedir nuevas
+    async def close(self):
+        with self._lock:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle = []
+            self._open -= len(idle)
+        for conn in idle:
+            try:
+                await conn.close()
+            except Exception as e:
+                print(f"Error al cerrar conexion del pool: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._open - len(self._idle),
+                **self._stats
+            }
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Obtener el pool global (se crea bajo demanda)
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool._closed:
+            _pool = ConnectionPool(DB_PATH, POOL_SIZE, ACQUIRE_TIMEOUT, HEALTH_CHECK_INTERVAL)
+        return _pool
+
+# Cambiar el tamano u otros parametros del pool (la ruta solo aplica a pools nuevos)
+def configure_pool(size=None, acquire_timeout=None, health_check_interval=None, db_path=None):
+    global POOL_SIZE, ACQUIRE_TIMEOUT, HEALTH_CHECK_INTERVAL, DB_PATH
+    if size is not None:
+        POOL_SIZE = size
+    if acquire_timeout is not None:
+        ACQUIRE_TIMEOUT = acquire_timeout
+    if health_check_interval is not None:
+        HEALTH_CHECK_INTERVAL = health_check_interval
+    if db_path is not None:
+        DB_PATH = db_path
+    with _pool_lock:
+        pool = _pool
+    if pool is not None:
+        pool.size = POOL_SIZE
+        pool.acquire_timeout = ACQUIRE_TIMEOUT
+        pool.health_check_interval = HEALTH_CHECK_INTERVAL
+
+# Atajo para obtener una conexion del pool global
+def db_connection():
+    return get_pool().connection()
+
+# Cerrar el pool global
+async def close_pool():
+    global _pool
+    with _pool_lock:
+        pool = _pool
+        _pool = None
+    if pool is not None:
+        await pool.close()
+
+def get_pool_stats():
+    with _pool_lock:
+        pool = _pool
+    if pool is None:
+        return {'size': POOL_SIZE, 'open': 0, 'idle': 0, 'in_use': 0}
+    return pool.stats()
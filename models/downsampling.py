@@ -0,0 +1,44 @@
+import numpy as np
+
+# Reduccion de series para graficas con Largest-Triangle-Three-Buckets (LTTB).
+# Se conservan el primer y el ultimo punto; el resto se reparte en cubetas de igual
+# tamano y de cada una se elige el punto que forma el triangulo de mayor area con el
+# punto elegido en la cubeta anterior y la media de la cubeta siguiente. Asi se mantienen
+# picos y valles, que un promedio o un muestreo regular aplanarian.
+# El area de todos los candidatos de una cubeta se calcula de una vez con NumPy.
+
+# Indices de los puntos elegidos (ordenados) para reducir (x, y) a max_points puntos
+def lttb_indices(x, y, max_points):
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Limites de las max_points - 2 cubetas centrales sobre los puntos [1, n - 1)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        areas = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) -
+            (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(areas.argmax())
+        selected[i + 1] = a
+    return selected
+
+# Reducir una serie (x, y); devuelve los arrays reducidos
+def lttb(x, y, max_points):
+    indices = lttb_indices(x, y, max_points)
+    return np.asarray(x)[indices], np.asarray(y)[indices]
@@ -1,44 +1,72 @@
 import aiosqlite
-from datetime import datetime
-from .sensor_data import get_db_connection
+from .timestamps import now_ms
+from .db_pool import db_connection
+from .live_stream import live_broker
+from .cursors import decode_cursor, next_cursor
+
+# Insertar un evento en una transaccion abierta (sin commit). Devuelve el id.
+async def insert_event(conn, client_id, message, topic, timestamp):
+    cursor = await conn.execute('INSERT INTO events (client_id, timestamp, message, topic) VALUES (?, ?, ?, ?)',
+                                (client_id, timestamp, message, topic))
+    return cursor.lastrowid
+
+# Notificar a los navegadores suscritos al stream del cliente (despues del commit)
+def publish_event(event_id, client_id, message, topic, timestamp):
+    live_broker.publish(client_id, 'event', {
+        'id': event_id, 'client_id': client_id, 'message': message, 'topic': topic, 'timestamp': timestamp
+    })
 
 # Guardar evento en la base de datos
 async def save_event(client_id, message, topic):
-    conn = await get_db_connection()
-    await conn.execute('INSERT INTO events (client_id, timestamp, message, topic) VALUES (?, ?, ?, ?)',
-                       (client_id, datetime.now().isoformat(), message, topic))
-    await conn.commit()
-    await conn.close()
+    timestamp = now_ms()
+    async with db_connection() as conn:
+        event_id = await insert_event(conn, client_id, message, topic, timestamp)
+        await conn.commit()
+    publish_event(event_id, client_id, message, topic, timestamp)
 
 # Obtener todos los eventos desde la base de datos con paginacion
 async def get_all_events(client_id, page, page_size):
-    conn = await get_db_connection()
-    async with conn.execute('SELECT * FROM events WHERE client_id = ? ORDER BY timestamp DESC LIMIT ? OFFSET ?',
-                            (client_id, page_size, (page - 1) * page_size)) as cursor:
-        data = await cursor.fetchall()
-    await conn.close()
+    async with db_connection() as conn:
+        async with conn.execute('SELECT * FROM events WHERE client_id = ? ORDER BY timestamp DESC LIMIT ? OFFSET ?',
+                                (client_id, page_size, (page - 1) * page_size)) as cursor:
+            data = await cursor.fetchall()
     return data
 
 # Obtener eventos filtrados por tema
 async def get_events_by_topic(client_id, topic, page, page_size):
-    conn = await get_db_connection()
-    async with conn.execute('SELECT * FROM events WHERE client_id = ? AND topic = ? ORDER BY timestamp DESC LIMIT ? OFFSET ?',
-                            (client_id, topic, page_size, (page - 1) * page_size)) as cursor:
-        data = await cursor.fetchall()
-    await conn.close()
+    async with db_connection() as conn:
+        async with conn.execute('SELECT * FROM events WHERE client_id = ? AND topic = ? ORDER BY timestamp DESC LIMIT ? OFFSET ?',
+                                (client_id, topic, page_size, (page - 1) * page_size)) as cursor:
+            data = await cursor.fetchall()
     return data
 
+# Obtener una pagina de eventos por cursor (timestamp, id), opcionalmente filtrada por tema.
+# Devuelve (filas, cursor siguiente).
+async def get_events_page(client_id, page_size, cursor_token=None, topic=None):
+    conditions = ['client_id = ?']
+    params = [client_id]
+    if topic is not None:
+        conditions.append('topic = ?')
+        params.append(topic)
+    if cursor_token:
+        conditions.append('(timestamp, id) < (?, ?)')
+        params.extend(decode_cursor(cursor_token))
+    query = f'SELECT * FROM events WHERE {" AND ".join(conditions)} ORDER BY timestamp DESC, id DESC LIMIT ?'
+    params.append(page_size)
+    async with db_connection() as conn:
+        async with conn.execute(query, params) as cursor:
+            data = await cursor.fetchall()
+    return data, next_cursor(data, page_size)
+
 # Actualizar un evento en la base de datos
 async def update_event(client_id, id, message, topic):
-    conn = await get_db_connection()
-    await conn.execute('UPDATE events SET message = ?, timestamp = ?, topic = ? WHERE id = ? AND client_id = ?',
-                       (message, datetime.now().isoformat(), topic, id, client_id))
-    await conn.commit()
-    await conn.close()
+    async with db_connection() as conn:
+        await conn.execute('UPDATE events SET message = ?, timestamp = ?, topic = ? WHERE id = ? AND client_id = ?',
+                           (message, now_ms(), topic, id, client_id))
+        await conn.commit()
 
 # Eliminar un evento en la base de datos
 async def delete_event(client_id, id):
-    conn = await get_db_connection()
-    await conn.execute('DELETE FROM events WHERE id = ? AND client_id = ?', (id, client_id))
-    await conn.commit()
-    await conn.close()
+    async with db_connection() as conn:
+        await conn.execute('DELETE FROM events WHERE id = ? AND client_id = ?', (id, client_id))
+        await conn.commit()
@@ -0,0 +1,119 @@
+import json
+import queue
+import threading
+from .timestamps import ms_to_iso
+
+# Configuracion del stream en vivo (Server-Sent Events)
+SUBSCRIBER_BUFFER_SIZE = 100  # Mensajes pendientes por suscriptor antes de expulsarlo
+MAX_SUBSCRIBERS_PER_CLIENT = 10  # Cada conexion SSE ocupa un hilo del servidor
+KEEPALIVE_INTERVAL = 15  # Segundos sin mensajes antes de enviar un comentario keep-alive
+RETRY_MS = 3000  # Espera que el navegador aplica antes de reconectarse
+
+# Suscriptor de un stream: una cola acotada (thread-safe) que vacia el hilo de su respuesta HTTP
+class Subscriber:
+    def __init__(self, client_id, buffer_size):
+        self.client_id = client_id
+        self.queue = queue.Queue(maxsize=buffer_size)
+        self.evicted = False
+
+# Difusion de lecturas, cambios de actuadores y eventos a los navegadores conectados.
+# Los productores (bucle del cliente MQTT y vistas de Flask) llaman a publish desde cualquier
+# hilo; cada mensaje se serializa una sola vez y se copia a la cola de cada suscriptor.
+# Un suscriptor cuya cola se llena (navegador lento o desconectado) se expulsa en lugar de
+# bloquear al productor o acumular memoria.
+class LiveBroker:
+    def __init__(self, buffer_size=SUBSCRIBER_BUFFER_SIZE, max_per_client=MAX_SUBSCRIBERS_PER_CLIENT):
+        self.buffer_size = buffer_size
+        self.max_per_client = max_per_client
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._stats = {'published': 0, 'delivered': 0, 'evicted': 0}
+
+    # Registrar un suscriptor; devuelve None si el cliente ya tiene demasiados
+    def subscribe(self, client_id):
+        with self._lock:
+            subscribers = self._subscribers.setdefault(client_id, set())
+            if len(subscribers) >= self.max_per_client:
+                return None
+            subscriber = Subscriber(client_id, self.buffer_size)
+            subscribers.add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.client_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.client_id]
+
+    # Publicar un mensaje para los suscriptores de un cliente (no bloquea)
+    def publish(self, client_id, event_type, data):
+        with self._lock:
+            subscribers = self._subscribers.get(client_id)
+            if not subscribers:
+                return 0
+            self._sequence += 1
+            frame = format_frame(event_type, data, self._sequence)
+            self._stats['published'] += 1
+            delivered = 0
+            for subscriber in list(subscribers):
+                try:
+                    subscriber.queue.put_nowait(frame)
+                    delivered += 1
+                except queue.Full:
+                    subscriber.evicted = True
+                    subscribers.discard(subscriber)
+                    self._stats['evicted'] += 1
+                    print(f"Suscriptor lento del stream de {client_id} expulsado")
+            if not subscribers:
+                del self._subscribers[client_id]
+            self._stats['delivered'] += delivered
+            return delivered
+
+    # Generador de tramas SSE para una respuesta HTTP en streaming
+    def stream(self, subscriber, initial=()):
+        try:
+            # La primera trama se envia de inmediato para que el servidor mande las cabeceras
+            yield f'retry: {RETRY_MS}\n\n'
+            for frame in initial:
+                yield frame
+            while not subscriber.evicted:
+                try:
+                    frame = subscriber.queue.get(timeout=KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if subscriber.evicted:
+                    break
+                yield frame
+            if subscriber.evicted:
+                # El navegador (EventSource) se reconecta solo y empieza con una cola vacia
+                yield format_frame('evicted', {'reason': 'slow_consumer'})
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['subscribers'] = {client_id: len(subs) for client_id, subs in self._subscribers.items()}
+        snapshot['buffer_size'] = self.buffer_size
+        snapshot['max_subscribers_per_client'] = self.max_per_client
+        return snapshot
+
+# Formatear un mensaje como trama SSE; los timestamps en milisegundos se envian en ISO
+def format_frame(event_type, data, event_id=None):
+    if 'timestamp' in data:
+        data = dict(data, timestamp=ms_to_iso(data['timestamp']))
+    lines = [f'event: {event_type}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+# Instancia global usada por el cliente MQTT, los modelos y la ruta del stream
+live_broker = LiveBroker()
+
+def get_stream_stats():
+    return live_broker.stats()
@@ -0,0 +1,61 @@
+import json
+from mqtt_outbox import mqtt_outbox
+from .db_pool import db_connection
+from .timestamps import now_ms
+from .actuator_controller import ACTUATOR_RULES, HYSTERESIS, MIN_ON_SECONDS, MIN_OFF_SECONDS
+
+# Configuracion publicada a cada nodo en clients/{id}/config como mensaje retenido: el
+# broker la entrega al nodo en cuanto se suscribe, asi que un nodo que se reinicia sin
+# servidor sigue teniendo sus parametros. Se publica al cambiar los parametros ideales o
+# el modo de la aplicacion, al registrar un cliente y al arrancar el servidor.
+# En modo 'supervisado' el nodo ejecuta el control de actuadores en local con estos
+# parametros (misma histeresis y tiempos minimos que el controlador del servidor) y el
+# servidor solo registra los cambios que el nodo informa en clients/{id}/state/<actuador>.
+SUPERVISED_MODE = 'supervisado'
+APP_MODES = ('manual', 'automatico', SUPERVISED_MODE)
+
+def config_topic(client_id):
+    return f'clients/{client_id}/config'
+
+# Construir la configuracion de un cliente desde la base de datos
+async def build_node_config(conn, client_id):
+    async with conn.execute('SELECT param_type, min_value, max_value FROM ideal_params WHERE client_id = ?',
+                            (client_id,)) as cursor:
+        params = {row['param_type']: {"min": row['min_value'], "max": row['max_value']} for row in await cursor.fetchall()}
+    async with conn.execute('SELECT mode FROM app_state WHERE client_id = ? ORDER BY timestamp DESC LIMIT 1',
+                            (client_id,)) as cursor:
+        state = await cursor.fetchone()
+    mode = state['mode'] if state else None
+    return {
+        "mode": mode,
+        "local_control": mode == SUPERVISED_MODE,
+        "ideal_params": params,
+        "hysteresis": HYSTERESIS,
+        "min_on_seconds": MIN_ON_SECONDS,
+        "min_off_seconds": MIN_OFF_SECONDS,
+        "actuators": {
+            topic: {"name": name, "param": param, "side": side}
+            for name, (param, side, topic, _, _) in ACTUATOR_RULES.items()
+        },
+        "updated_at": now_ms()
+    }
+
+# Publicar (retenida) la configuracion actual de un cliente por la bandeja de salida
+async def publish_node_config(client_id):
+    async with db_connection() as conn:
+        config = await build_node_config(conn, client_id)
+    mqtt_outbox.enqueue(config_topic(client_id), json.dumps(config), retain=True)
+    return config
+
+# Publicar la configuracion de todos los clientes (al arrancar el servidor)
+async def publish_all_node_configs():
+    async with db_connection() as conn:
+        async with conn.execute('SELECT client_id FROM clients') as cursor:
+            client_ids = [row['client_id'] for row in await cursor.fetchall()]
+    for client_id in client_ids:
+        await publish_node_config(client_id)
+    return len(client_ids)
+
+# Borrar el mensaje retenido de un cliente eliminado (carga vacia)
+def clear_node_config(client_id):
+    mqtt_outbox.enqueue(config_topic(client_id), '', retain=True)
@@ -0,0 +1,205 @@
+from datetime import datetime
+import threading
+from .timestamps import from_epoch_ms
+
+# Particionado mensual de las lecturas SHT3x.
+# Cada mes vive en su propia tabla sht3x_data_AAAAMM con su propio indice, registrada en
+# sht3x_partitions con su rango [start_ms, end_ms). Las escrituras se enrutan a la
+# particion del mes de cada lectura y las consultas por rango solo tocan las particiones
+# que se solapan. Borrar un mes completo es un DROP TABLE en lugar de un DELETE masivo.
+# sht3x_data se mantiene como vista UNION ALL para lectores externos (sqlite3, backups).
+
+PARTITION_PREFIX = 'sht3x_data_'
+COMPAT_VIEW = 'sht3x_data'
+
+CREATE_REGISTRY_SQL = '''
+    CREATE TABLE IF NOT EXISTS sht3x_partitions (
+        name TEXT PRIMARY KEY,
+        start_ms INTEGER NOT NULL,
+        end_ms INTEGER NOT NULL
+    )
+'''
+
+PARTITION_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        client_id TEXT NOT NULL,
+        timestamp INTEGER NOT NULL,
+        temperature REAL NOT NULL,
+        humidity REAL NOT NULL
+    )
+'''
+
+PARTITION_INDEX = 'CREATE INDEX IF NOT EXISTS idx_{name}_client_timestamp ON {name}(client_id, timestamp)'
+
+INSERT_COLUMNS = '(client_id, timestamp, temperature, humidity)'
+
+# Particiones que ya se sabe que existen (evita DDL en cada lote)
+_known_partitions = set()
+_known_lock = threading.Lock()
+
+# Rango [inicio, fin) en milisegundos del mes (hora local) que contiene ts_ms
+def partition_bounds(ts_ms):
+    moment = from_epoch_ms(ts_ms)
+    start = datetime(moment.year, moment.month, 1)
+    if moment.month == 12:
+        end = datetime(moment.year + 1, 1, 1)
+    else:
+        end = datetime(moment.year, moment.month + 1, 1)
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+def partition_name(ts_ms):
+    moment = from_epoch_ms(ts_ms)
+    return f"{PARTITION_PREFIX}{moment.year:04d}{moment.month:02d}"
+
+# Sentencias para crear una particion y registrarla
+def partition_ddl(ts_ms):
+    name = partition_name(ts_ms)
+    start_ms, end_ms = partition_bounds(ts_ms)
+    return name, [
+        (PARTITION_SCHEMA.format(name=name), ()),
+        (PARTITION_INDEX.format(name=name), ()),
+        ('INSERT OR IGNORE INTO sht3x_partitions (name, start_ms, end_ms) VALUES (?, ?, ?)',
+         (name, start_ms, end_ms))
+    ]
+
+# Sentencias para recrear la vista de compatibilidad sobre todas las particiones
+def compat_view_ddl(names):
+    statements = [f'DROP VIEW IF EXISTS {COMPAT_VIEW}']
+    if names:
+        union = ' UNION ALL '.join(f'SELECT * FROM {name}' for name in sorted(names))
+        statements.append(f'CREATE VIEW {COMPAT_VIEW} AS {union}')
+    return statements
+
+# Agrupar filas (client_id, timestamp, temperature, humidity) por particion
+def group_by_partition(rows):
+    groups = {}
+    for row in rows:
+        groups.setdefault(partition_name(row[1]), []).append(row)
+    return groups
+
+# Construir una consulta UNION ALL sobre varias particiones.
+# where y params se repiten en cada particion; order_by/limit se aplican al conjunto.
+def build_union_query(names, columns, where, params=(), order_by=None, limit=None):
+    parts = [f'SELECT {columns} FROM {name} WHERE {where}' for name in names]
+    query = ' UNION ALL '.join(parts)
+    all_params = tuple(params) * len(names)
+    if order_by:
+        query += f' ORDER BY {order_by}'
+    if limit is not None:
+        query += ' LIMIT ?'
+        all_params += (limit,)
+    return query, all_params
+
+# Consulta de las particiones que se solapan con [start_ms, end_ms], de la mas reciente a la mas antigua
+def partitions_query(start_ms=None, end_ms=None):
+    query = 'SELECT name FROM sht3x_partitions WHERE 1 = 1'
+    params = []
+    if end_ms is not None:
+        query += ' AND start_ms <= ?'
+        params.append(end_ms)
+    if start_ms is not None:
+        query += ' AND end_ms > ?'
+        params.append(start_ms)
+    query += ' ORDER BY start_ms DESC'
+    return query, params
+
+def _remember(name):
+    with _known_lock:
+        _known_partitions.add(name)
+
+def _is_known(name):
+    with _known_lock:
+        return name in _known_partitions
+
+def forget_partition(name):
+    with _known_lock:
+        _known_partitions.discard(name)
+
+# --- Acceso asincrono (conexiones aiosqlite del pool) ---
+
+# Crear la particion de ts_ms si no existe. La creacion (tabla, registro y vista) se
+# confirma en su propia transaccion y solo entonces se recuerda la particion: asi un
+# rollback del lote no deja una tabla fuera del registro que las lecturas y la retencion
+# no verian. Llamar antes de escribir nada en la transaccion del lote.
+async def ensure_partition(conn, ts_ms):
+    name = partition_name(ts_ms)
+    if _is_known(name):
+        return name
+    try:
+        await conn.execute(CREATE_REGISTRY_SQL)
+        async with conn.execute('SELECT 1 FROM sht3x_partitions WHERE name = ?', (name,)) as cursor:
+            exists = await cursor.fetchone()
+        if not exists:
+            _, statements = partition_ddl(ts_ms)
+            for sql, params in statements:
+                await conn.execute(sql, params)
+            async with conn.execute('SELECT name FROM sht3x_partitions') as cursor:
+                names = [row[0] for row in await cursor.fetchall()]
+            for sql in compat_view_ddl(names):
+                await conn.execute(sql)
+        await conn.commit()
+    except Exception:
+        await conn.rollback()
+        raise
+    if not exists:
+        print(f"Particion {name} creada")
+    _remember(name)
+    return name
+
+# Insertar lecturas enrutandolas a su particion (no hace commit de las lecturas).
+# Las particiones nuevas se crean y confirman antes de la primera insercion, por lo que
+# debe ser la primera escritura de la transaccion.
+async def insert_readings(conn, rows):
+    groups = group_by_partition(rows)
+    for group in groups.values():
+        await ensure_partition(conn, group[0][1])
+    for name, group in groups.items():
+        await conn.executemany(f'INSERT INTO {name} {INSERT_COLUMNS} VALUES (?, ?, ?, ?)', group)
+
+# Particiones que se solapan con [start_ms, end_ms]
+async def get_partitions(conn, start_ms=None, end_ms=None):
+    query, params = partitions_query(start_ms, end_ms)
+    async with conn.execute(query, params) as cursor:
+        return [row[0] for row in await cursor.fetchall()]
+
+# Eliminar una particion completa (no hace commit)
+async def drop_partition(conn, name):
+    await conn.execute(f'DROP TABLE IF EXISTS {name}')
+    await conn.execute('DELETE FROM sht3x_partitions WHERE name = ?', (name,))
+    async with conn.execute('SELECT name FROM sht3x_partitions') as cursor:
+        names = [row[0] for row in await cursor.fetchall()]
+    for sql in compat_view_ddl(names):
+        await conn.execute(sql)
+    forget_partition(name)
+
+# --- Acceso sincrono (sqlite3: database.py y MSAD) ---
+
+def ensure_partition_sync(conn, ts_ms):
+    name = partition_name(ts_ms)
+    conn.execute(CREATE_REGISTRY_SQL)
+    if conn.execute('SELECT 1 FROM sht3x_partitions WHERE name = ?', (name,)).fetchone() is None:
+        _, statements = partition_ddl(ts_ms)
+        for sql, params in statements:
+            conn.execute(sql, params)
+        names = [row[0] for row in conn.execute('SELECT name FROM sht3x_partitions')]
+        for sql in compat_view_ddl(names):
+            conn.execute(sql)
+    return name
+
+def insert_readings_sync(conn, rows):
+    for name, group in group_by_partition(rows).items():
+        ensure_partition_sync(conn, group[0][1])
+        conn.executemany(f'INSERT INTO {name} {INSERT_COLUMNS} VALUES (?, ?, ?, ?)', group)
+
+def get_partitions_sync(conn, start_ms=None, end_ms=None):
+    query, params = partitions_query(start_ms, end_ms)
+    return [row[0] for row in conn.execute(query, params)]
+
+def drop_partition_sync(conn, name):
+    conn.execute(f'DROP TABLE IF EXISTS {name}')
+    conn.execute('DELETE FROM sht3x_partitions WHERE name = ?', (name,))
+    names = [row[0] for row in conn.execute('SELECT name FROM sht3x_partitions')]
+    for sql in compat_view_ddl(names):
+        conn.execute(sql)
+    forget_partition(name)
@@ -0,0 +1,87 @@
+import threading
+import numpy as np
+
+# Lecturas SHT3x recientes en memoria, por cliente.
+# Cada cliente tiene un buffer circular de tamano fijo respaldado por arrays de NumPy
+# (marca de tiempo, temperatura, humedad). Lo alimenta handle_sht3x_message en el hilo
+# del cliente MQTT y lo leen las vistas de Flask, por eso se protege con un threading.Lock.
+RECENT_BUFFER_SIZE = 512  # Lecturas guardadas por cliente
+
+class ReadingRing:
+    def __init__(self, capacity=RECENT_BUFFER_SIZE):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.int64)
+        self.temperatures = np.zeros(capacity, dtype=np.float64)
+        self.humidities = np.zeros(capacity, dtype=np.float64)
+        self.next = 0  # Posicion donde se escribira la siguiente lectura
+        self.count = 0
+
+    def append(self, ts_ms, temperature, humidity):
+        i = self.next
+        self.timestamps[i] = ts_ms
+        self.temperatures[i] = temperature
+        self.humidities[i] = humidity
+        self.next = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    # Indices de las n lecturas mas recientes, de la mas nueva a la mas antigua
+    def _latest_indices(self, n):
+        n = min(n, self.count)
+        return (self.next - 1 - np.arange(n)) % self.capacity
+
+    def latest(self, n):
+        idx = self._latest_indices(n)
+        return self.timestamps[idx], self.temperatures[idx], self.humidities[idx]
+
+class RecentReadings:
+    def __init__(self, capacity=RECENT_BUFFER_SIZE):
+        self.capacity = capacity
+        self._rings = {}
+        self._lock = threading.Lock()
+
+    def append(self, client_id, ts_ms, temperature, humidity):
+        with self._lock:
+            ring = self._rings.get(client_id)
+            if ring is None:
+                ring = self._rings[client_id] = ReadingRing(self.capacity)
+            ring.append(ts_ms, temperature, humidity)
+
+    # Ultimas n lecturas como dicts (mismo formato que las filas de la base de datos,
+    # sin id), o None si el buffer no tiene suficientes lecturas y hay que ir a SQLite
+    def latest(self, client_id, n):
+        with self._lock:
+            ring = self._rings.get(client_id)
+            if ring is None or n > ring.count:
+                return None
+            timestamps, temperatures, humidities = ring.latest(n)
+        return [
+            {"client_id": client_id, "timestamp": int(ts), "temperature": float(t), "humidity": float(h)}
+            for ts, t, h in zip(timestamps, temperatures, humidities)
+        ]
+
+    # Cargar lecturas de la base de datos (de la mas nueva a la mas antigua) en un buffer vacio,
+    # por ejemplo tras reiniciar el servidor. Si ya llegaron lecturas nuevas no se toca.
+    def seed(self, client_id, rows):
+        with self._lock:
+            if client_id in self._rings and self._rings[client_id].count > 0:
+                return False
+            ring = self._rings[client_id] = ReadingRing(self.capacity)
+            for row in reversed(rows[:self.capacity]):
+                ring.append(row['timestamp'], row['temperature'], row['humidity'])
+            return True
+
+    def count(self, client_id):
+        with self._lock:
+            ring = self._rings.get(client_id)
+            return ring.count if ring is not None else 0
+
+    def forget(self, client_id):
+        with self._lock:
+            self._rings.pop(client_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {client_id: ring.count for client_id, ring in self._rings.items()}
+
+# Instancia global compartida por el cliente MQTT y las rutas
+recent_readings = RecentReadings()
@@ -0,0 +1,308 @@
+import math
+from itertools import chain
+import numpy as np
+from .partitions import get_partitions, get_partitions_sync
+
+# Agregados de lecturas SHT3x por cliente y cubeta de 1 minuto y 1 hora.
+# Cada fila guarda count, suma, suma de cuadrados, minimo y maximo de temperatura y
+# humedad; con ellos se obtienen media, desviacion, minimo y maximo de cualquier rango
+# leyendo unos cientos de filas en lugar de todas las lecturas crudas.
+
+MINUTE_MS = 60 * 1000
+HOUR_MS = 60 * MINUTE_MS
+
+ROLLUP_TABLES = {
+    '1m': ('sht3x_rollup_1m', MINUTE_MS),
+    '1h': ('sht3x_rollup_1h', HOUR_MS)
+}
+
+ROLLUP_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        client_id TEXT NOT NULL,
+        bucket_ms INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        temp_sum REAL NOT NULL,
+        temp_sumsq REAL NOT NULL,
+        temp_min REAL NOT NULL,
+        temp_max REAL NOT NULL,
+        hum_sum REAL NOT NULL,
+        hum_sumsq REAL NOT NULL,
+        hum_min REAL NOT NULL,
+        hum_max REAL NOT NULL,
+        PRIMARY KEY (client_id, bucket_ms)
+    ) WITHOUT ROWID
+'''
+
+AGGREGATE_COLUMNS = 'count, temp_sum, temp_sumsq, temp_min, temp_max, hum_sum, hum_sumsq, hum_min, hum_max'
+
+UPSERT_SQL = '''
+    INSERT INTO {name} (client_id, bucket_ms, ''' + AGGREGATE_COLUMNS + ''')
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(client_id, bucket_ms) DO UPDATE SET
+        count = count + excluded.count,
+        temp_sum = temp_sum + excluded.temp_sum,
+        temp_sumsq = temp_sumsq + excluded.temp_sumsq,
+        temp_min = MIN(temp_min, excluded.temp_min),
+        temp_max = MAX(temp_max, excluded.temp_max),
+        hum_sum = hum_sum + excluded.hum_sum,
+        hum_sumsq = hum_sumsq + excluded.hum_sumsq,
+        hum_min = MIN(hum_min, excluded.hum_min),
+        hum_max = MAX(hum_max, excluded.hum_max)
+'''
+
+# Recalcular cubetas desde las lecturas crudas de una particion
+REBUILD_SQL = '''
+    INSERT INTO {name} (client_id, bucket_ms, ''' + AGGREGATE_COLUMNS + ''')
+    SELECT client_id, timestamp - (timestamp % {bucket}), COUNT(*),
+           SUM(temperature), SUM(temperature * temperature), MIN(temperature), MAX(temperature),
+           SUM(humidity), SUM(humidity * humidity), MIN(humidity), MAX(humidity)
+    FROM {partition}
+    WHERE timestamp >= ? AND timestamp < ?
+    GROUP BY client_id, timestamp - (timestamp % {bucket})
+    ON CONFLICT(client_id, bucket_ms) DO UPDATE SET
+        count = count + excluded.count,
+        temp_sum = temp_sum + excluded.temp_sum,
+        temp_sumsq = temp_sumsq + excluded.temp_sumsq,
+        temp_min = MIN(temp_min, excluded.temp_min),
+        temp_max = MAX(temp_max, excluded.temp_max),
+        hum_sum = hum_sum + excluded.hum_sum,
+        hum_sumsq = hum_sumsq + excluded.hum_sumsq,
+        hum_min = MIN(hum_min, excluded.hum_min),
+        hum_max = MAX(hum_max, excluded.hum_max)
+'''
+
+RAW_AGGREGATE_SQL = '''
+    SELECT COUNT(*), SUM(temperature), SUM(temperature * temperature), MIN(temperature), MAX(temperature),
+           SUM(humidity), SUM(humidity * humidity), MIN(humidity), MAX(humidity)
+    FROM {partition}
+    WHERE client_id = ? AND timestamp >= ? AND timestamp < ?
+'''
+
+ROLLUP_AGGREGATE_SQL = '''
+    SELECT SUM(count), SUM(temp_sum), SUM(temp_sumsq), MIN(temp_min), MAX(temp_max),
+           SUM(hum_sum), SUM(hum_sumsq), MIN(hum_min), MAX(hum_max)
+    FROM {name}
+    WHERE client_id = ? AND bucket_ms >= ? AND bucket_ms < ?
+'''
+
+# Variantes agrupadas por cliente (todas las salas en una sola consulta por tramo)
+RAW_FLEET_SQL = '''
+    SELECT client_id, COUNT(*), SUM(temperature), SUM(temperature * temperature), MIN(temperature), MAX(temperature),
+           SUM(humidity), SUM(humidity * humidity), MIN(humidity), MAX(humidity)
+    FROM {partition}
+    WHERE timestamp >= ? AND timestamp < ?
+    GROUP BY client_id
+'''
+
+ROLLUP_FLEET_SQL = '''
+    SELECT client_id, SUM(count), SUM(temp_sum), SUM(temp_sumsq), MIN(temp_min), MAX(temp_max),
+           SUM(hum_sum), SUM(hum_sumsq), MIN(hum_min), MAX(hum_max)
+    FROM {name}
+    WHERE bucket_ms >= ? AND bucket_ms < ?
+    GROUP BY client_id
+'''
+
+def floor_to(ts_ms, step):
+    return ts_ms - (ts_ms % step)
+
+def ceil_to(ts_ms, step):
+    return -((-ts_ms) // step) * step
+
+# Agregar un lote de lecturas (client_id, timestamp, temperature, humidity) por cubeta.
+# Devuelve {resolucion: [(client_id, bucket_ms, count, temp_sum, ...), ...]}
+def aggregate_readings(rows):
+    result = {}
+    for resolution, (_, step) in ROLLUP_TABLES.items():
+        buckets = {}
+        for client_id, ts_ms, temperature, humidity in rows:
+            key = (client_id, floor_to(ts_ms, step))
+            agg = buckets.get(key)
+            if agg is None:
+                buckets[key] = [1, temperature, temperature * temperature, temperature, temperature,
+                                humidity, humidity * humidity, humidity, humidity]
+            else:
+                agg[0] += 1
+                agg[1] += temperature
+                agg[2] += temperature * temperature
+                agg[3] = min(agg[3], temperature)
+                agg[4] = max(agg[4], temperature)
+                agg[5] += humidity
+                agg[6] += humidity * humidity
+                agg[7] = min(agg[7], humidity)
+                agg[8] = max(agg[8], humidity)
+        result[resolution] = [(client_id, bucket, *agg) for (client_id, bucket), agg in buckets.items()]
+    return result
+
+# Combinar varias tuplas de agregados (count, temp_sum, ..., hum_max) en una sola
+def merge_aggregates(parts):
+    total = [0, 0.0, 0.0, None, None, 0.0, 0.0, None, None]
+    for part in parts:
+        if not part or not part[0]:
+            continue
+        total[0] += part[0]
+        total[1] += part[1]
+        total[2] += part[2]
+        total[5] += part[5]
+        total[6] += part[6]
+        for index, pick in ((3, min), (4, max), (7, min), (8, max)):
+            total[index] = part[index] if total[index] is None else pick(total[index], part[index])
+    return tuple(total)
+
+# Convertir agregados en estadisticas (desviacion estandar poblacional, como np.std)
+def summarize_aggregates(agg):
+    def describe(count, total, total_sq, minimum, maximum):
+        if not count:
+            return {"count": 0, "mean": 0, "min": 0, "max": 0, "std_dev": 0}
+        mean = total / count
+        variance = max(total_sq / count - mean * mean, 0.0)
+        return {
+            "count": count,
+            "mean": float(mean),
+            "min": float(minimum),
+            "max": float(maximum),
+            "std_dev": float(math.sqrt(variance))
+        }
+    return {
+        "temperature": describe(agg[0], agg[1], agg[2], agg[3], agg[4]),
+        "humidity": describe(agg[0], agg[5], agg[6], agg[7], agg[8])
+    }
+
+# Dividir [start_ms, end_ms) en tramos cubiertos por horas completas, minutos completos y
+# lecturas crudas en los bordes, para que el resultado sea exacto
+def split_range(start_ms, end_ms):
+    segments = []
+    minute_start, minute_end = ceil_to(start_ms, MINUTE_MS), floor_to(end_ms, MINUTE_MS)
+    if minute_start >= minute_end:
+        return [('raw', start_ms, end_ms)] if start_ms < end_ms else []
+    hour_start, hour_end = ceil_to(start_ms, HOUR_MS), floor_to(end_ms, HOUR_MS)
+    segments.append(('raw', start_ms, minute_start))
+    if hour_start < hour_end:
+        segments.append(('1m', minute_start, hour_start))
+        segments.append(('1h', hour_start, hour_end))
+        segments.append(('1m', hour_end, minute_end))
+    else:
+        segments.append(('1m', minute_start, minute_end))
+    segments.append(('raw', minute_end, end_ms))
+    return [segment for segment in segments if segment[1] < segment[2]]
+
+# --- Acceso asincrono (conexiones aiosqlite del pool) ---
+
+# Actualizar las cubetas con un lote de lecturas (no hace commit, va en la transaccion de la ingesta)
+async def apply_rollups(conn, rows):
+    for resolution, values in aggregate_readings(rows).items():
+        await conn.executemany(UPSERT_SQL.format(name=ROLLUP_TABLES[resolution][0]), values)
+
+# Agregados exactos de un cliente en [start_ms, end_ms]
+async def get_range_aggregates(conn, client_id, start_ms, end_ms):
+    parts = []
+    for source, lo, hi in split_range(start_ms, end_ms + 1):
+        if source == 'raw':
+            for partition in await get_partitions(conn, lo, hi):
+                async with conn.execute(RAW_AGGREGATE_SQL.format(partition=partition), (client_id, lo, hi)) as cursor:
+                    parts.append(tuple(await cursor.fetchone()))
+        else:
+            query = ROLLUP_AGGREGATE_SQL.format(name=ROLLUP_TABLES[source][0])
+            async with conn.execute(query, (client_id, lo, hi)) as cursor:
+                parts.append(tuple(await cursor.fetchone()))
+    return merge_aggregates(parts)
+
+# Agregados exactos de todos los clientes en [start_ms, end_ms].
+# Devuelve (lista de client_id, array (n, 9) con count, temp_sum, ..., hum_max por cliente);
+# los tramos se combinan con np.add.at / np.minimum.at / np.maximum.at.
+async def get_fleet_aggregates(conn, start_ms, end_ms):
+    rows = []
+    for source, lo, hi in split_range(start_ms, end_ms + 1):
+        if source == 'raw':
+            queries = [RAW_FLEET_SQL.format(partition=partition) for partition in await get_partitions(conn, lo, hi)]
+        else:
+            queries = [ROLLUP_FLEET_SQL.format(name=ROLLUP_TABLES[source][0])]
+        for query in queries:
+            async with conn.execute(query, (lo, hi)) as cursor:
+                cursor.row_factory = None
+                rows.extend(await cursor.fetchall())
+    if not rows:
+        return [], np.empty((0, 9))
+    client_ids, index = np.unique([row[0] for row in rows], return_inverse=True)
+    values = np.array([row[1:] for row in rows], dtype=np.float64)
+    result = np.zeros((len(client_ids), 9))
+    result[:, [3, 7]] = np.inf
+    result[:, [4, 8]] = -np.inf
+    for column in (0, 1, 2, 5, 6):  # count y sumas
+        np.add.at(result[:, column], index, values[:, column])
+    for column in (3, 7):
+        np.minimum.at(result[:, column], index, values[:, column])
+    for column in (4, 8):
+        np.maximum.at(result[:, column], index, values[:, column])
+    return client_ids.tolist(), result
+
+# Cubetas de un cliente con inicio en [start_ms, end_ms] como array (n, 8):
+# bucket_ms, count, temp_sum, temp_min, temp_max, hum_sum, hum_min, hum_max
+async def get_rollup_buckets(conn, client_id, resolution, start_ms, end_ms):
+    name, step = ROLLUP_TABLES[resolution]
+    query = f'''
+        SELECT bucket_ms, count, temp_sum, temp_min, temp_max, hum_sum, hum_min, hum_max
+        FROM {name}
+        WHERE client_id = ? AND bucket_ms >= ? AND bucket_ms <= ?
+        ORDER BY bucket_ms
+    '''
+    async with conn.execute(query, (client_id, floor_to(start_ms, step), end_ms)) as cursor:
+        cursor.row_factory = None
+        rows = await cursor.fetchall()
+    return np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=8 * len(rows)).reshape(-1, 8)
+
+async def delete_client_rollups(conn, client_id):
+    for name, _ in ROLLUP_TABLES.values():
+        await conn.execute(f'DELETE FROM {name} WHERE client_id = ?', (client_id,))
+
+# --- Acceso sincrono (sqlite3: database.py, MSAD y linea de comandos) ---
+
+def create_rollup_tables_sync(conn):
+    for name, _ in ROLLUP_TABLES.values():
+        conn.execute(ROLLUP_SCHEMA.format(name=name))
+
+def apply_rollups_sync(conn, rows):
+    for resolution, values in aggregate_readings(rows).items():
+        conn.executemany(UPSERT_SQL.format(name=ROLLUP_TABLES[resolution][0]), values)
+
+# Reconstruir las cubetas de [start_ms, end_ms) desde las lecturas crudas.
+# Cada particion se procesa en su propia transaccion IMMEDIATE, de modo que la ingesta
+# no puede escribir entre el borrado y el recalculo de sus cubetas.
+def rebuild_rollups_sync(conn, start_ms=None, end_ms=None):
+    create_rollup_tables_sync(conn)
+    rebuilt = 0
+    for partition in get_partitions_sync(conn, start_ms, end_ms):
+        bounds = conn.execute(
+            'SELECT start_ms, end_ms FROM sht3x_partitions WHERE name = ?', (partition,)
+        ).fetchone()
+        lo = floor_to(bounds[0] if start_ms is None else max(bounds[0], start_ms), HOUR_MS)
+        hi = ceil_to(bounds[1] if end_ms is None else min(bounds[1], end_ms), HOUR_MS)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for name, bucket in ROLLUP_TABLES.values():
+                conn.execute(f'DELETE FROM {name} WHERE bucket_ms >= ? AND bucket_ms < ?', (lo, hi))
+                conn.execute(REBUILD_SQL.format(name=name, bucket=bucket, partition=partition), (lo, hi))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        rebuilt += 1
+        print(f"Agregados de {partition} reconstruidos")
+    return rebuilt
+
+if __name__ == '__main__':
+    # Uso: python -m models.rollups [dias]
+    # Reconstruye los agregados de los ultimos N dias (o de todo el historico sin argumento)
+    import sys
+    import sqlite3
+    from db_config import DB_PATH, apply_storage_profile
+    from .timestamps import now_ms
+
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    start = now_ms() - days * 24 * HOUR_MS if days else None
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    apply_storage_profile(conn)
+    try:
+        count = rebuild_rollups_sync(conn, start, None)
+        print(f"Agregados reconstruidos en {count} particiones")
+    finally:
+        conn.close()
@@ -3,27 +3,30 @@ from datetime import datetime
 import time
 import asyncio
 import functools
+from itertools import chain
+import numpy as np
 from typing import Dict, Any, Optional, List, Tuple
+from .db_pool import db_connection, close_pool
+from .partitions import insert_readings, get_partitions, build_union_query
+from .rollups import apply_rollups
+from .sketches import apply_sketches
+from .compliance import apply_compliance
+from .cursors import decode_cursor, next_cursor
+from .node_config import publish_node_config
 
 # Caché para parámetros ideales
 _ideal_params_cache: Dict[Tuple[str, str], Dict[str, Any]] = {}
 _cache_expiry: Dict[Tuple[str, str], float] = {}
 CACHE_DURATION = 60  # Duración de la caché en segundos
 
-# Conectar a la base de datos
-async def get_db_connection():
-    conn = await aiosqlite.connect('/home/stevpi/Desktop/raspServer/sensor_data.db')
-    conn.row_factory = aiosqlite.Row
-    return conn
-
-async def execute_query_with_retry(query, params=(), retries=5, delay=1):
+# Con WAL y busy_timeout los bloqueos son raros; el reintento es solo una red de seguridad
+async def execute_query_with_retry(query, params=(), retries=5, delay=0.1):
     for attempt in range(retries):
         try:
-            conn = await get_db_connection()
-            async with conn.execute(query, params) as cursor:
-                result = await cursor.fetchall()
-            await conn.commit()
-            await conn.close()
+            async with db_connection() as conn:
+                async with conn.execute(query, params) as cursor:
+                    result = await cursor.fetchall()
+                await conn.commit()
             return result
         except aiosqlite.OperationalError as e:
             if "database is locked" in str(e) and attempt < retries - 1:
@@ -31,13 +34,12 @@ async def execute_query_with_retry(query, params=(), retries=5, delay=1):
             else:
                 raise
 
-async def execute_write_query_with_retry(query, params=(), retries=5, delay=1):
+async def execute_write_query_with_retry(query, params=(), retries=5, delay=0.1):
     for attempt in range(retries):
         try:
-            conn = await get_db_connection()
-            await conn.execute(query, params)
-            await conn.commit()
-            await conn.close()
+            async with db_connection() as conn:
+                await conn.execute(query, params)
+                await conn.commit()
             return
         except aiosqlite.OperationalError as e:
             if "database is locked" in str(e) and attempt < retries - 1:
@@ -45,58 +47,105 @@ async def execute_write_query_with_retry(query, params=(), retries=5, delay=1):
             else:
                 raise
 
-# Función para agrupar múltiples inserciones
+# Función para agrupar múltiples inserciones (enrutadas a la partición mensual de cada lectura).
+# Los agregados de 1 minuto y 1 hora, los histogramas diarios y los contadores de cumplimiento
+# se actualizan en la misma transacción.
 async def batch_insert_sht3x_data(data_list):
     if not data_list:
         return
     
-    conn = await get_db_connection()
-    try:
-        await conn.executemany(
-            'INSERT INTO sht3x_data (client_id, timestamp, temperature, humidity) VALUES (?, ?, ?, ?)',
-            data_list
-        )
+    # Parámetros ideales (caché) antes de tomar la conexión de escritura
+    limits = await get_compliance_limits({row[0] for row in data_list})
+    async with db_connection() as conn:
+        await insert_readings(conn, data_list)
+        await apply_rollups(conn, data_list)
+        await apply_sketches(conn, data_list)
+        await apply_compliance(conn, data_list, limits)
         await conn.commit()
-    finally:
-        await conn.close()
 
-# Buffer para acumular datos antes de inserción
-_sht3x_buffer: List[Tuple[str, str, float, float]] = []
-_last_flush_time = time.time()
-MAX_BUFFER_SIZE = 10
-MAX_BUFFER_TIME = 5  # segundos
-
-# Guardar datos del sht3x en la base de datos (con buffer)
-async def save_sht3x_data(client_id, temperature, humidity):
-    global _sht3x_buffer, _last_flush_time
-    
-    timestamp = datetime.now().isoformat()
-    _sht3x_buffer.append((client_id, timestamp, temperature, humidity))
-    
-    current_time = time.time()
-    should_flush = (
-        len(_sht3x_buffer) >= MAX_BUFFER_SIZE or 
-        current_time - _last_flush_time > MAX_BUFFER_TIME
-    )
-    
-    if should_flush:
-        buffer_copy = _sht3x_buffer.copy()
-        _sht3x_buffer = []
-        _last_flush_time = current_time
-        await batch_insert_sht3x_data(buffer_copy)
-
-# Obtener todos los datos de sht3x desde la base de datos
+# Obtener todos los datos de sht3x desde la base de datos.
+# Recorre las particiones de la más reciente a la más antigua y salta las que quedan
+# completas dentro del offset, por lo que solo lee las particiones de la página pedida.
 async def get_all_sht3x_data(client_id, page, page_size):
-    query = '''
-        SELECT * FROM sht3x_data 
-        WHERE client_id = ? 
-        ORDER BY timestamp DESC 
-        LIMIT ? OFFSET ?
-    '''
-    params = (client_id, page_size, (page - 1) * page_size)
-    result = await execute_query_with_retry(query, params)
+    offset = (page - 1) * page_size
+    result = []
+    async with db_connection() as conn:
+        for name in await get_partitions(conn):
+            if offset > 0:
+                async with conn.execute(f'SELECT COUNT(*) FROM {name} WHERE client_id = ?', (client_id,)) as cursor:
+                    count = (await cursor.fetchone())[0]
+                if count <= offset:
+                    offset -= count
+                    continue
+            query = f'''
+                SELECT * FROM {name} 
+                WHERE client_id = ? 
+                ORDER BY timestamp DESC 
+                LIMIT ? OFFSET ?
+            '''
+            async with conn.execute(query, (client_id, page_size - len(result), offset)) as cursor:
+                result.extend(await cursor.fetchall())
+            offset = 0
+            if len(result) >= page_size:
+                break
     return result
 
+# Obtener una pagina de datos de sht3x por cursor (timestamp, id), de la mas reciente a la mas antigua.
+# Solo se recorren las particiones que empiezan antes del cursor y cada consulta parte del
+# indice (client_id, timestamp), sin filas saltadas. Devuelve (filas, cursor siguiente).
+async def get_sht3x_data_page(client_id, page_size, cursor_token=None):
+    position = decode_cursor(cursor_token) if cursor_token else None
+    result = []
+    async with db_connection() as conn:
+        for name in await get_partitions(conn, None, position[0] if position else None):
+            if position:
+                query = f'''
+                    SELECT * FROM {name}
+                    WHERE client_id = ? AND (timestamp, id) < (?, ?)
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT ?
+                '''
+                params = (client_id, position[0], position[1], page_size - len(result))
+            else:
+                query = f'''
+                    SELECT * FROM {name}
+                    WHERE client_id = ?
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT ?
+                '''
+                params = (client_id, page_size - len(result))
+            async with conn.execute(query, params) as cursor:
+                result.extend(await cursor.fetchall())
+            if len(result) >= page_size:
+                break
+    return result, next_cursor(result, page_size)
+
+# Obtener las lecturas de [start_ms, end_ms] ordenadas por tiempo como array (n, 3):
+# timestamp, temperature, humidity. Las filas se leen por bloques de RANGE_FETCH_CHUNK_SIZE y
+# cada bloque se copia con np.fromiter, sin tener todo el rango en memoria como tuplas.
+RANGE_FETCH_CHUNK_SIZE = 50000  # Filas leidas por fetchmany en get_sht3x_range_array
+
+async def get_sht3x_range_array(client_id, start_ms, end_ms):
+    async with db_connection() as conn:
+        partitions = await get_partitions(conn, start_ms, end_ms)
+        if not partitions:
+            return np.empty((0, 3))
+        query, params = build_union_query(
+            partitions, "timestamp, temperature, humidity",
+            "client_id = ? AND timestamp BETWEEN ? AND ?",
+            (client_id, start_ms, end_ms),
+            order_by="timestamp"
+        )
+        chunks = []
+        async with conn.execute(query, params) as cursor:
+            cursor.row_factory = None
+            while True:
+                rows = await cursor.fetchmany(RANGE_FETCH_CHUNK_SIZE)
+                if not rows:
+                    break
+                chunks.append(np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=3 * len(rows)).reshape(-1, 3))
+    return np.concatenate(chunks) if chunks else np.empty((0, 3))
+
 # Obtener parametros ideales desde la base de datos (con caché)
 async def get_ideal_params(client_id, param_type):
     cache_key = (client_id, param_type)
@@ -122,6 +171,16 @@ async def get_ideal_params(client_id, param_type):
         return _ideal_params_cache[cache_key]
     return None
 
+# Limites (temp_min, temp_max, hum_min, hum_max) de cada cliente desde la caché de parametros ideales
+async def get_compliance_limits(client_ids):
+    limits = {}
+    for client_id in client_ids:
+        temp = await get_ideal_params(client_id, 'temperatura')
+        hum = await get_ideal_params(client_id, 'humedad')
+        if temp and hum:
+            limits[client_id] = (temp['min_value'], temp['max_value'], hum['min_value'], hum['max_value'])
+    return limits
+
 # Actualizar parametros ideales en la base de datos (y caché)
 async def update_ideal_params(client_id, param_type, min_value, max_value):
     # Actualizar en la base de datos
@@ -144,9 +203,11 @@ async def update_ideal_params(client_id, param_type, min_value, max_value):
         'timestamp': timestamp
     }
     _cache_expiry[cache_key] = time.time() + CACHE_DURATION
+    
+    # Publicar la configuracion retenida para el control local del nodo
+    await publish_node_config(client_id)
 
-# Limpiar buffer y cerrar conexiones antes de salir
+# Cerrar conexiones antes de salir (la ingesta vacia su cola al detener el cliente MQTT)
 async def cleanup():
-    if _sht3x_buffer:
-        await batch_insert_sht3x_data(_sht3x_buffer.copy())
-        _sht3x_buffer.clear()
+    await close_pool()
+
@@ -0,0 +1,207 @@
+from collections import defaultdict
+from itertools import chain
+import numpy as np
+from .partitions import get_partitions, get_partitions_sync, build_union_query
+from .rollups import HOUR_MS, floor_to, ceil_to
+
+# Histogramas diarios de temperatura y humedad por cliente para percentiles aproximados.
+# Cada dia (UTC) guarda, por variable, el conteo de lecturas en clases de ancho fijo
+# (SKETCH_BIN_WIDTH, muy por debajo de la precision del SHT3x). Se combinan sumando conteos,
+# asi que los percentiles de cualquier rango salen de sumar unos pocos dias de histogramas
+# (mas las lecturas crudas de los dias incompletos de los extremos) con memoria acotada.
+# El error de un percentil es como mucho medio ancho de clase.
+
+DAY_MS = 24 * HOUR_MS
+SKETCH_TABLE = 'sht3x_sketch_1d'
+SKETCH_BIN_WIDTH = {"temperature": 0.1, "humidity": 0.1}
+DEFAULT_PERCENTILES = (5, 50, 95)
+
+SKETCH_SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS {SKETCH_TABLE} (
+        client_id TEXT NOT NULL,
+        day_ms INTEGER NOT NULL,
+        temp_lo INTEGER NOT NULL,
+        temp_bins BLOB NOT NULL,
+        hum_lo INTEGER NOT NULL,
+        hum_bins BLOB NOT NULL,
+        PRIMARY KEY (client_id, day_ms)
+    ) WITHOUT ROWID
+'''
+
+UPSERT_SQL = f'''
+    INSERT OR REPLACE INTO {SKETCH_TABLE} (client_id, day_ms, temp_lo, temp_bins, hum_lo, hum_bins)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+# Histograma disperso: indice de la primera clase y conteos consecutivos desde ella
+class Histogram:
+    __slots__ = ('lo', 'counts', 'width')
+
+    def __init__(self, width, lo=0, counts=None):
+        self.width = width
+        self.lo = lo
+        self.counts = counts if counts is not None else np.zeros(0, dtype=np.int64)
+
+    @classmethod
+    def from_values(cls, values, width):
+        values = np.asarray(values, dtype=np.float64)
+        if values.size == 0:
+            return cls(width)
+        bins = np.floor(values / width + 1e-9).astype(np.int64)
+        lo = int(bins.min())
+        return cls(width, lo, np.bincount(bins - lo))
+
+    @classmethod
+    def from_blob(cls, width, lo, blob):
+        return cls(width, lo, np.frombuffer(blob, dtype='<u4').astype(np.int64))
+
+    def to_blob(self):
+        return self.counts.astype('<u4').tobytes()
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    # Combinar varios histogramas del mismo ancho en uno
+    @classmethod
+    def merge(cls, width, histograms):
+        histograms = [h for h in histograms if h.counts.size]
+        if not histograms:
+            return cls(width)
+        lo = min(h.lo for h in histograms)
+        hi = max(h.lo + h.counts.size for h in histograms)
+        counts = np.zeros(hi - lo, dtype=np.int64)
+        for h in histograms:
+            counts[h.lo - lo:h.lo - lo + h.counts.size] += h.counts
+        return cls(width, lo, counts)
+
+    # Percentiles (0-100) como centro de la clase que contiene cada rango
+    def percentiles(self, qs):
+        total = self.total
+        if total == 0:
+            return {f"p{q:g}": 0 for q in qs}
+        cumulative = np.cumsum(self.counts)
+        ranks = np.clip(np.asarray(qs, dtype=np.float64) / 100 * (total - 1), 0, total - 1)
+        positions = np.searchsorted(cumulative, ranks, side='right')
+        values = (self.lo + positions + 0.5) * self.width
+        return {f"p{q:g}": round(float(value), 3) for q, value in zip(qs, values)}
+
+    # Moda como centro de la clase mas poblada agrupando las clases en clases de ancho
+    # width (multiplo del ancho del histograma)
+    def mode(self, width):
+        if self.total == 0:
+            return 0
+        factor = max(int(round(width / self.width)), 1)
+        groups = (self.lo + np.arange(self.counts.size)) // factor
+        first = int(groups[0])
+        grouped = np.bincount(groups - first, weights=self.counts)
+        return round(float((first + grouped.argmax() + 0.5) * factor * self.width), 3)
+
+# Histogramas (temperatura, humedad) por (cliente, dia) de un lote de lecturas
+def build_day_histograms(rows):
+    groups = defaultdict(list)
+    for client_id, ts_ms, temperature, humidity in rows:
+        groups[(client_id, floor_to(ts_ms, DAY_MS))].append((temperature, humidity))
+    result = {}
+    for key, values in groups.items():
+        data = np.array(values, dtype=np.float64)
+        result[key] = (
+            Histogram.from_values(data[:, 0], SKETCH_BIN_WIDTH["temperature"]),
+            Histogram.from_values(data[:, 1], SKETCH_BIN_WIDTH["humidity"])
+        )
+    return result
+
+def _decode(row):
+    return (
+        Histogram.from_blob(SKETCH_BIN_WIDTH["temperature"], row[0], row[1]),
+        Histogram.from_blob(SKETCH_BIN_WIDTH["humidity"], row[2], row[3])
+    )
+
+def _merged_row(client_id, day_ms, existing, added):
+    temp = Histogram.merge(SKETCH_BIN_WIDTH["temperature"], [existing[0], added[0]] if existing else [added[0]])
+    hum = Histogram.merge(SKETCH_BIN_WIDTH["humidity"], [existing[1], added[1]] if existing else [added[1]])
+    return (client_id, day_ms, temp.lo, temp.to_blob(), hum.lo, hum.to_blob())
+
+SELECT_DAY_SQL = f'SELECT temp_lo, temp_bins, hum_lo, hum_bins FROM {SKETCH_TABLE} WHERE client_id = ? AND day_ms = ?'
+
+# --- Acceso asincrono (conexiones aiosqlite del pool) ---
+
+# Sumar un lote de lecturas a los histogramas de su dia (no hace commit, va en la transaccion de la ingesta)
+async def apply_sketches(conn, rows):
+    values = []
+    for (client_id, day_ms), added in build_day_histograms(rows).items():
+        async with conn.execute(SELECT_DAY_SQL, (client_id, day_ms)) as cursor:
+            row = await cursor.fetchone()
+        values.append(_merged_row(client_id, day_ms, _decode(row) if row else None, added))
+    await conn.executemany(UPSERT_SQL, values)
+
+# Histogramas de un cliente en [start_ms, end_ms]: dias completos desde la tabla de
+# histogramas y lecturas crudas para los dias incompletos de los extremos
+async def get_range_histograms(conn, client_id, start_ms, end_ms):
+    parts = []
+    day_start, day_end = ceil_to(start_ms, DAY_MS), floor_to(end_ms + 1, DAY_MS)
+    if day_start < day_end:
+        async with conn.execute(
+            f'SELECT temp_lo, temp_bins, hum_lo, hum_bins FROM {SKETCH_TABLE} '
+            'WHERE client_id = ? AND day_ms >= ? AND day_ms < ?',
+            (client_id, day_start, day_end)
+        ) as cursor:
+            cursor.row_factory = None
+            parts.extend(_decode(row) for row in await cursor.fetchall())
+        edges = [(start_ms, day_start - 1), (day_end, end_ms)]
+    else:
+        edges = [(start_ms, end_ms)]
+
+    for lo, hi in edges:
+        if lo > hi:
+            continue
+        partitions = await get_partitions(conn, lo, hi)
+        if not partitions:
+            continue
+        query, params = build_union_query(
+            partitions, "temperature, humidity", "client_id = ? AND timestamp BETWEEN ? AND ?", (client_id, lo, hi)
+        )
+        async with conn.execute(query, params) as cursor:
+            cursor.row_factory = None
+            rows = await cursor.fetchall()
+        data = np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=2 * len(rows)).reshape(-1, 2)
+        parts.append((
+            Histogram.from_values(data[:, 0], SKETCH_BIN_WIDTH["temperature"]),
+            Histogram.from_values(data[:, 1], SKETCH_BIN_WIDTH["humidity"])
+        ))
+    return (
+        Histogram.merge(SKETCH_BIN_WIDTH["temperature"], [part[0] for part in parts]),
+        Histogram.merge(SKETCH_BIN_WIDTH["humidity"], [part[1] for part in parts])
+    )
+
+async def delete_client_sketches(conn, client_id):
+    await conn.execute(f'DELETE FROM {SKETCH_TABLE} WHERE client_id = ?', (client_id,))
+
+# --- Acceso sincrono (sqlite3: database.py y MSAD) ---
+
+def create_sketch_table_sync(conn):
+    conn.execute(SKETCH_SCHEMA)
+
+def apply_sketches_sync(conn, rows):
+    values = []
+    for (client_id, day_ms), added in build_day_histograms(rows).items():
+        row = conn.execute(SELECT_DAY_SQL, (client_id, day_ms)).fetchone()
+        values.append(_merged_row(client_id, day_ms, _decode(row) if row else None, added))
+    conn.executemany(UPSERT_SQL, values)
+
+# Reconstruir todos los histogramas diarios desde las lecturas crudas en una transaccion
+# IMMEDIATE. Las particiones son meses locales y los dias son UTC, asi que un dia puede
+# repartirse entre dos particiones: se suman particion a particion sobre la tabla vacia.
+def rebuild_sketches_sync(conn):
+    create_sketch_table_sync(conn)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(f'DELETE FROM {SKETCH_TABLE}')
+        for partition in get_partitions_sync(conn):
+            rows = conn.execute(f'SELECT client_id, timestamp, temperature, humidity FROM {partition}').fetchall()
+            apply_sketches_sync(conn, rows)
+            print(f"Histogramas diarios de {partition} reconstruidos")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
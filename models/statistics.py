@@ -1,7 +1,83 @@
 import numpy as np
 from datetime import datetime, timedelta
-from collections import Counter
-from models.sensor_data import execute_query_with_retry
+from itertools import chain
+from models.timestamps import to_epoch_ms, now_ms, ms_to_iso, from_epoch_ms, utc_offset_ms
+from models.db_pool import db_connection
+from models.partitions import get_partitions, build_union_query
+from models.rollups import get_range_aggregates, summarize_aggregates, get_rollup_buckets, get_fleet_aggregates
+from models.stream_stats import streaming_stats
+from models.sketches import get_range_histograms
+from models.compliance import get_compliance
+
+# count, media, min, max y desviacion de una ventana y su rango [inicio, fin] en ms.
+# Las ventanas del dashboard (1/7/30 dias) salen de los acumuladores en streaming en tiempo
+# constante (alineadas a la hora); el resto se calcula con los agregados de 1 minuto/1 hora.
+async def _window_moments(conn, client_id, days):
+    end_ms = now_ms()
+    streamed = streaming_stats.get(client_id, days)
+    if streamed is not None:
+        summary, start_ms = streamed
+        return summary, start_ms, end_ms
+    start_ms = to_epoch_ms(datetime.now() - timedelta(days=days))
+    summary = summarize_aggregates(await get_range_aggregates(conn, client_id, start_ms, end_ms))
+    return summary, start_ms, end_ms
+
+# Ancho de las clases del histograma para la moda (los valores son continuos, asi que la
+# moda es el centro de la clase mas poblada y no el valor flotante mas repetido)
+MODE_BIN_WIDTH = {"temperature": 0.1, "humidity": 0.5}
+FETCH_CHUNK_SIZE = 50000  # Filas leidas por fetchmany al cargar las columnas
+
+# Cargar temperatura y humedad de [start_ms, end_ms] en un unico array (n, 2).
+# Las filas se leen como tuplas (sin aiosqlite.Row) por bloques y se copian con np.fromiter
+# a un buffer reservado con el count conocido de los agregados.
+async def _load_columns(conn, client_id, start_ms, end_ms, expected):
+    partitions = await get_partitions(conn, start_ms, end_ms)
+    if not partitions:
+        return np.empty((0, 2))
+    query, params = build_union_query(
+        partitions, "temperature, humidity",
+        "client_id = ? AND timestamp BETWEEN ? AND ?",
+        (client_id, start_ms, end_ms)
+    )
+    data = np.empty((max(expected, 1), 2))
+    filled = 0
+    async with conn.execute(query, params) as cursor:
+        cursor.row_factory = None
+        while True:
+            rows = await cursor.fetchmany(FETCH_CHUNK_SIZE)
+            if not rows:
+                break
+            chunk = np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=2 * len(rows)).reshape(-1, 2)
+            if filled + len(chunk) > len(data):
+                # Llegaron lecturas despues de calcular los agregados
+                data = np.resize(data, (filled + len(chunk), 2))
+            data[filled:filled + len(chunk)] = chunk
+            filled += len(chunk)
+    return data[:filled]
+
+# Mediana y moda de una variable a partir de su histograma (ventanas del dashboard)
+def _histogram_center_stats(histogram, metric):
+    return {
+        "median": histogram.percentiles([50])["p50"],
+        "mode": histogram.mode(MODE_BIN_WIDTH[metric])
+    }
+
+# Mediana y moda de una variable a partir de los valores crudos
+def _raw_center_stats(values, metric):
+    if values.size == 0:
+        return {"median": 0, "mode": 0}
+    return {
+        "median": float(np.median(values)),
+        "mode": binned_mode(values, MODE_BIN_WIDTH[metric])
+    }
+
+# Moda agrupando los valores en clases de ancho fijo
+def binned_mode(values, width):
+    if values.size == 0:
+        return 0
+    low = values.min()
+    bins = np.floor((values - low) / width).astype(np.int64)
+    return float(low + (np.bincount(bins).argmax() + 0.5) * width)
 
 async def get_sht3x_statistics(client_id, days=7):
     """
@@ -12,54 +88,256 @@ async def get_sht3x_statistics(client_id, days=7):
     Returns:
         Diccionario con estadisticas de temperatura y humedad
     """
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=days)
-
-    query = """
-        SELECT temperature, humidity
-        FROM sht3x_data
-        WHERE client_id = ? AND timestamp BETWEEN ? AND ?
-        ORDER BY timestamp DESC
-    """
-    params = (client_id, start_date.isoformat(), end_date.isoformat())
-    result = await execute_query_with_retry(query, params)
-    if not result:
-        return {
-            "temperature": {
-                "count": 0,
-                "mean": 0,
-                "median": 0,
-                "mode": 0,
-                "min": 0,
-                "max": 0,
-                "std_dev": 0
-            },
-            "humidity": {
-                "count": 0,
-                "mean": 0,
-                "median": 0,
-                "mode": 0,
-                "min": 0,
-                "max": 0,
-                "std_dev": 0
+    async with db_connection() as conn:
+        # count, media, min, max y desviacion salen de los acumuladores o de los agregados SQL
+        summary, start_ms, end_ms = await _window_moments(conn, client_id, days)
+        count = summary["temperature"]["count"]
+        if count == 0:
+            return {
+                metric: {"count": 0, "mean": 0, "median": 0, "mode": 0, "min": 0, "max": 0, "std_dev": 0}
+                for metric in ("temperature", "humidity")
+            }
+        if streaming_stats.supports(days):
+            # Ventanas del dashboard: mediana y moda de los histogramas diarios; solo se leen
+            # crudos los dias incompletos de los extremos, sea la ventana de 1 o de 30 dias
+            temp_hist, hum_hist = await get_range_histograms(conn, client_id, start_ms, end_ms)
+            centers = {
+                "temperature": _histogram_center_stats(temp_hist, "temperature"),
+                "humidity": _histogram_center_stats(hum_hist, "humidity")
             }
+        else:
+            # Otras ventanas: mediana y moda exactas con los valores crudos
+            data = await _load_columns(conn, client_id, start_ms, end_ms, count)
+            centers = {
+                "temperature": _raw_center_stats(data[:, 0], "temperature"),
+                "humidity": _raw_center_stats(data[:, 1], "humidity")
+            }
+    def calculate_stats(moments, metric):
+        """Completa los agregados con la mediana y la moda"""
+        return {
+            "count": moments["count"],
+            "mean": moments["mean"],
+            "median": centers[metric]["median"],
+            "mode": centers[metric]["mode"],
+            "min": moments["min"],
+            "max": moments["max"],
+            "std_dev": moments["std_dev"]
         }
-    # Extraer datos usando numpy para mejor rendimiento
-    data = np.array([(row['temperature'], row['humidity']) for row in result])
-    temperatures = data[:, 0]
-    humidity_values = data[:, 1]
-    def calculate_stats(values):
-        """Calcula todas las estadisticas para un conjunto de valores"""
+    return {
+        "temperature": calculate_stats(summary["temperature"], "temperature"),
+        "humidity": calculate_stats(summary["humidity"], "humidity")
+    }
+
+async def get_sht3x_summary(client_id, days=7, percentiles=None):
+    """
+    Obtiene count, media, min, max y desviacion estandar de los ultimos dias desde los
+    acumuladores en streaming o los agregados de 1 minuto y 1 hora (sin leer las lecturas crudas)
+    Args:
+        client_id: ID del cliente
+        days: Cantidad de dias hacia atras para analizar (por defecto 7)
+        percentiles: Lista de percentiles (0-100) aproximados con los histogramas diarios
+    Returns:
+        Diccionario con estadisticas de temperatura y humedad
+    """
+    async with db_connection() as conn:
+        summary, start_ms, end_ms = await _window_moments(conn, client_id, days)
+        if percentiles:
+            temp_hist, hum_hist = await get_range_histograms(conn, client_id, start_ms, end_ms)
+            summary["temperature"]["percentiles"] = temp_hist.percentiles(percentiles)
+            summary["humidity"]["percentiles"] = hum_hist.percentiles(percentiles)
+    return summary
+
+async def get_fleet_statistics(days=7):
+    """
+    Obtiene count, media, min, max y desviacion de todos los clientes en una sola pasada
+    (consultas agrupadas por cliente sobre los agregados y calculo vectorizado con NumPy)
+    Args:
+        days: Cantidad de dias hacia atras para analizar (por defecto 7)
+    Returns:
+        Diccionario con el resumen de la flota y las estadisticas de cada cliente
+    """
+    end_ms = now_ms()
+    start_ms = to_epoch_ms(datetime.now() - timedelta(days=days))
+    async with db_connection() as conn:
+        async with conn.execute('SELECT client_id, name FROM clients ORDER BY client_id') as cursor:
+            names = {row[0]: row[1] for row in await cursor.fetchall()}
+        client_ids, agg = await get_fleet_aggregates(conn, start_ms, end_ms)
+
+    # Clientes registrados sin lecturas en la ventana quedan con count 0
+    ids = sorted(set(names) | set(client_ids))
+    data = np.zeros((len(ids), 9))
+    if client_ids:
+        data[np.searchsorted(ids, client_ids)] = agg
+    counts = data[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = data[:, [1, 5]] / counts[:, None]
+        stds = np.sqrt(np.maximum(data[:, [2, 6]] / counts[:, None] - means * means, 0.0))
+    has_data = counts > 0
+    fleet = summarize_aggregates((
+        int(counts.sum()), *data[:, [1, 2]].sum(axis=0),
+        data[has_data, 3].min() if has_data.any() else None, data[has_data, 4].max() if has_data.any() else None,
+        *data[:, [5, 6]].sum(axis=0),
+        data[has_data, 7].min() if has_data.any() else None, data[has_data, 8].max() if has_data.any() else None
+    ))
+    fleet_means = np.array([fleet["temperature"]["mean"], fleet["humidity"]["mean"]])
+
+    def describe(i, column):
+        if not has_data[i]:
+            return {"count": 0, "mean": 0, "min": 0, "max": 0, "std_dev": 0, "delta_from_fleet": 0}
+        minimum, maximum = (3, 4) if column == 0 else (7, 8)
         return {
-            "count": len(values),
-            "mean": float(np.mean(values)),
-            "median": float(np.median(values)),
-            "mode": float(Counter(values).most_common(1)[0][0]) if len(values) > 0 else 0,
-            "min": float(np.min(values)),
-            "max": float(np.max(values)),
-            "std_dev": float(np.std(values))
+            "count": int(counts[i]),
+            "mean": float(means[i, column]),
+            "min": float(data[i, minimum]),
+            "max": float(data[i, maximum]),
+            "std_dev": float(stds[i, column]),
+            "delta_from_fleet": round(float(means[i, column] - fleet_means[column]), 3)
         }
+
+    return {
+        "start": ms_to_iso(start_ms),
+        "end": ms_to_iso(end_ms),
+        "days": days,
+        "fleet": fleet,
+        "clients": [
+            {
+                "client_id": client_id,
+                "name": names.get(client_id),
+                "temperature": describe(i, 0),
+                "humidity": describe(i, 1)
+            }
+            for i, client_id in enumerate(ids)
+        ]
+    }
+
+async def get_sht3x_compliance(client_id, start_ms, end_ms):
+    """
+    Obtiene el porcentaje de lecturas dentro de los parametros ideales desde los contadores horarios
+    Args:
+        client_id: ID del cliente
+        start_ms, end_ms: Rango en milisegundos desde epoch (se cuentan horas completas)
+    Returns:
+        Diccionario con los porcentajes de temperatura, humedad y ambos
+    """
+    async with db_connection() as conn:
+        compliance = await get_compliance(conn, client_id, start_ms, end_ms)
+    return dict(compliance, start=ms_to_iso(start_ms), end=ms_to_iso(end_ms))
+
+DAY_MS = 24 * 3600 * 1000
+HOUR_MS = 3600 * 1000
+
+# Desfase local-UTC de cada marca de tiempo (array en ms). Se calcula una vez por dia UTC
+# distinto; solo los dias con cambio de horario se resuelven marca a marca.
+def local_offsets_ms(ms):
+    days, inverse = np.unique(ms // DAY_MS, return_inverse=True)
+    at_start = np.array([utc_offset_ms(int(day) * DAY_MS) for day in days], dtype=np.int64)
+    at_end = np.array([utc_offset_ms(int(day) * DAY_MS + DAY_MS - 1) for day in days], dtype=np.int64)
+    offsets = at_start[inverse]
+    changing = np.flatnonzero((at_start != at_end)[inverse])
+    offsets[changing] = [utc_offset_ms(int(value)) for value in ms[changing]]
+    return offsets
+
+async def get_sht3x_heatmap(client_id, start_ms, end_ms):
+    """
+    Obtiene la media de temperatura y humedad por dia de la semana y hora local (matriz 7x24)
+    a partir de los agregados de 1 hora
+    Args:
+        client_id: ID del cliente
+        start_ms, end_ms: Rango en milisegundos desde epoch
+    Returns:
+        Diccionario con matrices 7x24 (filas lunes..domingo, columnas 0..23 h); null sin datos
+    """
+    async with db_connection() as conn:
+        buckets = await get_rollup_buckets(conn, client_id, "1h", start_ms, end_ms)
+    ms = buckets[:, 0].astype(np.int64)
+    local = ms + local_offsets_ms(ms) if len(ms) else ms
+    # 1970-01-01 fue jueves: con +3 el lunes queda en 0
+    cells = ((local // DAY_MS + 3) % 7) * 24 + (local // HOUR_MS) % 24
+    counts = np.bincount(cells, weights=buckets[:, 1], minlength=7 * 24)
+    temp_sums = np.bincount(cells, weights=buckets[:, 2], minlength=7 * 24)
+    hum_sums = np.bincount(cells, weights=buckets[:, 5], minlength=7 * 24)
+
+    def matrix(sums):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = np.round(sums / counts, 2).reshape(7, 24)
+        return [[None if np.isnan(value) else float(value) for value in row] for row in means]
+
+    return {
+        "start": ms_to_iso(start_ms),
+        "end": ms_to_iso(end_ms),
+        "days": ["lunes", "martes", "miercoles", "jueves", "viernes", "sabado", "domingo"],
+        "hours": list(range(24)),
+        "count": counts.astype(np.int64).reshape(7, 24).tolist(),
+        "temperature": matrix(temp_sums),
+        "humidity": matrix(hum_sums)
+    }
+
+# Resoluciones de las series: (tabla de agregados de origen, agrupar por dia local)
+SERIES_RESOLUTIONS = {
+    "minute": ("1m", False),
+    "hour": ("1h", False),
+    "day": ("1h", True)
+}
+MAX_SERIES_POINTS = 5000
+
+# Resolucion por defecto segun la longitud del rango
+def default_resolution(start_ms, end_ms):
+    span_hours = (end_ms - start_ms) / 3600000
+    if span_hours <= 6:
+        return "minute"
+    if span_hours <= 14 * 24:
+        return "hour"
+    return "day"
+
+# Combinar cubetas consecutivas del mismo grupo (filas ordenadas) con np.add/minimum/maximum.reduceat
+def _reduce_buckets(buckets, keys):
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    reduced = np.empty((len(starts), buckets.shape[1]))
+    reduced[:, 0] = keys[starts]
+    for column in (1, 2, 5):  # count y sumas
+        reduced[:, column] = np.add.reduceat(buckets[:, column], starts)
+    for column in (3, 6):
+        reduced[:, column] = np.minimum.reduceat(buckets[:, column], starts)
+    for column in (4, 7):
+        reduced[:, column] = np.maximum.reduceat(buckets[:, column], starts)
+    return reduced
+
+async def get_sht3x_series(client_id, start_ms, end_ms, resolution):
+    """
+    Obtiene una serie de media/min/max por cubeta para graficas
+    Args:
+        client_id: ID del cliente
+        start_ms, end_ms: Rango en milisegundos desde epoch
+        resolution: 'minute', 'hour' o 'day' (dias en hora local)
+    Returns:
+        Diccionario con la serie en formato de columnas
+    """
+    source, by_day = SERIES_RESOLUTIONS[resolution]
+    async with db_connection() as conn:
+        buckets = await get_rollup_buckets(conn, client_id, source, start_ms, end_ms)
+    if by_day and len(buckets):
+        # Inicio del dia local de cada hora (respeta los cambios de horario)
+        days = np.fromiter(
+            (to_epoch_ms(from_epoch_ms(ms).replace(hour=0, minute=0, second=0, microsecond=0)) for ms in buckets[:, 0]),
+            dtype=np.float64, count=len(buckets)
+        )
+        buckets = _reduce_buckets(buckets, days)
+    counts = buckets[:, 1]
     return {
-        "temperature": calculate_stats(temperatures),
-        "humidity": calculate_stats(humidity_values)
-    }
\ No newline at end of file
+        "resolution": resolution,
+        "start": ms_to_iso(start_ms),
+        "end": ms_to_iso(end_ms),
+        "points": int(len(buckets)),
+        "timestamp": [ms_to_iso(int(ms)) for ms in buckets[:, 0]],
+        "count": counts.astype(np.int64).tolist(),
+        "temperature": {
+            "mean": np.round(buckets[:, 2] / counts, 3).tolist(),
+            "min": buckets[:, 3].tolist(),
+            "max": buckets[:, 4].tolist()
+        },
+        "humidity": {
+            "mean": np.round(buckets[:, 5] / counts, 3).tolist(),
+            "min": buckets[:, 6].tolist(),
+            "max": buckets[:, 7].tolist()
+        }
+    }
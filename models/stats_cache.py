@@ -0,0 +1,128 @@
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# Cache de resultados de estadisticas por (client_id, ventana).
+# Las entradas caducan por TTL y se descartan por LRU al superar el maximo. Cuando la ingesta
+# confirma lecturas de un cliente, sus entradas se marcan obsoletas; una entrada obsoleta se
+# sigue sirviendo hasta que pasa STATS_REFRESH_INTERVAL desde su calculo, de modo que varias
+# pestanas del dashboard provocan como mucho un recalculo por intervalo. Los fallos
+# simultaneos de la misma clave esperan a un unico calculo en curso (las vistas async de
+# Flask corren cada una en su propio bucle, por eso se comparte un Future de hilos).
+STATS_CACHE_MAX_ENTRIES = 128
+STATS_CACHE_TTL = 300  # Segundos de vida maxima de una entrada
+STATS_REFRESH_INTERVAL = 10  # Segundos minimos entre recalculos de una entrada obsoleta
+
+class _Entry:
+    __slots__ = ('value', 'computed_at', 'stale')
+
+    def __init__(self, value, computed_at, stale=False):
+        self.value = value
+        self.computed_at = computed_at
+        self.stale = stale
+
+class StatsCache:
+    def __init__(self, max_entries=STATS_CACHE_MAX_ENTRIES, ttl=STATS_CACHE_TTL,
+                 refresh_interval=STATS_REFRESH_INTERVAL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self._entries = OrderedDict()
+        self._inflight = {}  # key -> Future del calculo en curso
+        self._invalidated_at = {}  # client_id -> instante de la ultima invalidacion
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'shared': 0, 'invalidations': 0, 'evictions': 0}
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            age = time.monotonic() - entry.computed_at
+            if age >= self.ttl or (entry.stale and age >= self.refresh_interval):
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['stale_hits' if entry.stale else 'hits'] += 1
+            return entry
+
+    def _store(self, key, value, computed_at):
+        with self._lock:
+            # Si llegaron lecturas del cliente durante el calculo el resultado ya nace obsoleto
+            stale = self._invalidated_at.get(key[0], float('-inf')) >= computed_at
+            self._entries[key] = _Entry(value, computed_at, stale)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    # Devolver el valor en cache o calcularlo con compute() (corrutina) y guardarlo.
+    # key es una tupla cuyo primer elemento es el client_id.
+    async def get_or_compute(self, key, compute):
+        entry = self._lookup(key)
+        if entry is not None:
+            return entry.value
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            else:
+                self._stats['shared'] += 1
+        if not owner:
+            return await asyncio.wrap_future(future)
+        try:
+            # Marca de tiempo previa al calculo: una lectura confirmada durante el calculo la invalida
+            started = time.monotonic()
+            value = await compute()
+            self._store(key, value, started)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    # Marcar como obsoletas las entradas de un cliente
+    def invalidate(self, client_id):
+        with self._lock:
+            self._invalidated_at[client_id] = time.monotonic()
+            for key, entry in self._entries.items():
+                if key[0] == client_id and not entry.stale:
+                    entry.stale = True
+                    self._stats['invalidations'] += 1
+
+    # Listener de la ingesta: filas (client_id, timestamp, temperature, humidity) confirmadas
+    def on_commit(self, rows):
+        for client_id in {row[0] for row in rows}:
+            self.invalidate(client_id)
+
+    def forget(self, client_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == client_id]:
+                del self._entries[key]
+            self._invalidated_at.pop(client_id, None)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['size'] = len(self._entries)
+        lookups = snapshot['hits'] + snapshot['stale_hits'] + snapshot['misses']
+        snapshot['hit_ratio'] = round((snapshot['hits'] + snapshot['stale_hits']) / lookups, 3) if lookups else 0.0
+        snapshot.update({
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'refresh_interval': self.refresh_interval
+        })
+        return snapshot
+
+# Instancia global para el dashboard de estadisticas
+stats_cache = StatsCache()
+
+def get_stats_cache_stats():
+    return stats_cache.stats()
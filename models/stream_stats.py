@@ -0,0 +1,257 @@
+import math
+import threading
+from collections import deque
+from .db_pool import db_connection
+from .rollups import HOUR_MS, floor_to
+from .timestamps import now_ms
+
+# Estadisticas en streaming por cliente para las ventanas del dashboard.
+# Cada lectura confirmada por la ingesta se suma con Welford a la cubeta de la hora actual;
+# al cerrar la hora, la cubeta se combina (Chan) con el acumulado de cada ventana y las
+# cubetas que salen de la ventana se restan. Minimo y maximo se mantienen con colas
+# monotonas. Consultar una ventana cuesta lo mismo sea de 1 o de 30 dias.
+# Las ventanas estan alineadas a la hora: [inicio de la hora actual - N dias, ahora].
+STREAM_WINDOWS_DAYS = (1, 7, 30)
+DAY_MS = 24 * HOUR_MS
+
+# Momentos de una variable: n, media y M2 (suma de cuadrados de desviaciones)
+class Moments:
+    __slots__ = ('n', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self, n=0, mean=0.0, m2=0.0, minimum=None, maximum=None):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+        self.min = minimum
+        self.max = maximum
+
+    @classmethod
+    def from_sums(cls, count, total, total_sq, minimum, maximum):
+        mean = total / count
+        return cls(count, mean, max(total_sq - total * mean, 0.0), minimum, maximum)
+
+    # Welford
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        self.min = x if self.min is None else min(self.min, x)
+        self.max = x if self.max is None else max(self.max, x)
+
+    # Chan: combinar otro conjunto (min/max los lleva cada ventana aparte)
+    def merge(self, other):
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+
+    # Chan inverso: quitar un subconjunto previamente combinado
+    def remove(self, other):
+        if other.n == 0:
+            return
+        n = self.n - other.n
+        if n <= 0:
+            self.n, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        mean = (self.n * self.mean - other.n * other.mean) / n
+        delta = other.mean - mean
+        self.m2 = max(self.m2 - other.m2 - delta * delta * n * other.n / self.n, 0.0)
+        self.mean = mean
+        self.n = n
+
+class _Bucket:
+    __slots__ = ('start', 'temp', 'hum')
+
+    def __init__(self, start, temp=None, hum=None):
+        self.start = start
+        self.temp = temp or Moments()
+        self.hum = hum or Moments()
+
+# Acumulado de una ventana sobre las cubetas cerradas
+class _Window:
+    def __init__(self, days):
+        self.days = days
+        self.span_ms = days * DAY_MS
+        self.buckets = deque()
+        self.temp = Moments()
+        self.hum = Moments()
+        self._extremes = {}
+        self._rebuild_extremes()
+
+    def _rebuild_extremes(self):
+        self._extremes = {key: deque() for key in ('temp_min', 'temp_max', 'hum_min', 'hum_max')}
+        for bucket in self.buckets:
+            self._push_extremes(bucket)
+
+    # Colas monotonas: el frente es siempre el minimo/maximo de las cubetas en la ventana
+    def _push_extremes(self, bucket):
+        for metric in ('temp', 'hum'):
+            moments = getattr(bucket, metric)
+            for kind, worse in (('min', lambda a, b: a >= b), ('max', lambda a, b: a <= b)):
+                queue = self._extremes[f'{metric}_{kind}']
+                value = getattr(moments, kind)
+                while queue and worse(getattr(getattr(queue[-1], metric), kind), value):
+                    queue.pop()
+                queue.append(bucket)
+
+    def push(self, bucket):
+        self.buckets.append(bucket)
+        self.temp.merge(bucket.temp)
+        self.hum.merge(bucket.hum)
+        self._push_extremes(bucket)
+
+    def expire(self, window_start):
+        while self.buckets and self.buckets[0].start < window_start:
+            bucket = self.buckets.popleft()
+            self.temp.remove(bucket.temp)
+            self.hum.remove(bucket.hum)
+            for queue in self._extremes.values():
+                if queue and queue[0] is bucket:
+                    queue.popleft()
+
+    def extreme(self, metric, kind):
+        queue = self._extremes[f'{metric}_{kind}']
+        return getattr(getattr(queue[0], metric), kind) if queue else None
+
+    # Una lectura atrasada cayo en una cubeta ya cerrada de esta ventana
+    def add_late(self, x_temp, x_hum):
+        self.temp.merge(Moments(1, x_temp))
+        self.hum.merge(Moments(1, x_hum))
+        self._rebuild_extremes()
+
+class _ClientStats:
+    def __init__(self, windows_days, current_hour):
+        self.windows = [_Window(days) for days in windows_days]
+        self.closed = {}  # inicio de hora -> cubeta cerrada (para lecturas atrasadas)
+        self.current = _Bucket(current_hour)
+
+    def advance(self, hour):
+        if hour <= self.current.start:
+            return
+        closing = self.current
+        if closing.temp.n > 0:
+            self.closed[closing.start] = closing
+            for window in self.windows:
+                window.push(closing)
+        self.current = _Bucket(hour)
+        for window in self.windows:
+            window.expire(hour - window.span_ms)
+        oldest = hour - max(window.span_ms for window in self.windows)
+        for start in [start for start in self.closed if start < oldest]:
+            del self.closed[start]
+
+    def add(self, ts_ms, temperature, humidity):
+        hour = floor_to(ts_ms, HOUR_MS)
+        if hour >= self.current.start:
+            self.advance(hour)
+            self.current.temp.add(temperature)
+            self.current.hum.add(humidity)
+            return
+        bucket = self.closed.get(hour)
+        if bucket is None:
+            bucket = self.closed[hour] = _Bucket(hour)
+            for window in self.windows:
+                if hour >= self.current.start - window.span_ms:
+                    window.buckets.append(bucket)
+                    window.buckets = deque(sorted(window.buckets, key=lambda b: b.start))
+        bucket.temp.add(temperature)
+        bucket.hum.add(humidity)
+        for window in self.windows:
+            if hour >= self.current.start - window.span_ms:
+                window.add_late(temperature, humidity)
+
+    def summary(self, window):
+        result = {}
+        for metric in ('temp', 'hum'):
+            total = Moments(getattr(window, metric).n, getattr(window, metric).mean, getattr(window, metric).m2)
+            current = getattr(self.current, metric)
+            total.merge(current)
+            extremes = [value for value in (window.extreme(metric, 'min'), current.min) if value is not None]
+            peaks = [value for value in (window.extreme(metric, 'max'), current.max) if value is not None]
+            name = 'temperature' if metric == 'temp' else 'humidity'
+            if total.n == 0:
+                result[name] = {"count": 0, "mean": 0, "min": 0, "max": 0, "std_dev": 0}
+            else:
+                result[name] = {
+                    "count": total.n,
+                    "mean": float(total.mean),
+                    "min": float(min(extremes)),
+                    "max": float(max(peaks)),
+                    "std_dev": float(math.sqrt(total.m2 / total.n))
+                }
+        return result
+
+class StreamingStats:
+    def __init__(self, windows_days=STREAM_WINDOWS_DAYS):
+        self.windows_days = tuple(windows_days)
+        self._clients = {}
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def supports(self, days):
+        return self._ready and days in self.windows_days
+
+    # Cargar el estado inicial desde los agregados de 1 hora (antes de arrancar la ingesta)
+    async def warm_start(self):
+        current_hour = floor_to(now_ms(), HOUR_MS)
+        oldest = current_hour - max(self.windows_days) * DAY_MS
+        async with db_connection() as conn:
+            async with conn.execute('''
+                SELECT client_id, bucket_ms, count, temp_sum, temp_sumsq, temp_min, temp_max,
+                       hum_sum, hum_sumsq, hum_min, hum_max
+                FROM sht3x_rollup_1h WHERE bucket_ms >= ? ORDER BY bucket_ms
+            ''', (oldest,)) as cursor:
+                rows = await cursor.fetchall()
+
+        clients = {}
+        for row in rows:
+            state = clients.get(row[0])
+            if state is None:
+                state = clients[row[0]] = _ClientStats(self.windows_days, oldest)
+            bucket = _Bucket(row[1], Moments.from_sums(*row[2:7]), Moments.from_sums(row[2], *row[7:11]))
+            state.advance(bucket.start)
+            state.current = bucket
+        # La cubeta de la hora actual (si hay lecturas) queda abierta como cubeta actual
+        for state in clients.values():
+            state.advance(current_hour)
+        with self._lock:
+            self._clients = clients
+            self._ready = True
+        print(f"Estadisticas en streaming cargadas para {len(clients)} clientes")
+
+    # Listener de la ingesta: recibe las filas (client_id, timestamp, temperature, humidity) confirmadas
+    def on_commit(self, rows):
+        with self._lock:
+            if not self._ready:
+                return
+            current_hour = floor_to(now_ms(), HOUR_MS)
+            for client_id, ts_ms, temperature, humidity in rows:
+                state = self._clients.get(client_id)
+                if state is None:
+                    state = self._clients[client_id] = _ClientStats(self.windows_days, current_hour)
+                state.add(ts_ms, temperature, humidity)
+
+    # Estadisticas de la ventana de `days` dias y su inicio en ms, o None si no se mantiene
+    def get(self, client_id, days):
+        with self._lock:
+            if not self.supports(days):
+                return None
+            current_hour = floor_to(now_ms(), HOUR_MS)
+            window_start = current_hour - days * DAY_MS
+            state = self._clients.get(client_id)
+            if state is None:
+                state = self._clients[client_id] = _ClientStats(self.windows_days, current_hour)
+            state.advance(current_hour)
+            window = state.windows[self.windows_days.index(days)]
+            return state.summary(window), window_start
+
+    def forget(self, client_id):
+        with self._lock:
+            self._clients.pop(client_id, None)
+
+# Instancia global alimentada por la ingesta
+streaming_stats = StreamingStats()
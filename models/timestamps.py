@@ -0,0 +1,66 @@
+import time
+from datetime import datetime
+
+# Las marcas de tiempo de sht3x_data, events y actuators se guardan como INTEGER
+# en milisegundos desde epoch; la API las sigue devolviendo como texto ISO.
+TIMESTAMP_FIELDS = ('timestamp',)
+
+# Momento actual en milisegundos desde epoch
+def now_ms():
+    return int(time.time() * 1000)
+
+# Convertir datetime, texto ISO (con 'T' o con espacio) o numero a milisegundos
+def to_epoch_ms(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip()
+    try:
+        return int(datetime.fromisoformat(text).timestamp() * 1000)
+    except ValueError:
+        return int(float(text))
+
+# Rango [start_ms, end_ms] de una peticion (request.args) con start/end (ISO o milisegundos)
+# o con days hasta ahora. Lanza ValueError con el mensaje para el cliente si no es valido.
+def parse_range(args, default_days):
+    try:
+        end_ms = to_epoch_ms(args['end']) if 'end' in args else now_ms()
+        if 'start' in args:
+            start_ms = to_epoch_ms(args['start'])
+        else:
+            start_ms = end_ms - int(float(args.get('days', default_days)) * 24 * 3600 * 1000)
+    except ValueError:
+        raise ValueError("Rango no valido: start/end deben ser ISO o milisegundos")
+    if start_ms >= end_ms:
+        raise ValueError("start debe ser anterior a end")
+    return start_ms, end_ms
+
+# Convertir milisegundos desde epoch a datetime local
+def from_epoch_ms(ms):
+    return datetime.fromtimestamp(ms / 1000)
+
+# Diferencia en milisegundos entre la hora local y UTC en un instante (cambia con el horario de verano)
+def utc_offset_ms(ms):
+    return time.localtime(ms / 1000).tm_gmtoff * 1000
+
+# Convertir milisegundos desde epoch a texto ISO
+def ms_to_iso(ms):
+    if ms is None:
+        return None
+    if isinstance(ms, str):
+        return ms  # Filas antiguas que aun no se han migrado
+    return from_epoch_ms(ms).isoformat(timespec='milliseconds')
+
+# Convertir una fila de la base de datos a dict con las marcas de tiempo en ISO
+def serialize_row(row):
+    data = dict(row)
+    for field in TIMESTAMP_FIELDS:
+        if field in data:
+            data[field] = ms_to_iso(data[field])
+    return data
+
+def serialize_rows(rows):
+    return [serialize_row(row) for row in rows]
@@ -1,10 +1,21 @@
 import paho.mqtt.client as mqtt
-from models.sensor_data import save_sht3x_data, get_ideal_params
+from models.sensor_data import get_ideal_params
+from ingestion import sensor_ingestor
+from mqtt_outbox import mqtt_outbox
+from command_acks import command_tracker, ACTUATOR_TOPICS
+from models.recent_readings import recent_readings
+from models.live_stream import live_broker
+from models.stream_stats import streaming_stats
+from models.stats_cache import stats_cache
+from models.anomalies import anomaly_detector, save_anomalies
+from models.timestamps import now_ms
 from models.event import save_event
-from models.client import update_client_status, register_client, client_exists
+from models.client import update_client_status, register_client, client_exists, get_ack_clients
 import time
-from models.actuator import update_actuator_state, get_actuator_state, get_actuator_by_name
+from models.actuator import apply_actuator_transitions, get_actuator_by_name, get_all_actuators, get_actuator_state, update_actuator_state
+from models.actuator_controller import actuator_controller, ACTUATOR_RULES, as_bool
 from models.app_state import get_app_state
+from models.node_config import publish_all_node_configs
 import asyncio
 import re
 from collections import defaultdict
@@ -13,7 +24,7 @@ import threading
 
 client = None
 client_last_events = {}  # Diccionario para rastrear el último evento por cliente y tipo
-client_actuator_cache = {}  # Caché de actuadores por cliente
+client_actuator_cache = {}  # Caché de ids de actuadores por cliente y nombre
 client_status_update_time = {}  # Último momento en que se actualizó el estado de un cliente
 
 # Límite de tiempo para actualizar el estado del cliente (segundos)
@@ -27,6 +38,13 @@ loop_ready = threading.Event()
 # Extraer client_id del tópico con regex compilado para mayor eficiencia
 _client_id_pattern = re.compile(r'clients/([^/]+)/')
 
+# Tópicos de comandos de actuadores (se envían con identificador de correlación)
+_command_topic_pattern = re.compile(r'clients/([^/]+)/(' + '|'.join(ACTUATOR_TOPICS) + r')$')
+
+# Nombre del actuador (Iluminacion, Ventilacion...) a partir de su topico (light, fan...)
+def actuator_name(actuator_topic):
+    return next((name for name, rule in ACTUATOR_RULES.items() if rule[2] == actuator_topic), None)
+
 def extract_client_id(topic):
     match = _client_id_pattern.match(topic)
     if match:
@@ -41,6 +59,23 @@ def run_coroutine(coro):
     else:
         print("Error: El bucle de eventos no esta en ejecucion")
 
+# Al conectar (y reconectar) suscribirse y reenviar los mensajes pendientes de la bandeja de salida.
+# Firma compatible con las versiones 1 y 2 de la API de callbacks de paho.
+def on_connect(client, userdata, flags, rc, properties=None):
+    if rc != 0:
+        print(f"Conexion MQTT rechazada: {rc}")
+        return
+    client.subscribe('clients/+/sensor/sht3x')
+    client.subscribe('clients/+/register')
+    client.subscribe('clients/+/ack/+')
+    client.subscribe('clients/+/state/+')
+    mqtt_outbox.set_connected(True)
+    print("Cliente MQTT conectado y suscrito a topicos de multiples clientes")
+
+def on_disconnect(client, userdata, *args):
+    mqtt_outbox.set_connected(False)
+    print("Cliente MQTT desconectado, los comandos quedan en la bandeja de salida")
+
 # Manejo de mensajes optimizado
 def on_message(client, userdata, msg):
     try:
@@ -61,24 +96,65 @@ def on_message(client, userdata, msg):
         if msg.topic == f'clients/{client_id}/sensor/sht3x':
             data = msg.payload.decode('utf-8', errors='ignore').split(',')
             if len(data) == 2:
-                run_coroutine(handle_sht3x_message(client_id, data))
+                try:
+                    temperatura, humedad = float(data[0]), float(data[1])
+                except ValueError:
+                    print(f"Lectura SHT3x invalida de {client_id}: {data}")
+                    return
+                timestamp = now_ms()
+                # Lecturas anomalas (picos del sensor): solo se registran como anomalia; no se
+                # guardan como lectura ni entran en agregados, histogramas, cumplimiento,
+                # estadisticas en streaming, buffer reciente, eventos ni actuadores
+                anomalies = anomaly_detector.check(client_id, temperatura, humedad)
+                if anomalies:
+                    run_coroutine(handle_anomaly(client_id, timestamp, anomalies))
+                    return
+                # Encolar la lectura para la tarea escritora de la ingesta
+                sensor_ingestor.submit(client_id, temperatura, humedad, timestamp)
+                run_coroutine(handle_sht3x_message(client_id, data, timestamp))
+        elif msg.topic.startswith(f'clients/{client_id}/ack/'):
+            # Confirmacion de un comando de actuador: "<id de correlacion>[,<estado>]"
+            actuator = msg.topic.rsplit('/', 1)[1]
+            command_tracker.on_ack(client_id, actuator, msg.payload.decode('utf-8', errors='ignore'))
+        elif msg.topic.startswith(f'clients/{client_id}/state/'):
+            # Cambio de actuador decidido por el propio nodo (modo supervisado)
+            actuator = msg.topic.rsplit('/', 1)[1]
+            run_coroutine(handle_node_actuator_state(client_id, actuator, msg.payload.decode('utf-8', errors='ignore')))
         elif msg.topic == f'clients/{client_id}/register':
             data = msg.payload.decode('utf-8', errors='ignore').split(',')
             if len(data) >= 2:
                 name = data[0]
                 description = data[1] if len(data) > 1 else ""
-                run_coroutine(register_client(client_id, name, description))
+                # Tercer campo opcional "ack": el nodo confirma los comandos de actuadores
+                ack_support = any(field.strip() == 'ack' for field in data[2:])
+                command_tracker.set_ack_support(client_id, ack_support)
+                run_coroutine(register_client(client_id, name, description, ack_support))
         else:
             print(f"Topico no reconocido: {msg.topic}")
     except Exception as e:
         print(f'Error al procesar el mensaje: {e}')
 
-async def handle_sht3x_message(client_id, data):
+# Guardar las anomalias de una lectura descartada y notificarlas al stream en vivo
+async def handle_anomaly(client_id, timestamp, anomalies):
+    try:
+        await save_anomalies(client_id, timestamp, anomalies)
+        live_broker.publish(client_id, 'anomaly', {
+            'client_id': client_id, 'timestamp': timestamp, 'anomalies': anomalies
+        })
+    except Exception as e:
+        print(f"Error guardando anomalia: {e}")
+
+async def handle_sht3x_message(client_id, data, timestamp=None):
     try:
         temperatura, humedad = float(data[0]), float(data[1])
         
-        # Guardar datos en la base (ahora con buffer)
-        await save_sht3x_data(client_id, temperatura, humedad)
+        # La lectura ya fue encolada en la ingesta desde on_message;
+        # aqui se guarda en el buffer de lecturas recientes y se envia al stream en vivo
+        timestamp = timestamp or now_ms()
+        recent_readings.append(client_id, timestamp, temperatura, humedad)
+        live_broker.publish(client_id, 'reading', {
+            'client_id': client_id, 'timestamp': timestamp, 'temperature': temperatura, 'humidity': humedad
+        })
         
         # Verificar eventos con throttling
         current_time = time.time()
@@ -120,14 +196,16 @@ async def handle_sht3x_message(client_id, data):
                 client_last_events[client_id]['hum'] = current_time
         
         # Verificar modo automático y actualizar actuadores
+        # (en modo supervisado el nodo controla sus actuadores y el servidor solo registra)
         app_state = await get_app_state(client_id)
         if app_state == 'automatico':
             await update_actuators(client_id, temperatura, humedad)
     except Exception as e:
         print(f"Error procesando mensaje SHT3x: {e}")
 
-# Función para obtener y almacenar en caché los actuadores
-async def get_cached_actuator(client_id, name):
+# Función para obtener y almacenar en caché el id de un actuador (solo el id: el estado
+# y su marca de tiempo cambian y siempre se leen de la base de datos)
+async def get_cached_actuator_id(client_id, name):
     # Usar caché si está disponible
     cache_key = f"{client_id}_{name}"
     if cache_key in client_actuator_cache:
@@ -136,9 +214,9 @@ async def get_cached_actuator(client_id, name):
     # Obtener de la base de datos
     actuator = await get_actuator_by_name(client_id, name)
     if actuator:
-        client_actuator_cache[cache_key] = actuator
-    
-    return actuator
+        client_actuator_cache[cache_key] = actuator['id']
+        return actuator['id']
+    return None
 
 async def update_actuators(client_id, temperature, humidity):
     try:
@@ -149,136 +227,94 @@ async def update_actuators(client_id, temperature, humidity):
         if not ideal_temp_params or not ideal_humidity_params:
             return
         
-        min_temp = ideal_temp_params['min_value']
-        max_temp = ideal_temp_params['max_value']
-        min_humidity = ideal_humidity_params['min_value']
-        max_humidity = ideal_humidity_params['max_value']
-        
-        # Obtener actuadores con caché
-        light_actuator = await get_cached_actuator(client_id, "Iluminacion")
-        fan_actuator = await get_cached_actuator(client_id, "Ventilacion")
-        humidifier_actuator = await get_cached_actuator(client_id, "Humidificador")
-        motor_actuator = await get_cached_actuator(client_id, "Motor")
+        # Cargar el estado actual de los actuadores en el controlador la primera vez (y
+        # tras un fallo que lo descarto), leyendo las filas de la base de datos sin caché
+        if not actuator_controller.is_loaded(client_id):
+            actuators = [row for row in await get_all_actuators(client_id) if row['name'] in ACTUATOR_RULES]
+            if len({row['name'] for row in actuators}) < len(ACTUATOR_RULES):
+                return
+            actuator_controller.load(client_id, actuators)
         
-        if not all([light_actuator, fan_actuator, humidifier_actuator, motor_actuator]):
+        limits = {
+            'temperatura': (ideal_temp_params['min_value'], ideal_temp_params['max_value']),
+            'humedad': (ideal_humidity_params['min_value'], ideal_humidity_params['max_value'])
+        }
+        # Solo las transiciones reales (con histeresis y tiempo minimo) llegan a la base de datos y a MQTT
+        transitions = actuator_controller.evaluate(client_id, temperature, humidity, limits)
+        if not transitions:
             return
-        
-        # Lista para todas las tareas de actualización
-        all_tasks = []
-        
-        # Acciones para temperatura
-        if temperature < min_temp:
-            # Temperatura baja: encender luz
-            all_tasks.append(update_actuator_and_log(client_id, light_actuator['id'], 'true', "Temperatura baja, encendiendo luz", f'clients/{client_id}/light'))
-            all_tasks.append(update_actuator_and_log(client_id, fan_actuator['id'], 'false', "Ventilador apagado", f'clients/{client_id}/fan'))
-        elif temperature > max_temp:
-            # Temperatura alta: encender ventilador
-            all_tasks.append(update_actuator_and_log(client_id, light_actuator['id'], 'false', "Luz apagada", f'clients/{client_id}/light'))
-            all_tasks.append(update_actuator_and_log(client_id, fan_actuator['id'], 'true', "Temperatura alta, encendiendo ventilador", f'clients/{client_id}/fan'))
-        else:
-            # Temperatura normal: apagar ambos
-            all_tasks.append(update_actuator_and_log(client_id, light_actuator['id'], 'false', "Temperatura normal, luz apagada", f'clients/{client_id}/light'))
-            all_tasks.append(update_actuator_and_log(client_id, fan_actuator['id'], 'false', "Temperatura normal, ventilador apagado", f'clients/{client_id}/fan'))
-        
-        # Acciones para humedad
-        if humidity < min_humidity:
-            # Humedad baja: encender humidificador
-            all_tasks.append(update_actuator_and_log(client_id, humidifier_actuator['id'], 'true', "Humedad baja, encendiendo humidificador", f'clients/{client_id}/humidifier'))
-            all_tasks.append(update_actuator_and_log(client_id, motor_actuator['id'], 'false', "Motor apagado", f'clients/{client_id}/motor'))
-        elif humidity > max_humidity:
-            # Humedad alta: encender motor
-            all_tasks.append(update_actuator_and_log(client_id, humidifier_actuator['id'], 'false', "Humidificador apagado", f'clients/{client_id}/humidifier'))
-            all_tasks.append(update_actuator_and_log(client_id, motor_actuator['id'], 'true', "Humedad alta, encendiendo motor", f'clients/{client_id}/motor'))
-        else:
-            # Humedad normal: apagar ambos
-            all_tasks.append(update_actuator_and_log(client_id, humidifier_actuator['id'], 'false', "Humedad normal, humidificador apagado", f'clients/{client_id}/humidifier'))
-            all_tasks.append(update_actuator_and_log(client_id, motor_actuator['id'], 'false', "Humedad normal, motor apagado", f'clients/{client_id}/motor'))
-        
-        # Ejecutar todas las tareas en paralelo
-        await asyncio.gather(*all_tasks)
+        # Estados y eventos de la lectura en una sola transaccion; MQTT despues del commit
+        await apply_actuator_transitions(client_id, transitions)
+        for transition in transitions:
+            # Las transiciones del controlador siempre invierten el estado anterior
+            previous = 'false' if transition['state'] == 'true' else 'true'
+            command_tracker.send(client_id, transition['topic'].rsplit('/', 1)[1], transition['state'], previous)
     except Exception as e:
         print(f"Error actualizando actuadores: {e}")
 
-# Caché para el estado del actuador
-_actuator_state_cache = {}
-_actuator_last_update = {}
-ACTUATOR_CACHE_DURATION = 5  # Segundos
+# Registrar un cambio de actuador informado por el nodo ("true"/"false" en
+# clients/{id}/state/<actuador>): estado en la base de datos, controlador y stream, mas un evento
+async def handle_node_actuator_state(client_id, actuator_topic, payload):
+    try:
+        name = actuator_name(actuator_topic)
+        if name is None:
+            print(f"Actuador no reconocido de {client_id}: {actuator_topic}")
+            return
+        actuator_id = await get_cached_actuator_id(client_id, name)
+        if actuator_id is None:
+            return
+        on = as_bool(payload.split(',')[0])
+        state = 'true' if on else 'false'
+        # Los reenvios del nodo con el mismo estado no generan eventos
+        if as_bool(await get_actuator_state(client_id, actuator_id)) == on:
+            return
+        await update_actuator_state(client_id, actuator_id, state)
+        _, _, _, on_message, off_message = ACTUATOR_RULES[name]
+        await save_event(client_id, f"Nodo: {on_message if on else off_message}", "actuador")
+    except Exception as e:
+        print(f"Error registrando estado de actuador del nodo: {e}")
 
-async def update_actuator_and_log(client_id, actuator_id, state, description, topic):
+# Corregir el estado guardado (escrito de forma optimista al enviar el comando) cuando el
+# nodo confirma otro estado o no confirma tras los reintentos. Sin confirmacion se vuelve
+# al estado anterior al comando y se descarta el controlador para que lo recargue de la base.
+async def handle_command_failure(client_id, actuator_topic, expected, applied, previous):
     try:
-        # Verificar si el cambio es necesario usando caché
-        cache_key = f"{client_id}_{actuator_id}"
-        current_time = time.time()
-        
-        # Si el estado está en caché y es reciente, usarlo
-        if (cache_key in _actuator_state_cache and
-            current_time - _actuator_last_update.get(cache_key, 0) < ACTUATOR_CACHE_DURATION):
-            current_state = _actuator_state_cache[cache_key]
+        name = actuator_name(actuator_topic)
+        actuator_id = await get_cached_actuator_id(client_id, name) if name else None
+        if actuator_id is None:
+            return
+        if applied is not None:
+            await update_actuator_state(client_id, actuator_id, applied)
+            message = f"{name}: el nodo aplico '{applied}' en lugar de '{expected}'"
+        elif previous is not None:
+            await update_actuator_state(client_id, actuator_id, previous)
+            message = f"{name}: comando '{expected}' sin confirmar, se restaura el estado anterior '{previous}'"
         else:
-            # Obtener de la base de datos
-            current_state = await get_actuator_state(client_id, actuator_id)
-            # Actualizar caché
-            _actuator_state_cache[cache_key] = current_state
-            _actuator_last_update[cache_key] = current_time
-        
-        # Actualizar sólo si es necesario
-        if current_state != state:
-            # Primero actualizar la base de datos
-            await update_actuator_state(client_id, actuator_id, state)
-            
-            # Luego publicar el mensaje MQTT inmediatamente
-            message = str(state).lower()
-            if client and client.is_connected():
-                client.publish(topic, message, qos=1)  # QoS 1 para asegurar al menos una entrega
-                print(f"Publicando mensaje MQTT - Topico: {topic}, Mensaje: {message}")
-            
-            # Actualizar caché
-            _actuator_state_cache[cache_key] = state
-            _actuator_last_update[cache_key] = current_time
-            
-            # Guardar evento
-            await save_event(client_id, description, "actuador")
+            # Estado previo desconocido (comando recuperado tras un reinicio): no se escribe nada
+            message = f"{name}: comando '{expected}' sin confirmar, estado real desconocido"
+        if applied is None:
+            # El controlador se recarga de la base en la siguiente lectura
+            actuator_controller.forget(client_id)
+        await save_event(client_id, message, "actuador")
     except Exception as e:
-        print(f"Error en update_actuator_and_log: {e}")
+        print(f"Error corrigiendo estado de actuador: {e}")
 
-# Cola de mensajes para publicación MQTT
-_mqtt_message_queue = []
-_last_mqtt_publish = time.time()
-MAX_QUEUE_SIZE = 10
-MAX_QUEUE_TIME = 0.1  # segundos
+# Listener del seguimiento de comandos (hilo de MQTT o de revision)
+def on_command_failure(client_id, actuator_topic, expected, applied, previous):
+    run_coroutine(handle_command_failure(client_id, actuator_topic, expected, applied, previous))
 
-# Función para publicar mensajes MQTT
+# Función para publicar mensajes MQTT a través de la bandeja de salida (persistente, con
+# reintentos y solo el último mensaje por tópico)
 async def publish_message(topic, message):
-    global client, _mqtt_message_queue, _last_mqtt_publish
-    
-    _mqtt_message_queue.append((topic, message))
-    current_time = time.time()
-    
-    # Publicar inmediatamente si la cola está llena o ha pasado suficiente tiempo
-    if len(_mqtt_message_queue) >= MAX_QUEUE_SIZE or current_time - _last_mqtt_publish > MAX_QUEUE_TIME:
-        await _process_mqtt_queue()
-
-async def _process_mqtt_queue():
-    global client, _mqtt_message_queue, _last_mqtt_publish
-    
-    if not _mqtt_message_queue:
-        return
-    
-    if client and client.is_connected():
-        queue_copy = _mqtt_message_queue.copy()
-        _mqtt_message_queue = []
-        _last_mqtt_publish = time.time()
-        
-        for topic, message in queue_copy:
-            try:
-                client.publish(topic, message, qos=1)  # QoS 1 para asegurar al menos una entrega
-                print(f"Procesando cola MQTT - Topico: {topic}, Mensaje: {message}")
-            except Exception as e:
-                print(f"Error al publicar mensaje MQTT: {e}")
-                # Reintentar más tarde
-                _mqtt_message_queue.append((topic, message))
+    command = _command_topic_pattern.match(topic)
+    if command:
+        # Estado guardado antes del comando, para restaurarlo si el nodo no lo confirma
+        client_id, actuator_topic = command.groups()
+        actuator = await get_actuator_by_name(client_id, actuator_name(actuator_topic))
+        previous = ('true' if as_bool(actuator['state']) else 'false') if actuator else None
+        command_tracker.send(client_id, actuator_topic, message, previous)
     else:
-        print("Cliente MQTT no esta conectado, reintentando mas tarde...")
+        mqtt_outbox.enqueue(topic, message)
 
 # Funcion para ejecutar el bucle de eventos asincrono
 def run_event_loop():
@@ -299,9 +335,36 @@ def connect_mqtt():
     # Esperar a que el bucle este listo
     loop_ready.wait()
     
+    # Cargar las estadisticas en streaming antes de que la ingesta empiece a notificar commits
+    try:
+        asyncio.run_coroutine_threadsafe(streaming_stats.warm_start(), loop).result(timeout=60)
+    except Exception as e:
+        print(f"Error cargando estadisticas en streaming (se usaran los agregados): {e}")
+    sensor_ingestor.add_commit_listener(streaming_stats.on_commit)
+    sensor_ingestor.add_commit_listener(stats_cache.on_commit)
+    
+    # Nodos que confirman comandos (guardado al registrarse), antes de reenviar la bandeja de salida
+    try:
+        command_tracker.load_ack_clients(asyncio.run_coroutine_threadsafe(get_ack_clients(), loop).result(timeout=10))
+    except Exception as e:
+        print(f"Error cargando los nodos con confirmacion de comandos: {e}")
+    
+    # Iniciar la tarea escritora de lecturas SHT3x en el bucle
+    sensor_ingestor.start(loop)
+    
     # Configurar cliente MQTT
     client = mqtt.Client()
     client.on_message = on_message
+    client.on_connect = on_connect
+    client.on_disconnect = on_disconnect
+    
+    # Iniciar la bandeja de salida (reenvia lo que quedo pendiente antes del reinicio)
+    mqtt_outbox.start(client)
+    command_tracker.add_failure_listener(on_command_failure)
+    command_tracker.start()
+    
+    # Publicar la configuracion retenida de todos los clientes (control local de los nodos)
+    run_coroutine(publish_all_node_configs())
     
     # Configurar reconexión automática
     client.reconnect_delay_set(min_delay=1, max_delay=120)
@@ -309,12 +372,9 @@ def connect_mqtt():
     try:
         client.connect('localhost', 1883, 60)
         
-        # Suscribirse a todos los tópicos de clientes
-        client.subscribe('clients/+/sensor/sht3x')
-        client.subscribe('clients/+/register')
-        
+        # La suscripcion a los topicos de clientes se hace en on_connect
         client.loop_start()
-        print("Cliente MQTT inicializado y suscrito a topicos de multiples clientes")
+        print("Cliente MQTT inicializado")
     except Exception as e:
         print(f"Error al conectar con el broker MQTT: {e}")
         print("Reintentando en 5 segundos...")
@@ -325,9 +385,16 @@ def connect_mqtt():
 def cleanup():
     global client, loop
     
+    # Los comandos no entregados quedan guardados para el siguiente arranque
+    command_tracker.stop()
+    mqtt_outbox.stop()
+    
     if client:
         client.loop_stop()
         client.disconnect()
+    
+    # Escribir las lecturas pendientes antes de detener el bucle
+    sensor_ingestor.stop_threadsafe()
         
     if loop:
         for task in asyncio.all_tasks(loop):
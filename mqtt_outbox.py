@@ -0,0 +1,238 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from db_config import apply_storage_profile
+from models import db_pool
+from models.timestamps import now_ms
+
+# Configuracion de la bandeja de salida de comandos MQTT
+PUBLISH_TIMEOUT = 5.0      # Segundos esperando el PUBACK de un mensaje QoS 1
+RETRY_DELAY = 1.0          # Espera inicial antes de reintentar un envio fallido...
+RETRY_MAX_DELAY = 60.0     # ...que se duplica en cada intento hasta este maximo
+MAX_AGE_SECONDS = 24 * 3600  # Los mensajes sin entregar mas antiguos se descartan
+IDLE_WAIT = 1.0            # Espera maxima del hilo de envio sin trabajo pendiente
+
+CREATE_OUTBOX_SQL = '''
+    CREATE TABLE IF NOT EXISTS mqtt_outbox (
+        key TEXT PRIMARY KEY,
+        seq INTEGER NOT NULL,
+        topic TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        qos INTEGER NOT NULL,
+        retain INTEGER NOT NULL,
+        enqueued_ms INTEGER NOT NULL
+    )
+'''
+
+class _Entry:
+    __slots__ = ('key', 'seq', 'topic', 'payload', 'qos', 'retain', 'enqueued_ms',
+                 'attempts', 'next_try', 'persisted')
+
+    def __init__(self, key, seq, topic, payload, qos, retain, enqueued_ms, persisted=False):
+        self.key = key
+        self.seq = seq
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.enqueued_ms = enqueued_ms
+        self.attempts = 0
+        self.next_try = 0.0
+        self.persisted = persisted
+
+# Bandeja de salida de comandos MQTT.
+# publish_message (rutas Flask) y el controlador de actuadores (bucle MQTT) encolan desde
+# cualquier hilo; un hilo propio guarda los mensajes en SQLite, los publica con QoS 1, espera
+# el PUBACK y solo entonces los borra. Por topico solo se conserva el ultimo mensaje (el
+# estado mas reciente gana), asi que una desconexion larga no acumula ordenes obsoletas.
+# Al arrancar se recuperan los mensajes guardados y al reconectar se reenvian.
+class MqttOutbox:
+    def __init__(self):
+        self._client = None
+        self._connected = False
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._seq = 0
+        self._stats = {
+            'enqueued': 0,
+            'coalesced': 0,
+            'delivered': 0,
+            'retries': 0,
+            'expired': 0,
+            'replayed': 0,
+            'last_latency': 0.0,
+            'max_latency': 0.0,
+            'avg_latency': 0.0,
+            'last_delivery_at': None
+        }
+
+    # Arrancar el hilo de envio con el cliente paho ya creado (idempotente)
+    def start(self, client):
+        with self._cond:
+            self._client = client
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+        self._conn = sqlite3.connect(db_pool.DB_PATH, check_same_thread=False)
+        apply_storage_profile(self._conn)
+        self._conn.execute(CREATE_OUTBOX_SQL)
+        self._conn.commit()
+        self._load()
+        self._thread = threading.Thread(target=self._run, name='mqtt-outbox', daemon=True)
+        self._thread.start()
+        print(f"Bandeja de salida MQTT iniciada ({len(self._pending)} mensajes pendientes)")
+
+    # Recuperar los mensajes no entregados antes del ultimo reinicio
+    def _load(self):
+        rows = self._conn.execute(
+            'SELECT key, seq, topic, payload, qos, retain, enqueued_ms FROM mqtt_outbox ORDER BY enqueued_ms'
+        ).fetchall()
+        with self._cond:
+            for key, seq, topic, payload, qos, retain, enqueued_ms in rows:
+                if key not in self._pending:
+                    self._pending[key] = _Entry(key, seq, topic, payload, qos, bool(retain), enqueued_ms, persisted=True)
+                    self._seq = max(self._seq, seq)
+            self._stats['replayed'] += len(rows)
+
+    # Encolar un mensaje desde cualquier hilo. Con coalesce=True sustituye al pendiente del
+    # mismo topico; key permite agrupar por otra clave (o None para no agrupar nunca).
+    def enqueue(self, topic, payload, qos=1, retain=False, coalesce=True, key=None):
+        with self._cond:
+            self._seq += 1
+            if key is None:
+                key = topic if coalesce else f'{topic}#{self._seq}'
+            if key in self._pending:
+                self._stats['coalesced'] += 1
+                del self._pending[key]
+            self._pending[key] = _Entry(key, self._seq, topic, str(payload), qos, retain, now_ms())
+            self._stats['enqueued'] += 1
+            self._cond.notify()
+            return self._seq
+
+    # Mensajes pendientes [(topico, mensaje)] en orden de envio
+    def pending_messages(self):
+        with self._cond:
+            return [(entry.topic, entry.payload) for entry in self._pending.values()]
+
+    @property
+    def connected(self):
+        return self._connected
+
+    # Llamar desde on_connect / on_disconnect de paho
+    def set_connected(self, connected):
+        with self._cond:
+            self._connected = connected
+            if connected:
+                # Reenviar de inmediato todo lo pendiente
+                for entry in self._pending.values():
+                    entry.next_try = 0.0
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopping:
+                    break
+                now = time.monotonic()
+                to_persist = [entry for entry in self._pending.values() if not entry.persisted]
+                ready = [entry for entry in self._pending.values() if entry.next_try <= now] if self._connected else []
+                if not to_persist and not ready:
+                    waits = [entry.next_try - now for entry in self._pending.values()] if self._connected else []
+                    self._cond.wait(timeout=max(min(waits + [IDLE_WAIT]), 0.01))
+                    continue
+            try:
+                if to_persist:
+                    self._persist(to_persist)
+                for entry in ready:
+                    self._deliver(entry)
+            except Exception as e:
+                print(f"Error en la bandeja de salida MQTT: {e}")
+                time.sleep(RETRY_DELAY)
+
+    # Guardar en una sola transaccion los mensajes nuevos
+    def _persist(self, entries):
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO mqtt_outbox (key, seq, topic, payload, qos, retain, enqueued_ms) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(e.key, e.seq, e.topic, e.payload, e.qos, int(e.retain), e.enqueued_ms) for e in entries]
+        )
+        self._conn.commit()
+        for entry in entries:
+            entry.persisted = True
+
+    def _deliver(self, entry):
+        with self._cond:
+            if self._pending.get(entry.key) is not entry:
+                return  # Sustituido por un mensaje mas reciente del mismo topico
+        if now_ms() - entry.enqueued_ms > MAX_AGE_SECONDS * 1000:
+            print(f"Mensaje MQTT caducado sin entregar - Topico: {entry.topic}")
+            self._stats['expired'] += 1
+            self._remove(entry)
+            return
+        delivered = False
+        try:
+            info = self._client.publish(entry.topic, entry.payload, qos=entry.qos, retain=entry.retain)
+            if entry.qos > 0:
+                info.wait_for_publish(timeout=PUBLISH_TIMEOUT)
+            delivered = info.is_published()
+        except Exception as e:
+            print(f"Error al publicar mensaje MQTT {entry.topic}: {e}")
+        if not delivered:
+            with self._cond:
+                entry.attempts += 1
+                entry.next_try = time.monotonic() + min(RETRY_DELAY * 2 ** (entry.attempts - 1), RETRY_MAX_DELAY)
+            self._stats['retries'] += 1
+            return
+
+        latency = (now_ms() - entry.enqueued_ms) / 1000
+        stats = self._stats
+        stats['delivered'] += 1
+        stats['last_latency'] = latency
+        stats['max_latency'] = max(stats['max_latency'], latency)
+        # Media movil exponencial para suavizar picos
+        stats['avg_latency'] = latency if stats['delivered'] == 1 else 0.9 * stats['avg_latency'] + 0.1 * latency
+        stats['last_delivery_at'] = datetime.now().isoformat()
+        print(f"Publicando mensaje MQTT - Topico: {entry.topic}, Mensaje: {entry.payload}")
+        self._remove(entry)
+
+    # Quitar un mensaje entregado salvo que mientras tanto llegara uno mas reciente con la misma clave
+    def _remove(self, entry):
+        with self._cond:
+            if self._pending.get(entry.key) is entry:
+                del self._pending[entry.key]
+        self._conn.execute('DELETE FROM mqtt_outbox WHERE key = ? AND seq = ?', (entry.key, entry.seq))
+        self._conn.commit()
+
+    # Detener el hilo de envio; lo pendiente queda guardado para el siguiente arranque
+    def stop(self, timeout=5):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            pending = [entry for entry in self._pending.values() if not entry.persisted]
+            if pending:
+                self._persist(pending)
+            self._conn.close()
+            self._thread = None
+
+    def stats(self):
+        with self._cond:
+            snapshot = dict(self._stats)
+            oldest = min((entry.enqueued_ms for entry in self._pending.values()), default=None)
+            snapshot.update({
+                'running': self._thread is not None and self._thread.is_alive(),
+                'connected': self._connected,
+                'backlog': len(self._pending),
+                'oldest_pending_age': round((now_ms() - oldest) / 1000, 3) if oldest is not None else 0.0
+            })
+        return snapshot
+
+# Instancia global usada por el cliente MQTT y las rutas
+mqtt_outbox = MqttOutbox()
+
+def get_outbox_stats():
+    return mqtt_outbox.stats()
@@ -8,6 +8,7 @@ __version__ = '1.1.0'
 from msad.api.system_routes import create_system_blueprint
 from msad.api.backup_routes import create_backup_blueprint
 from msad.api.report_routes import create_report_blueprint
+from msad.api.retention_routes import create_retention_blueprint
 from msad.core.system import init_msad, shutdown_msad
 from msad.core.backup import init_backup_system, start_backup_scheduler, stop_backup_scheduler
 
@@ -28,6 +29,7 @@ __all__ = [
     'create_system_blueprint',
     'create_backup_blueprint',
     'create_report_blueprint',
+    'create_retention_blueprint',
     'init_msad',
     'shutdown_msad',
     'init_backup_system',
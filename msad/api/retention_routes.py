@@ -0,0 +1,56 @@
+"""
+Retention routes module for MSAD - Data retention and compaction endpoints
+"""
+from flask import Blueprint, jsonify, request
+from msad.core.system import logger
+from msad.core.retention import get_policies, set_policy, run_retention, get_retention_status, enable_incremental_vacuum
+
+def create_retention_blueprint():
+    """
+    Creates and returns a blueprint for retention-related endpoints
+    """
+    retention_bp = Blueprint('msad_retention_bp', __name__)
+
+    @retention_bp.route('/msad/retention', methods=['GET'])
+    def retention_status():
+        """Endpoint to get the last retention report and the policies"""
+        result = get_retention_status()
+        result["policies"] = get_policies()
+        return jsonify(result)
+
+    @retention_bp.route('/msad/retention/policies', methods=['PUT'])
+    def update_policy():
+        """Endpoint to set (or clear with retention_days null) a client retention policy"""
+        try:
+            data = request.json or {}
+            client_id = data.get('client_id')
+            table = data.get('table')
+            if not client_id or not table:
+                return jsonify({
+                    "success": False,
+                    "error": "client_id and table are required"
+                }), 400
+
+            result = set_policy(client_id, table, data.get('retention_days'))
+            return jsonify(result), (200 if result.get("success") else 400)
+
+        except Exception as e:
+            logger.error(f"Error updating retention policy: {str(e)}")
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 500
+
+    @retention_bp.route('/msad/retention/run', methods=['POST'])
+    def run_now():
+        """Endpoint to run the retention engine immediately"""
+        result = run_retention()
+        return jsonify(result), (200 if result.get("success") else 409)
+
+    @retention_bp.route('/msad/retention/enable-incremental-vacuum', methods=['POST'])
+    def enable_vacuum():
+        """Endpoint to convert an existing database to auto_vacuum=INCREMENTAL (full VACUUM)"""
+        result = enable_incremental_vacuum()
+        return jsonify(result), (200 if result.get("success") else 409)
+
+    return retention_bp
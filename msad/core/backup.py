@@ -11,7 +11,8 @@ import threading
 import schedule
 from pathlib import Path
 
-from msad.core.system import logger, get_database_path, STORAGE_PATH
+from msad.core.system import logger, get_database_path, get_connection, STORAGE_PATH
+from msad.core.maintenance import schedule_maintenance_jobs
 
 # Configuración global
 BACKUP_DIR = os.path.join(STORAGE_PATH, "backups")
@@ -62,7 +63,7 @@ def create_backup(manual=False):
         os.makedirs(BACKUP_DIR, exist_ok=True)
         
         # Verificar integridad de la base de datos antes de hacer backup
-        conn = sqlite3.connect(db_path)
+        conn = get_connection()
         cursor = conn.cursor()
         cursor.execute("PRAGMA integrity_check")
         integrity_check = cursor.fetchone()[0]
@@ -75,8 +76,15 @@ def create_backup(manual=False):
                 "error": "La base de datos está corrupta y no se puede realizar el backup"
             }
         
-        # Crear backup (copia del archivo)
-        shutil.copy2(db_path, backup_path)
+        # Crear backup con la API de backup de SQLite: en modo WAL una copia del
+        # archivo omitiría las páginas que aún están en el archivo -wal
+        source = get_connection()
+        target = sqlite3.connect(backup_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
         
         # Verificar que el backup se creó correctamente
         if not os.path.exists(backup_path):
@@ -306,16 +314,20 @@ def restore_backup(filename):
                 "error": "Archivo de backup no encontrado"
             }
             
-        # Obtener ruta de la base de datos
-        db_path = get_database_path()
-        
         # Crear backup de seguridad antes de restaurar
         safety_result = create_backup(manual=True)
         if not safety_result["success"]:
             logger.warning("No se pudo crear backup de seguridad antes de restaurar")
         
-        # Restaurar (copiar el backup sobre la base de datos actual)
-        shutil.copy2(backup_path, db_path)
+        # Restaurar con la API de backup de SQLite para respetar el WAL y los bloqueos
+        # de las conexiones abiertas (copiar el archivo dejaría un -wal inconsistente)
+        source = sqlite3.connect(backup_path)
+        target = get_connection()
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
         
         logger.info(f"Backup {filename} restaurado correctamente")
         
@@ -359,6 +371,9 @@ def start_backup_scheduler(interval_hours=24):
         schedule.every(interval_hours).hours.do(lambda: create_backup(manual=False))
         logger.info(f"Backups automáticos programados cada {interval_hours} horas")
         
+        # Programar tareas de mantenimiento de la base de datos (checkpoint del WAL)
+        schedule_maintenance_jobs()
+        
         # Función para ejecutar el programador en un hilo separado
         def run_scheduler():
             global is_running
@@ -0,0 +1,52 @@
+"""
+Tareas periódicas de mantenimiento de la base de datos
+"""
+import schedule
+
+from msad.core.system import logger, get_connection
+from msad.core.retention import run_retention, RUN_AT as RETENTION_RUN_AT
+from db_config import CHECKPOINT_INTERVAL_MINUTES, CHECKPOINT_MODE
+
+def run_wal_checkpoint(mode=CHECKPOINT_MODE):
+    """
+    Ejecuta un checkpoint del WAL para trasladar las páginas al archivo principal
+    
+    Args:
+        mode: Modo de checkpoint (PASSIVE, FULL, RESTART o TRUNCATE)
+    
+    Returns:
+        dict: Resultado del checkpoint
+    """
+    try:
+        conn = get_connection()
+        try:
+            busy, log_pages, checkpointed = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        finally:
+            conn.close()
+        
+        logger.info(f"Checkpoint WAL ({mode}): {checkpointed}/{log_pages} páginas, bloqueado={busy}")
+        return {
+            "success": True,
+            "mode": mode,
+            "busy": busy,
+            "log_pages": log_pages,
+            "checkpointed": checkpointed
+        }
+    except Exception as e:
+        logger.error(f"Error al ejecutar checkpoint WAL: {str(e)}")
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+def schedule_maintenance_jobs():
+    """
+    Registra las tareas de mantenimiento en el programador de MSAD
+    """
+    if CHECKPOINT_INTERVAL_MINUTES > 0:
+        schedule.every(CHECKPOINT_INTERVAL_MINUTES).minutes.do(run_wal_checkpoint)
+        logger.info(f"Checkpoint WAL programado cada {CHECKPOINT_INTERVAL_MINUTES} minutos")
+    
+    # Retención diaria de lecturas, eventos y agregados por minuto, con incremental_vacuum
+    schedule.every().day.at(RETENTION_RUN_AT).do(run_retention)
+    logger.info(f"Retención de datos programada a diario a las {RETENTION_RUN_AT}")
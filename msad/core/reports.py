@@ -6,6 +6,7 @@ import json
 import csv
 import datetime
 from msad.core.system import logger, STORAGE_PATH, execute_query
+from models.partitions import partitions_query, build_union_query
 
 def generate_report(client_id, start_date, end_date, data_type="sensors", format="json"):
     """
@@ -52,32 +53,44 @@ def generate_report(client_id, start_date, end_date, data_type="sensors", format
         tables = {
             "sensors": "sht3x_data",
             "events": "events",
-            "actuators": "actuator_actions"
+            "actuators": "actuators"
         }
         table = tables[data_type]
         
-        # Consultar datos
-        start_timestamp = start_dt.strftime("%Y-%m-%d %H:%M:%S")
-        end_timestamp = end_dt.strftime("%Y-%m-%d %H:%M:%S")
+        # Consultar datos (las marcas de tiempo se guardan en milisegundos desde epoch)
+        start_timestamp = int(start_dt.timestamp() * 1000)
+        end_timestamp = int(end_dt.replace(microsecond=999999).timestamp() * 1000)
+        
+        # Los datos de sensores están en particiones mensuales: solo se consultan las que
+        # se solapan con el rango pedido
+        if data_type == "sensors":
+            registry_query, registry_params = partitions_query()
+            all_partitions = [row['name'] for row in execute_query(registry_query, registry_params) or []]
+            registry_query, registry_params = partitions_query(start_timestamp, end_timestamp)
+            range_partitions = [row['name'] for row in execute_query(registry_query, registry_params) or []]
+        else:
+            all_partitions = range_partitions = [table]
         
         # Primero verificar si hay datos para este cliente en general
-        check_query = f"SELECT COUNT(*) as count FROM {table} WHERE client_id = ?"
-        check_result = execute_query(check_query, (client_id,))
+        if all_partitions:
+            check_query, check_params = build_union_query(all_partitions, "1", "client_id = ?", (client_id,), limit=1)
+            check_result = execute_query(check_query, check_params)
+        else:
+            check_result = []
         
-        if check_result and check_result[0]['count'] == 0:
+        if not check_result:
             logger.warning(f"No se encontraron datos para el cliente {client_id} en la tabla {table}")
             return {"success": False, "error": f"No hay datos registrados para el cliente {client_id}"}
-        else:
-            logger.info(f"Se encontraron {check_result[0]['count']} registros en total para el cliente {client_id}")
-        
-        query = f"""
-        SELECT * FROM {table}
-        WHERE client_id = ? AND timestamp >= ? AND timestamp <= ?
-        ORDER BY timestamp DESC
-        """
         
         logger.info(f"Consultando datos para el cliente {client_id} en el rango {start_date} a {end_date}")
-        data = execute_query(query, (client_id, start_timestamp, end_timestamp))
+        if range_partitions:
+            query, params = build_union_query(
+                range_partitions, "*", "client_id = ? AND timestamp >= ? AND timestamp <= ?",
+                (client_id, start_timestamp, end_timestamp), order_by="timestamp DESC"
+            )
+            data = execute_query(query, params)
+        else:
+            data = []
         
         if data is None:
             logger.error(f"Error al ejecutar la consulta en la tabla {table}")
@@ -98,13 +111,10 @@ def generate_report(client_id, start_date, end_date, data_type="sensors", format
         
         file_path = os.path.join(client_dir, filename)
         
-        # Convertir timestamps a fechas legibles en los datos
+        # Convertir timestamps (milisegundos desde epoch) a fechas legibles en los datos
         for row in data:
-            if 'timestamp' in row:
-                # El timestamp ahora es un string, no necesitamos fromtimestamp
-                # Simplemente lo dejamos como está, ya está en formato legible
-                # row['timestamp'] = datetime.datetime.fromtimestamp(row['timestamp']).isoformat()
-                pass  # Mantenemos el timestamp como está (ya es un string con formato)
+            if isinstance(row.get('timestamp'), int):
+                row['timestamp'] = datetime.datetime.fromtimestamp(row['timestamp'] / 1000).isoformat(timespec='milliseconds')
         
         # Guardar archivo según formato
         if format == "json":
@@ -0,0 +1,349 @@
+"""
+Motor de retención y compactación de datos
+"""
+import os
+import time
+import shutil
+import datetime
+import sqlite3
+import threading
+
+from msad.core.system import logger, get_connection, get_database_path
+from models.partitions import get_partitions_sync, drop_partition_sync
+from models.timestamps import now_ms
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+# Días que se conservan por tabla si el cliente no tiene una política propia.
+# None o 0 = conservar siempre: por defecto no se borra nada hasta que se define una
+# política (PUT /msad/retention/policies). Los agregados de 1 hora no se borran para que
+# las estadísticas de largo plazo sigan disponibles.
+DEFAULT_RETENTION_DAYS = {
+    "sht3x_data": None,
+    "events": None,
+    "sht3x_rollup_1m": None,
+    "sensor_anomalies": None
+}
+
+# Tablas no particionadas: (columna de tiempo, clave para borrar por lotes)
+_PLAIN_TABLES = {
+    "events": ("timestamp", "id"),
+    "sht3x_rollup_1m": ("bucket_ms", "bucket_ms"),
+    "sensor_anomalies": ("timestamp", "id")
+}
+
+# Ritmo de borrado: lotes pequeños con pausas para no bloquear la ingesta MQTT
+BATCH_SIZE = 500           # Filas por transacción
+BATCH_PAUSE = 0.2          # Segundos de pausa entre lotes
+VACUUM_STEP_PAGES = 200    # Páginas liberadas por paso de incremental_vacuum
+MAX_RUN_SECONDS = 300      # Tiempo máximo por ejecución; lo pendiente queda para la siguiente
+RUN_AT = "03:30"           # Hora diaria de ejecución programada
+
+_run_lock = threading.Lock()
+_last_report = None
+
+def get_policies():
+    """
+    Obtiene las políticas de retención (valores por defecto y por cliente)
+
+    Returns:
+        dict: Políticas por defecto y excepciones por cliente
+    """
+    try:
+        conn = get_connection()
+        try:
+            rows = conn.execute(
+                'SELECT client_id, table_name, retention_days FROM retention_policies ORDER BY client_id, table_name'
+            ).fetchall()
+        finally:
+            conn.close()
+
+        return {
+            "success": True,
+            "defaults": DEFAULT_RETENTION_DAYS,
+            "clients": [
+                {"client_id": client_id, "table": table, "retention_days": days}
+                for client_id, table, days in rows
+            ]
+        }
+    except Exception as e:
+        logger.error(f"Error al obtener políticas de retención: {str(e)}")
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+def set_policy(client_id, table, retention_days):
+    """
+    Crea, actualiza o elimina la política de retención de un cliente para una tabla
+
+    Args:
+        client_id: ID del cliente
+        table: Tabla afectada (sht3x_data, events, sht3x_rollup_1m o sensor_anomalies)
+        retention_days: Días a conservar; 0 = conservar siempre; None = volver al valor por defecto
+
+    Returns:
+        dict: Resultado de la operación
+    """
+    if table not in DEFAULT_RETENTION_DAYS:
+        return {
+            "success": False,
+            "error": f"Tabla no válida: {table}. Opciones: {', '.join(DEFAULT_RETENTION_DAYS)}"
+        }
+    if retention_days is not None and int(retention_days) < 0:
+        return {
+            "success": False,
+            "error": "retention_days no puede ser negativo"
+        }
+
+    try:
+        conn = get_connection()
+        try:
+            if retention_days is None:
+                conn.execute('DELETE FROM retention_policies WHERE client_id = ? AND table_name = ?',
+                             (client_id, table))
+            else:
+                conn.execute('''
+                    INSERT INTO retention_policies (client_id, table_name, retention_days) VALUES (?, ?, ?)
+                    ON CONFLICT(client_id, table_name) DO UPDATE SET retention_days = excluded.retention_days
+                ''', (client_id, table, int(retention_days)))
+            conn.commit()
+        finally:
+            conn.close()
+
+        logger.info(f"Política de retención de {client_id}/{table}: {retention_days} días")
+        return {
+            "success": True,
+            "client_id": client_id,
+            "table": table,
+            "retention_days": retention_days
+        }
+    except Exception as e:
+        logger.error(f"Error al guardar política de retención: {str(e)}")
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+def _load_overrides(conn):
+    overrides = {}
+    for client_id, table, days in conn.execute(
+            'SELECT client_id, table_name, retention_days FROM retention_policies'):
+        overrides[(client_id, table)] = days
+    return overrides
+
+def _cutoff(overrides, client_id, table, now):
+    """Marca de tiempo (ms) por debajo de la cual se borran los datos; None = conservar"""
+    days = overrides.get((client_id, table), DEFAULT_RETENTION_DAYS.get(table))
+    if not days:
+        return None
+    return now - int(days) * DAY_MS
+
+def _delete_in_batches(conn, table, time_column, key_column, client_id, cutoff, deadline):
+    """Borra filas anteriores a cutoff en lotes de BATCH_SIZE, cada uno en su transacción"""
+    deleted = 0
+    query = f'''
+        DELETE FROM {table} WHERE client_id = ? AND {key_column} IN (
+            SELECT {key_column} FROM {table} WHERE client_id = ? AND {time_column} < ? LIMIT ?
+        )
+    '''
+    while time.monotonic() < deadline:
+        try:
+            cursor = conn.execute(query, (client_id, client_id, cutoff, BATCH_SIZE))
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            # Base de datos ocupada (ingesta escribiendo): ceder y reintentar
+            conn.rollback()
+            logger.warning(f"Retención en {table} en espera: {str(e)}")
+            time.sleep(BATCH_PAUSE * 5)
+            continue
+        deleted += cursor.rowcount
+        if cursor.rowcount < BATCH_SIZE:
+            break
+        time.sleep(BATCH_PAUSE)
+    return deleted
+
+def _apply_sensor_retention(conn, overrides, now, deadline, report):
+    """Lecturas SHT3x: elimina particiones completas caducadas y borra por lotes el resto"""
+    for name in get_partitions_sync(conn, None, now):
+        if time.monotonic() >= deadline:
+            return
+        start_ms, end_ms = conn.execute(
+            'SELECT start_ms, end_ms FROM sht3x_partitions WHERE name = ?', (name,)
+        ).fetchone()
+        clients = [row[0] for row in conn.execute(f'SELECT DISTINCT client_id FROM {name}')]
+        cutoffs = {client_id: _cutoff(overrides, client_id, "sht3x_data", now) for client_id in clients}
+
+        # Toda la partición está fuera de la retención de todos sus clientes: DROP TABLE
+        if clients and all(cutoff is not None and cutoff >= end_ms for cutoff in cutoffs.values()):
+            rows = conn.execute(f'SELECT COUNT(*) FROM {name}').fetchone()[0]
+            drop_partition_sync(conn, name)
+            conn.commit()
+            report["partitions_dropped"].append(name)
+            report["deleted"]["sht3x_data"] += rows
+            logger.info(f"Retención: partición {name} eliminada ({rows} lecturas)")
+            time.sleep(BATCH_PAUSE)
+            continue
+
+        for client_id, cutoff in cutoffs.items():
+            if cutoff is not None and cutoff > start_ms:
+                report["deleted"]["sht3x_data"] += _delete_in_batches(
+                    conn, name, "timestamp", "id", client_id, cutoff, deadline
+                )
+
+def _incremental_vacuum(conn, deadline):
+    """Devuelve al sistema las páginas libres por pasos cortos"""
+    while time.monotonic() < deadline:
+        if conn.execute('PRAGMA freelist_count').fetchone()[0] == 0:
+            break
+        conn.execute(f'PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})').fetchall()
+        time.sleep(BATCH_PAUSE)
+    # Con WAL el archivo principal solo se reduce al hacer checkpoint
+    conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+
+def run_retention():
+    """
+    Aplica las políticas de retención y compacta la base de datos
+
+    Returns:
+        dict: Informe con filas borradas, particiones eliminadas y espacio recuperado
+    """
+    global _last_report
+
+    if not _run_lock.acquire(blocking=False):
+        return {
+            "success": False,
+            "error": "La retención ya está en ejecución"
+        }
+
+    started = time.monotonic()
+    deadline = started + MAX_RUN_SECONDS
+    db_path = get_database_path()
+    try:
+        conn = get_connection()
+        try:
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+            pages_before = conn.execute('PRAGMA page_count').fetchone()[0]
+            file_before = os.path.getsize(db_path)
+
+            report = {
+                "deleted": {table: 0 for table in DEFAULT_RETENTION_DAYS},
+                "partitions_dropped": []
+            }
+            overrides = _load_overrides(conn)
+            now = now_ms()
+
+            _apply_sensor_retention(conn, overrides, now, deadline, report)
+
+            for table, (time_column, key_column) in _PLAIN_TABLES.items():
+                clients = [row[0] for row in conn.execute(f'SELECT DISTINCT client_id FROM {table}')]
+                for client_id in clients:
+                    cutoff = _cutoff(overrides, client_id, table, now)
+                    if cutoff is not None:
+                        report["deleted"][table] += _delete_in_batches(
+                            conn, table, time_column, key_column, client_id, cutoff, deadline
+                        )
+
+            free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+            if auto_vacuum == 2:  # INCREMENTAL
+                _incremental_vacuum(conn, deadline)
+
+            pages_after = conn.execute('PRAGMA page_count').fetchone()[0]
+        finally:
+            conn.close()
+
+        report.update({
+            "success": True,
+            "finished_at": datetime.datetime.now().isoformat(),
+            "duration_seconds": round(time.monotonic() - started, 2),
+            "complete": time.monotonic() < deadline,
+            "auto_vacuum": {0: "NONE", 1: "FULL", 2: "INCREMENTAL"}.get(auto_vacuum, auto_vacuum),
+            "free_pages_before_vacuum": free_pages,
+            "reclaimed_bytes": (pages_before - pages_after) * page_size,
+            "file_size_before": file_before,
+            "file_size_after": os.path.getsize(db_path)
+        })
+        _last_report = report
+        logger.info(f"Retención completada: {report['deleted']}, particiones eliminadas "
+                    f"{report['partitions_dropped']}, {report['reclaimed_bytes']} bytes recuperados")
+        return report
+    except Exception as e:
+        logger.error(f"Error al aplicar la retención: {str(e)}")
+        return {
+            "success": False,
+            "error": str(e)
+        }
+    finally:
+        _run_lock.release()
+
+def enable_incremental_vacuum():
+    """
+    Activa auto_vacuum=INCREMENTAL en una base existente con un VACUUM completo.
+    Es una acción de mantenimiento explícita: bloquea la base mientras dura y necesita
+    tanto espacio libre como ocupa el archivo.
+
+    Returns:
+        dict: Resultado de la operación
+    """
+    if not _run_lock.acquire(blocking=False):
+        return {
+            "success": False,
+            "error": "La retención ya está en ejecución"
+        }
+    try:
+        db_path = get_database_path()
+        conn = get_connection()
+        try:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+                return {
+                    "success": True,
+                    "auto_vacuum": "INCREMENTAL",
+                    "vacuumed": False
+                }
+            file_size = os.path.getsize(db_path)
+            free_space = shutil.disk_usage(os.path.dirname(os.path.abspath(db_path))).free
+            if free_space < file_size:
+                return {
+                    "success": False,
+                    "error": f"Espacio libre insuficiente para VACUUM: {free_space} bytes libres, {file_size} necesarios"
+                }
+            started = time.monotonic()
+            logger.info("Activando auto_vacuum=INCREMENTAL con VACUUM completo...")
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+            auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        finally:
+            conn.close()
+
+        logger.info(f"VACUUM completado en {time.monotonic() - started:.1f} s")
+        return {
+            "success": auto_vacuum == 2,
+            "auto_vacuum": {0: "NONE", 1: "FULL", 2: "INCREMENTAL"}.get(auto_vacuum, auto_vacuum),
+            "vacuumed": True,
+            "duration_seconds": round(time.monotonic() - started, 2),
+            "file_size_before": file_size,
+            "file_size_after": os.path.getsize(db_path)
+        }
+    except Exception as e:
+        logger.error(f"Error al activar auto_vacuum incremental: {str(e)}")
+        return {
+            "success": False,
+            "error": str(e)
+        }
+    finally:
+        _run_lock.release()
+
+def get_retention_status():
+    """
+    Obtiene el último informe de retención y la configuración vigente
+
+    Returns:
+        dict: Estado del motor de retención
+    """
+    return {
+        "success": True,
+        "running": _run_lock.locked(),
+        "schedule": RUN_AT,
+        "last_report": _last_report
+    }
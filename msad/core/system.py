@@ -6,6 +6,12 @@ import logging
 import datetime
 import sqlite3
 
+from db_config import apply_storage_profile
+from models.partitions import insert_readings_sync
+from models.rollups import apply_rollups_sync
+from models.sketches import apply_sketches_sync
+from models.compliance import apply_compliance_sync
+
 # Configuración básica
 STORAGE_PATH = "/mnt/storage/msad"
 if os.name == 'nt':  # Windows (para desarrollo)
@@ -33,6 +39,12 @@ def get_database_path():
     else:  # Linux
         return "/home/stevpi/Desktop/raspServer/sensor_data.db"
 
+def get_connection():
+    """Abrir una conexión sqlite3 con el perfil de almacenamiento aplicado (WAL, busy_timeout...)"""
+    conn = sqlite3.connect(get_database_path())
+    apply_storage_profile(conn)
+    return conn
+
 def ensure_directories():
     """Crear estructura de directorios necesaria"""
     # Directorio base
@@ -128,7 +140,7 @@ def execute_query(query, params=(), fetchall=True):
         logger.info(f"Conectando a base de datos: {db_path}")
         logger.info(f"Ejecutando consulta: {query}")
         
-        conn = sqlite3.connect(db_path)
+        conn = get_connection()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -169,18 +181,6 @@ def insert_test_data(client_id="mushroom1", count=10):
     try:
         logger.info(f"Insertando {count} registros de prueba para el cliente {client_id}")
         
-        # Crear tabla si no existe
-        create_table_query = """
-        CREATE TABLE IF NOT EXISTS sht3x_data (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            client_id TEXT,
-            timestamp TEXT,
-            temperature REAL,
-            humidity REAL
-        )
-        """
-        execute_query(create_table_query, fetchall=False)
-        
         # Generar datos de prueba
         current_time = datetime.datetime.now()
         data_to_insert = []
@@ -189,7 +189,7 @@ def insert_test_data(client_id="mushroom1", count=10):
             # Generar timestamp para los últimos 30 días
             random_days = i * 3  # Espaciados cada 3 días
             date_time = current_time - datetime.timedelta(days=random_days)
-            timestamp = date_time.strftime("%Y-%m-%d %H:%M:%S")
+            timestamp = int(date_time.timestamp() * 1000)  # Milisegundos desde epoch
             
             # Datos aleatorios realistas
             temperature = 20 + (i % 10)  # Entre 20 y 30 grados
@@ -197,17 +197,14 @@ def insert_test_data(client_id="mushroom1", count=10):
             
             data_to_insert.append((client_id, timestamp, temperature, humidity))
         
-        # Insertar datos
-        insert_query = """
-        INSERT INTO sht3x_data (client_id, timestamp, temperature, humidity)
-        VALUES (?, ?, ?, ?)
-        """
-        
-        conn = sqlite3.connect(get_database_path())
-        cursor = conn.cursor()
+        # Insertar datos en la partición mensual correspondiente a cada registro
+        conn = get_connection()
         
         try:
-            cursor.executemany(insert_query, data_to_insert)
+            insert_readings_sync(conn, data_to_insert)
+            apply_rollups_sync(conn, data_to_insert)
+            apply_sketches_sync(conn, data_to_insert)
+            apply_compliance_sync(conn, data_to_insert)
             conn.commit()
             logger.info(f"Se insertaron {count} registros de prueba correctamente")
             return {
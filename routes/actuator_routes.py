@@ -2,6 +2,8 @@ from flask import Blueprint, request, jsonify
 from mqtt_client import publish_message
 from models.actuator import save_actuator_state, update_actuator_state, get_all_actuators, get_actuator_by_name
 from models.client import client_exists
+from models.actuator_controller import actuator_controller
+from models.timestamps import serialize_rows
 
 actuator_bp = Blueprint('actuator_bp', __name__)
 
@@ -89,7 +91,7 @@ async def get_actuators(client_id):
         return jsonify({"error": "Cliente no encontrado"}), 404
         
     data = await get_all_actuators(client_id)
-    return jsonify([dict(row) for row in data])
+    return jsonify(serialize_rows(data))
 
 # API para agregar un nuevo actuador
 @actuator_bp.route('/clients/<client_id>/Actuator', methods=['POST'])
@@ -121,3 +123,11 @@ async def update_actuator(client_id, id):
         return jsonify({"message": "Estado del actuador actualizado correctamente"}), 200
     else:
         return jsonify({"error": "Datos incompletos"}), 400
+
+# API para obtener el estado del controlador automatico (estado en memoria y ultimo cambio)
+@actuator_bp.route('/clients/<client_id>/Actuator/controller', methods=['GET'])
+async def get_actuator_controller(client_id):
+    if not await client_exists(client_id):
+        return jsonify({"error": "Cliente no encontrado"}), 404
+
+    return jsonify(actuator_controller.snapshot(client_id))
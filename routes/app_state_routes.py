@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from models.app_state import get_app_state, update_app_state
 from models.client import client_exists
+from models.node_config import APP_MODES
 
 app_state_bp = Blueprint('app_state_bp', __name__)
 
@@ -30,7 +31,7 @@ async def update_app_state_endpoint(client_id):
             
         data = request.json
         mode = data.get('mode')
-        if mode in ['manual', 'automatico']:
+        if mode in APP_MODES:
             await update_app_state(client_id, mode)
             return jsonify({"message": "Estado de la aplicacion actualizado exitosamente"}), 200
         else:
@@ -1,5 +1,12 @@
 from flask import Blueprint, request, jsonify
 from models.client import get_all_clients, get_client_by_id, register_client, update_client_status, enable_client, update_client_info, delete_client
+from models.recent_readings import recent_readings
+from models.stream_stats import streaming_stats
+from models.stats_cache import stats_cache
+from models.anomalies import anomaly_detector
+from models.actuator_controller import actuator_controller
+from command_acks import command_tracker
+from models.node_config import clear_node_config
 
 client_bp = Blueprint('client_bp', __name__)
 
@@ -94,6 +101,13 @@ async def remove_client(client_id):
             
         # Eliminar cliente y todos los datos relacionados
         await delete_client(client_id)
+        recent_readings.forget(client_id)
+        streaming_stats.forget(client_id)
+        stats_cache.forget(client_id)
+        anomaly_detector.forget(client_id)
+        actuator_controller.forget(client_id)
+        command_tracker.forget(client_id)
+        clear_node_config(client_id)
         return jsonify({"message": "Cliente y todos sus datos eliminados correctamente"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
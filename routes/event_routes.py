@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
-from models.event import save_event, get_all_events, update_event, get_events_by_topic, delete_event
+from models.event import save_event, get_all_events, get_events_page, update_event, get_events_by_topic, delete_event
 from models.client import client_exists
+from models.timestamps import serialize_rows
 
 event_bp = Blueprint('event_bp', __name__)
 
@@ -11,10 +12,18 @@ async def get_events(client_id):
     if not await client_exists(client_id):
         return jsonify({"error": "Cliente no encontrado"}), 404
         
-    page = int(request.args.get('page', 1))
     page_size = int(request.args.get('pageSize', 10))
+    # Paginacion por cursor: ?cursor= (vacio para la primera pagina) y luego next_cursor
+    if 'cursor' in request.args:
+        try:
+            data, next_cursor = await get_events_page(client_id, page_size, request.args['cursor'])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"data": serialize_rows(data), "next_cursor": next_cursor})
+    # Modo compatible por numero de pagina
+    page = int(request.args.get('page', 1))
     data = await get_all_events(client_id, page, page_size)
-    return jsonify([dict(row) for row in data])
+    return jsonify(serialize_rows(data))
 
 # API para insertar eventos en la base de datos
 @event_bp.route('/clients/<client_id>/Event', methods=['POST'])
@@ -42,9 +51,15 @@ async def get_events_by_topic_endpoint(client_id):
     topic = request.args.get('topic')
     page = int(request.args.get('page', 1))
     page_size = int(request.args.get('pageSize', 10))
+    if topic and 'cursor' in request.args:
+        try:
+            data, next_cursor = await get_events_page(client_id, page_size, request.args['cursor'], topic)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"data": serialize_rows(data), "next_cursor": next_cursor})
     if topic:
         data = await get_events_by_topic(client_id, topic, page, page_size)
-        return jsonify([dict(row) for row in data])
+        return jsonify(serialize_rows(data))
     else:
         return jsonify({"error": "El tema es requerido"}), 400
 
@@ -0,0 +1,53 @@
+from flask import Blueprint, jsonify
+from ingestion import get_ingest_stats
+from models.db_pool import get_pool_stats
+from models.live_stream import get_stream_stats
+from models.stats_cache import get_stats_cache_stats
+from models.anomalies import get_anomaly_stats
+from models.actuator_controller import get_controller_stats
+from mqtt_outbox import get_outbox_stats
+from command_acks import get_command_stats
+
+# Crear un Blueprint para las metricas internas del servidor
+metrics_bp = Blueprint('metrics_bp', __name__)
+
+# API para obtener el estado de la ingesta de lecturas (profundidad de cola, descartes, latencia)
+@metrics_bp.route('/metrics/ingest', methods=['GET'])
+def get_ingest_metrics():
+    return jsonify(get_ingest_stats())
+
+# API para obtener el estado del pool de conexiones a la base de datos
+@metrics_bp.route('/metrics/db', methods=['GET'])
+def get_db_metrics():
+    return jsonify(get_pool_stats())
+
+# API para obtener el estado del stream en vivo (suscriptores, mensajes, expulsiones)
+@metrics_bp.route('/metrics/stream', methods=['GET'])
+def get_stream_metrics():
+    return jsonify(get_stream_stats())
+
+# API para obtener los contadores de la cache de estadisticas (aciertos, fallos, invalidaciones)
+@metrics_bp.route('/metrics/stats-cache', methods=['GET'])
+def get_stats_cache_metrics():
+    return jsonify(get_stats_cache_stats())
+
+# API para obtener los contadores del detector de anomalias (evaluadas, marcadas, cambios de nivel)
+@metrics_bp.route('/metrics/anomalies', methods=['GET'])
+def get_anomaly_metrics():
+    return jsonify(get_anomaly_stats())
+
+# API para obtener los contadores del controlador de actuadores (evaluaciones, transiciones, esperas)
+@metrics_bp.route('/metrics/actuators', methods=['GET'])
+def get_actuator_metrics():
+    return jsonify(get_controller_stats())
+
+# API para obtener el estado de la bandeja de salida MQTT (pendientes, reintentos, latencia de entrega)
+@metrics_bp.route('/metrics/outbox', methods=['GET'])
+def get_outbox_metrics():
+    return jsonify(get_outbox_stats())
+
+# API para obtener el estado de las confirmaciones de comandos (pendientes, reintentos,
+# fallidos) y el histograma de latencia comando -> confirmacion por cliente
+@metrics_bp.route('/metrics/commands', methods=['GET'])
+def get_command_metrics():
+    return jsonify(get_command_stats())
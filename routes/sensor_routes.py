@@ -1,7 +1,11 @@
 from flask import Blueprint, request, jsonify
 import asyncio
-from models.sensor_data import get_all_sht3x_data, get_ideal_params, update_ideal_params
+from models.sensor_data import get_all_sht3x_data, get_sht3x_data_page, get_sht3x_range_array, get_ideal_params, update_ideal_params
 from models.client import client_exists
+from models.timestamps import serialize_rows, serialize_row, ms_to_iso, parse_range
+from models.downsampling import lttb_indices
+from models.recent_readings import recent_readings, RECENT_BUFFER_SIZE
+from models.anomalies import get_anomalies_page, METRICS
 from mqtt_client import publish_message
 
 # Crear un Blueprint para las rutas de sensores
@@ -14,10 +18,104 @@ async def get_sht3x_sensor_data(client_id):
     if not await client_exists(client_id):
         return jsonify({"error": "Cliente no encontrado"}), 404
         
-    page = int(request.args.get('page', 1))
     page_size = int(request.args.get('pageSize', 10))
+    # Paginacion por cursor: ?cursor= (vacio para la primera pagina) y luego next_cursor
+    if 'cursor' in request.args:
+        try:
+            data, next_cursor = await get_sht3x_data_page(client_id, page_size, request.args['cursor'])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"data": serialize_rows(data), "next_cursor": next_cursor})
+    # Modo compatible por numero de pagina
+    page = int(request.args.get('page', 1))
     data = await get_all_sht3x_data(client_id, page, page_size)
-    return jsonify([dict(row) for row in data])
+    return jsonify(serialize_rows(data))
+
+# Ultimas n lecturas desde memoria; solo se consulta SQLite si el buffer no tiene suficientes
+async def get_recent_readings(client_id, n):
+    readings = recent_readings.latest(client_id, n)
+    if readings is not None:
+        return readings
+    if recent_readings.count(client_id) == 0:
+        # Tras un reinicio el buffer esta vacio: se rellena con lo leido
+        rows = await get_all_sht3x_data(client_id, 1, max(n, RECENT_BUFFER_SIZE))
+        recent_readings.seed(client_id, rows)
+        return rows[:n]
+    return await get_all_sht3x_data(client_id, 1, n)
+
+# API para obtener las ultimas N lecturas (por defecto 10)
+@sensor_bp.route('/clients/<client_id>/Sht3xSensor/recent', methods=['GET'])
+async def get_sht3x_recent(client_id):
+    if not await client_exists(client_id):
+        return jsonify({"error": "Cliente no encontrado"}), 404
+
+    n = max(int(request.args.get('n', 10)), 1)
+    return jsonify(serialize_rows(await get_recent_readings(client_id, n)))
+
+# API para obtener la lectura mas reciente
+@sensor_bp.route('/clients/<client_id>/Sht3xSensor/latest', methods=['GET'])
+async def get_sht3x_latest(client_id):
+    if not await client_exists(client_id):
+        return jsonify({"error": "Cliente no encontrado"}), 404
+
+    readings = await get_recent_readings(client_id, 1)
+    if not readings:
+        return jsonify({"message": "Sin lecturas"}), 404
+    return jsonify(serialize_row(readings[0]))
+
+# API para obtener las lecturas marcadas como anomalas, paginadas por cursor
+# (?cursor= y luego next_cursor), opcionalmente filtradas con ?metric=temperature|humidity
+@sensor_bp.route('/clients/<client_id>/Sht3xSensor/anomalies', methods=['GET'])
+async def get_sht3x_anomalies(client_id):
+    if not await client_exists(client_id):
+        return jsonify({"error": "Cliente no encontrado"}), 404
+
+    page_size = int(request.args.get('pageSize', 50))
+    metric = request.args.get('metric')
+    if metric is not None and metric not in METRICS:
+        return jsonify({"error": f"metric no valida. Opciones: {', '.join(METRICS)}"}), 400
+    try:
+        data, next_cursor = await get_anomalies_page(client_id, page_size, request.args.get('cursor'), metric)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"data": serialize_rows(data), "next_cursor": next_cursor})
+
+# Limites de puntos por serie en /Sht3xSensor/range
+DEFAULT_MAX_POINTS = 500
+MAX_POINTS_LIMIT = 5000
+
+# API para obtener las lecturas de un rango reducidas con LTTB a max_points puntos por serie.
+# Rango con start/end (ISO o milisegundos) o con days (por defecto 1 dia hasta ahora).
+@sensor_bp.route('/clients/<client_id>/Sht3xSensor/range', methods=['GET'])
+async def get_sht3x_range(client_id):
+    if not await client_exists(client_id):
+        return jsonify({"error": "Cliente no encontrado"}), 404
+
+    try:
+        start_ms, end_ms = parse_range(request.args, 1)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        max_points = min(max(int(request.args.get('max_points', DEFAULT_MAX_POINTS)), 3), MAX_POINTS_LIMIT)
+    except ValueError:
+        return jsonify({"error": "Parametro no valido: max_points debe ser un entero"}), 400
+
+    data = await get_sht3x_range_array(client_id, start_ms, end_ms)
+    timestamps = data[:, 0]
+    response = {
+        "start": ms_to_iso(start_ms),
+        "end": ms_to_iso(end_ms),
+        "total_points": int(len(data)),
+        "max_points": max_points
+    }
+    # Cada variable se reduce por separado para conservar sus propios picos
+    for column, name in ((1, "temperature"), (2, "humidity")):
+        indices = lttb_indices(timestamps - (timestamps[0] if len(timestamps) else 0), data[:, column], max_points)
+        response[name] = {
+            "timestamp": [ms_to_iso(int(ms)) for ms in timestamps[indices]],
+            "value": data[indices, column].tolist()
+        }
+    return jsonify(response)
 
 # API para obtener datos de sensor sht3x desde la base de datos sin automatización
 @sensor_bp.route('/clients/<client_id>/Sht3xSensorManual', methods=['GET'])
@@ -26,10 +124,18 @@ async def get_sht3x_sensor_data_manual(client_id):
     if not await client_exists(client_id):
         return jsonify({"error": "Cliente no encontrado"}), 404
         
-    page = int(request.args.get('page', 1))
     page_size = int(request.args.get('pageSize', 10))
+    # Paginacion por cursor: ?cursor= (vacio para la primera pagina) y luego next_cursor
+    if 'cursor' in request.args:
+        try:
+            data, next_cursor = await get_sht3x_data_page(client_id, page_size, request.args['cursor'])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"data": serialize_rows(data), "next_cursor": next_cursor})
+    # Modo compatible por numero de pagina
+    page = int(request.args.get('page', 1))
     data = await get_all_sht3x_data(client_id, page, page_size)
-    return jsonify([dict(row) for row in data])
+    return jsonify(serialize_rows(data))
 
 # API para obtener parametros ideales
 @sensor_bp.route('/clients/<client_id>/IdealParams/<param_type>', methods=['GET'])
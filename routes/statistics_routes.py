@@ -1,6 +1,13 @@
 from flask import Blueprint, request, jsonify
 import asyncio
-from models.statistics import get_sht3x_statistics
+from models.statistics import (
+    get_sht3x_statistics, get_sht3x_summary, get_sht3x_series, get_fleet_statistics, get_sht3x_compliance,
+    get_sht3x_heatmap,
+    SERIES_RESOLUTIONS, MAX_SERIES_POINTS, default_resolution
+)
+from models.timestamps import parse_range
+from models.stats_cache import stats_cache
+from models.sketches import DEFAULT_PERCENTILES
 from models.client import client_exists
 
 # Crear un Blueprint para las rutas de estadisticas
@@ -14,10 +21,85 @@ async def get_dashboard_statistics(client_id):
         return jsonify({"error": "Cliente no encontrado"}), 404
         
     days = int(request.args.get('days', 7))  # Periodo predeterminado: 7 dias
-    # Obtener estadísticas de temperatura y humedad
-    sht3x_stats = await get_sht3x_statistics(client_id, days)
+    # Obtener estadísticas de temperatura y humedad (desde la cache si estan al dia)
+    sht3x_stats = await stats_cache.get_or_compute(
+        (client_id, 'dashboard', days), lambda: get_sht3x_statistics(client_id, days)
+    )
     # Organizar los resultados
     dashboard_data = {
         "sht3x_stats": sht3x_stats
     }
-    return jsonify(dashboard_data)
\ No newline at end of file
+    return jsonify(dashboard_data)
+
+# API para obtener un resumen rapido (count, media, min, max, desviacion) desde los agregados.
+# Con ?percentiles=5,50,95 (o ?percentiles sin valor para p5/p50/p95) incluye percentiles
+# aproximados combinando los histogramas diarios.
+@statistics_bp.route('/clients/<client_id>/statistics/summary', methods=['GET'])
+async def get_summary_statistics(client_id):
+    if not await client_exists(client_id):
+        return jsonify({"error": "Cliente no encontrado"}), 404
+
+    days = int(request.args.get('days', 7))
+    percentiles = None
+    if 'percentiles' in request.args:
+        raw = request.args['percentiles']
+        try:
+            percentiles = [float(q) for q in raw.split(',')] if raw else list(DEFAULT_PERCENTILES)
+        except ValueError:
+            return jsonify({"error": "percentiles debe ser una lista de numeros separados por comas"}), 400
+        if not all(0 <= q <= 100 for q in percentiles):
+            return jsonify({"error": "Los percentiles deben estar entre 0 y 100"}), 400
+    return jsonify({"sht3x_summary": await get_sht3x_summary(client_id, days, percentiles)})
+
+# API para obtener una serie agregada por minuto, hora o dia para graficas.
+# Rango con start/end (ISO o milisegundos) o con days (por defecto 1 dia hasta ahora).
+@statistics_bp.route('/clients/<client_id>/statistics/series', methods=['GET'])
+async def get_series_statistics(client_id):
+    if not await client_exists(client_id):
+        return jsonify({"error": "Cliente no encontrado"}), 404
+
+    try:
+        start_ms, end_ms = parse_range(request.args, 1)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    resolution = request.args.get('resolution') or default_resolution(start_ms, end_ms)
+    if resolution not in SERIES_RESOLUTIONS:
+        return jsonify({"error": f"Resolucion no valida. Opciones: {', '.join(SERIES_RESOLUTIONS)}"}), 400
+    step_ms = {"minute": 60000, "hour": 3600000, "day": 86400000}[resolution]
+    if (end_ms - start_ms) / step_ms > MAX_SERIES_POINTS:
+        return jsonify({"error": f"El rango supera {MAX_SERIES_POINTS} puntos; use una resolucion mayor"}), 400
+
+    return jsonify(await get_sht3x_series(client_id, start_ms, end_ms, resolution))
+
+# API para comparar todos los clientes (salas) en una sola peticion
+@statistics_bp.route('/statistics/fleet', methods=['GET'])
+async def get_fleet_overview():
+    days = int(request.args.get('days', 7))
+    return jsonify(await get_fleet_statistics(days))
+
+# API para obtener el porcentaje de tiempo dentro de los parametros ideales.
+# Rango con start/end (ISO o milisegundos) o con days (por defecto 7 dias hasta ahora).
+@statistics_bp.route('/clients/<client_id>/statistics/compliance', methods=['GET'])
+async def get_compliance_statistics(client_id):
+    if not await client_exists(client_id):
+        return jsonify({"error": "Cliente no encontrado"}), 404
+
+    try:
+        start_ms, end_ms = parse_range(request.args, 7)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(await get_sht3x_compliance(client_id, start_ms, end_ms))
+
+# API para obtener el mapa de calor dia de la semana x hora (media de temperatura y humedad).
+# Rango con start/end (ISO o milisegundos) o con days (por defecto 30 dias hasta ahora).
+@statistics_bp.route('/clients/<client_id>/statistics/heatmap', methods=['GET'])
+async def get_heatmap_statistics(client_id):
+    if not await client_exists(client_id):
+        return jsonify({"error": "Cliente no encontrado"}), 404
+
+    try:
+        start_ms, end_ms = parse_range(request.args, 30)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(await get_sht3x_heatmap(client_id, start_ms, end_ms))
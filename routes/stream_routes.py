@@ -0,0 +1,31 @@
+from flask import Blueprint, Response, jsonify
+from models.client import client_exists
+from models.live_stream import live_broker, format_frame
+from models.recent_readings import recent_readings
+
+# Crear un Blueprint para el stream en vivo (Server-Sent Events)
+stream_bp = Blueprint('stream_bp', __name__)
+
+# API para recibir en vivo lecturas ('reading'), cambios de actuadores ('actuator') y eventos ('event')
+@stream_bp.route('/clients/<client_id>/stream', methods=['GET'])
+async def get_client_stream(client_id):
+    # Verificar que el cliente existe
+    if not await client_exists(client_id):
+        return jsonify({"error": "Cliente no encontrado"}), 404
+
+    subscriber = live_broker.subscribe(client_id)
+    if subscriber is None:
+        return jsonify({"error": "Demasiadas conexiones al stream de este cliente"}), 503
+
+    # La ultima lectura se envia al conectar, desde memoria
+    latest = recent_readings.latest(client_id, 1)
+    initial = [format_frame('reading', latest[0])] if latest else []
+
+    return Response(
+        live_broker.stream(subscriber, initial),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Evitar que un proxy acumule las tramas
+        }
+    )